@@ -79,6 +79,8 @@ INSTALLED_APPS = [
 # Middleware
 # ===========================
 MIDDLEWARE = [
+    # primeiro: mede a requisição inteira (core.medicao)
+    "core.middleware.MedicaoMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -91,12 +93,22 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "arutourism.urls"
 
+# Produção: templates compilados uma vez por processo (carregador em cache,
+# aquecido no boot pelo wsgi.py — core.templates_prontos). Em DEBUG, relidos
+# do disco a cada requisição.
+_TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "core" / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            "loaders": _TEMPLATE_LOADERS if DEBUG else [
+                ("django.template.loaders.cached.Loader", _TEMPLATE_LOADERS),
+            ],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -120,6 +132,53 @@ DATABASES = {
     }
 }
 
+# ===========================
+# Cache (locmem em dev; CACHE_URL compartilhado em prod, ex.: redis://...)
+# ===========================
+# Em produção CACHE_URL é obrigatório: as invalidações (páginas, facetas,
+# mapa, favoritos) incrementam chaves de versão neste cache, e o locmem é
+# por processo — com mais de um worker do gunicorn (WEB_CONCURRENCY), os
+# outros continuariam servindo dado velho
+CACHE_COMPARTILHADO = bool(env.str("CACHE_URL", default=""))
+CACHES = {
+    "default": env.cache_url("CACHE_URL", default="locmemcache://arutourism"),
+}
+
+# Páginas inteiras (home, listagem, detalhe) para visitantes anônimos; a
+# invalidação é por signals (core.cache_paginas), o timeout só limpa o cache.
+# Desligado por padrão sem cache compartilhado (ver acima)
+CACHE_PAGINAS = env.bool("CACHE_PAGINAS", default=CACHE_COMPARTILHADO)
+CACHE_PAGINAS_TIMEOUT = env.int("CACHE_PAGINAS_TIMEOUT", default=60 * 60 * 24)
+
+# ===========================
+# Medição por requisição (core.medicao)
+# ===========================
+# Server-Timing (consultas, banco, templates, view) para todos; sem isso,
+# só para staff. A linha de log por requisição sai sempre (logger core.medicao)
+SERVER_TIMING = env.bool("SERVER_TIMING", default=DEBUG)
+
+# ===========================
+# Importação de planilhas (fila em segundo plano)
+# ===========================
+# thread: pool no próprio processo web | worker: só enfileira (manage.py run_import_worker)
+# sincrono: processa dentro da requisição
+IMPORTACAO_EXECUTOR = env.str("IMPORTACAO_EXECUTOR", default="thread")
+IMPORTACAO_THREADS = env.int("IMPORTACAO_THREADS", default=1)
+# planilhas aguardando o job no disco local; com o worker em outra máquina ou
+# contêiner, este diretório precisa ser compartilhado com o processo web
+IMPORTACAO_ROOT = env.str("IMPORTACAO_ROOT", default=str(BASE_DIR / "importacoes"))
+# "processando" há mais que isso = processo morreu no meio; o job volta para a fila
+IMPORTACAO_TRAVADO_MINUTOS = env.int("IMPORTACAO_TRAVADO_MINUTOS", default=60)
+
+# Imagens da galeria: gravadas num diretório local e processadas fora da requisição
+# (orientação, metadados, limites, recompressão e envio ao storage de mídia).
+# thread: pool no próprio processo web | sincrono: processa dentro da requisição
+IMAGENS_EXECUTOR = env.str("IMAGENS_EXECUTOR", default="thread")
+IMAGENS_THREADS = env.int("IMAGENS_THREADS", default=2)
+IMAGENS_STAGING_ROOT = env.str("IMAGENS_STAGING_ROOT", default=str(BASE_DIR / "uploads_pendentes"))
+IMAGEM_MAX_PIXELS = env.int("IMAGEM_MAX_PIXELS", default=50_000_000)
+IMAGEM_MAX_LADO = env.int("IMAGEM_MAX_LADO", default=2560)
+
 # ===========================
 # Password validators
 # ===========================
@@ -259,6 +318,11 @@ LOGGING = {
             "level": "ERROR",
             "propagate": False,
         },
+        "core.medicao": {  # uma linha por requisição: rota, consultas e tempos
+            "handlers": ["console"],
+            "level": env.str("MEDICAO_LOG_LEVEL", default="WARNING" if TESTING else "INFO"),
+            "propagate": False,
+        },
     },
 }
 
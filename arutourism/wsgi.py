@@ -3,4 +3,18 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'arutourism.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# templates compilados e 404/500 prontos antes da primeira requisição
+# (core.templates_prontos, core.paginas_prontas); importações que ficaram no
+# meio num processo anterior voltam para a fila (core.fila_importacao)
+from django.db import DatabaseError  # noqa: E402
+
+from core import fila_importacao, paginas_prontas, templates_prontos  # noqa: E402
+
+templates_prontos.aquecer()
+paginas_prontas.preparar_erros()
+try:
+    fila_importacao.retomar()
+except DatabaseError:  # banco ainda sem as migrações: não impede o boot
+    fila_importacao.logger.warning("Fila de importação não retomada no boot", exc_info=True)
\ No newline at end of file
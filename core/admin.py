@@ -2,7 +2,7 @@ from django.contrib import admin, messages
 from django.template.response import TemplateResponse
 from django.utils.html import format_html 
 
-from .models import Tag, Empresa, PerfilUsuario, ImagemEmpresa, Avaliacao 
+from .models import Tag, Empresa, PerfilUsuario, ImagemEmpresa, Avaliacao, ImportacaoJob, UploadImagem
 
 @admin.register(PerfilUsuario)
 class PerfilUsuarioAdmin(admin.ModelAdmin):
@@ -45,6 +45,22 @@ class AvaliacaoAdmin(admin.ModelAdmin):
     def comentario_curto(self, obj):
         return (obj.comentario[:50] + '...') if len(obj.comentario or '') > 50 else obj.comentario
 
+@admin.register(ImportacaoJob)
+class ImportacaoJobAdmin(admin.ModelAdmin):
+    list_display = ('nome_arquivo', 'user', 'status', 'linhas_processadas', 'criados', 'atualizados', 'erros', 'criado_em')
+    list_filter = ('status',)
+    search_fields = ('nome_arquivo', 'user__username')
+    list_select_related = ('user',)
+    readonly_fields = [f.name for f in ImportacaoJob._meta.fields]
+
+@admin.register(UploadImagem)
+class UploadImagemAdmin(admin.ModelAdmin):
+    list_display = ('nome_arquivo', 'empresa', 'user', 'status', 'criado_em', 'concluido_em')
+    list_filter = ('status',)
+    search_fields = ('nome_arquivo', 'empresa__nome')
+    list_select_related = ('empresa', 'user')
+    readonly_fields = [f.name for f in UploadImagem._meta.fields]
+
 class ImagemEmpresaInline(admin.TabularInline): 
     model = ImagemEmpresa
     extra = 1 
@@ -0,0 +1,162 @@
+# core/api.py
+"""
+API de leitura do catálogo (``/api/v1/...``) para o app do quiosque e o PWA.
+
+As respostas são montadas direto de linhas ``.values()`` — sem instanciar
+models nem renderizar templates — e só com os campos pedidos em
+``?fields=`` (sparse fieldsets). Campos que vêm de outras tabelas (``tags``,
+``capa``) custam uma consulta extra por página, e só quando pedidos.
+
+``CAMPOS`` é o contrato público: nome na API -> colunas de Empresa que ele lê.
+Mudar o significado de um campo existente pede uma ``/api/v2``.
+"""
+from __future__ import annotations
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.urls import reverse
+
+from . import imagens
+
+CAMPOS = {
+    "id": ("id",),
+    "slug": ("slug",),
+    "nome": ("nome",),
+    "descricao": ("descricao",),
+    "url": ("slug",),
+    "cidade": ("cidade",),
+    "bairro": ("bairro",),
+    "endereco": ("rua", "numero", "bairro", "cidade", "cep"),
+    "latitude": ("latitude",),
+    "longitude": ("longitude",),
+    "telefone": ("telefone",),
+    "email": ("email",),
+    "site": ("site",),
+    "facebook": ("facebook",),
+    "instagram": ("instagram",),
+    "nota_media": ("nota_media",),
+    "total_avaliacoes": ("total_avaliacoes",),
+    "atualizado_em": ("updated_at",),
+    "tags": (),
+    "capa": (),
+}
+CAMPOS_LISTA = ("id", "slug", "nome", "url", "cidade", "bairro", "nota_media", "total_avaliacoes", "capa")
+CAMPOS_DETALHE = tuple(CAMPOS)
+
+POR_PAGINA = 20
+POR_PAGINA_MAXIMO = 100
+
+
+class CampoInvalido(ValueError):
+    pass
+
+
+def campos_pedidos(params, padrao) -> tuple:
+    """``?fields=a,b,c`` validado contra ``CAMPOS`` (sem ``fields``: ``padrao``)."""
+    bruto = (params.get("fields") or "").strip()
+    if not bruto:
+        return tuple(padrao)
+    campos = tuple(dict.fromkeys(c.strip() for c in bruto.split(",") if c.strip()))
+    desconhecidos = [c for c in campos if c not in CAMPOS]
+    if desconhecidos:
+        raise CampoInvalido(f"Campos desconhecidos: {', '.join(desconhecidos)}.")
+    return campos
+
+
+def limite_pedido(params) -> int:
+    try:
+        limite = int(params.get("limite") or POR_PAGINA)
+    except ValueError:
+        limite = POR_PAGINA
+    return min(max(limite, 1), POR_PAGINA_MAXIMO)
+
+
+def colunas(campos) -> list:
+    """Colunas de Empresa que ``.values()`` precisa ler para ``campos`` (sempre com ``id``)."""
+    return list(dict.fromkeys(["id", *(c for campo in campos for c in CAMPOS[campo])]))
+
+
+# ============================================================
+# Relacionados (uma consulta por página, só se pedidos)
+# ============================================================
+
+def _tags_por_empresa(ids):
+    from .models import Empresa
+    por_empresa = {}
+    linhas = (
+        Empresa.tags.through.objects.filter(empresa_id__in=ids)
+        .order_by("tag__nome").values_list("empresa_id", "tag_id", "tag__nome")
+    )
+    for empresa_id, tag_id, nome in linhas:
+        por_empresa.setdefault(empresa_id, []).append({"id": tag_id, "nome": nome})
+    return por_empresa
+
+
+def _capas_por_empresa(ids):
+    """Mesma regra de ``ImagemEmpresa.objects.capas()``: principal ou, na falta, a mais antiga."""
+    from .models import ImagemEmpresa
+    storage = ImagemEmpresa._meta.get_field("imagem").storage
+    linhas = (
+        ImagemEmpresa.objects.filter(empresa_id__in=ids)
+        .annotate(posicao=Window(
+            RowNumber(), partition_by=F("empresa_id"),
+            order_by=[F("principal").desc(), F("data_upload").asc(), F("id").asc()],
+        ))
+        .filter(posicao=1)
+        .values_list("empresa_id", "imagem", "derivados", "largura", "altura")
+    )
+    capas = {}
+    for empresa_id, arquivo, derivados, largura, altura in linhas:
+        if not arquivo:
+            continue
+        original = storage.url(arquivo)
+        capas[empresa_id] = {
+            "url": original,
+            "largura": largura,
+            "altura": altura,
+            "thumb": imagens.url(derivados, storage, "thumb") or original,
+            "card": imagens.url(derivados, storage, "card") or original,
+            "srcset_webp": imagens.srcset(derivados, storage, "webp"),
+        }
+    return capas
+
+
+# ============================================================
+# Serialização
+# ============================================================
+
+def _float(valor):
+    return float(valor) if valor is not None else None
+
+
+def _valor(campo, linha):
+    if campo == "url":
+        return reverse("empresa_detalhe", args=[linha["slug"]]) if linha["slug"] else None
+    if campo == "endereco":
+        return {c: linha[c] for c in CAMPOS["endereco"]}
+    if campo in ("latitude", "longitude", "nota_media"):
+        return _float(linha[campo])
+    if campo == "atualizado_em":
+        return linha["updated_at"].isoformat() if linha["updated_at"] else None
+    return linha[campo]
+
+
+def serializar(linhas, campos) -> list[dict]:
+    """Linhas de ``.values(*colunas(campos))`` -> dicts só com ``campos``."""
+    linhas = list(linhas)
+    ids = [linha["id"] for linha in linhas]
+    tags = _tags_por_empresa(ids) if "tags" in campos and ids else {}
+    capas = _capas_por_empresa(ids) if "capa" in campos and ids else {}
+
+    resultado = []
+    for linha in linhas:
+        item = {}
+        for campo in campos:
+            if campo == "tags":
+                item[campo] = tags.get(linha["id"], [])
+            elif campo == "capa":
+                item[campo] = capas.get(linha["id"])
+            else:
+                item[campo] = _valor(campo, linha)
+        resultado.append(item)
+    return resultado
@@ -1,4 +1,9 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class CoreConfig(AppConfig):
@@ -6,4 +11,16 @@ class CoreConfig(AppConfig):
     name = 'core'
 
     def ready(self):
-        from . import signals  # noqa
\ No newline at end of file
+        from . import signals  # noqa
+        _avisar_cache_local()
+
+
+def _avisar_cache_local():
+    # as invalidações por versão (core.cache_versionado, core.cache_paginas) só
+    # valem entre processos com um cache compartilhado (CACHE_URL)
+    backend = settings.CACHES["default"]["BACKEND"]
+    if not settings.DEBUG and not getattr(settings, "TESTING", False) and backend.endswith("LocMemCache"):
+        logger.warning(
+            "CACHES usa locmem (por processo): com mais de um worker, facetas, mapa, favoritos "
+            "e páginas em cache ficam velhos nos outros. Defina CACHE_URL (ex.: redis://...) em produção."
+        )
\ No newline at end of file
@@ -0,0 +1,114 @@
+# core/arvore_tags.py
+"""
+Hierarquia de tags (``Tag.parent``) com tabela de fechamento (``TagAncestral``).
+
+Cada par (ancestral, descendente) da árvore tem uma linha com a distância
+entre os dois (``profundidade``; 0 = a própria tag). Assim "empresas da tag
+X ou de qualquer subtag" é um join indexado em ``ancestral_id``, sem
+percorrer a árvore.
+
+A tabela é mantida por ``Tag.save()`` (criação e troca de pai, via
+``inserir``/``mover``); exclusões saem sozinhas pelo CASCADE das duas FKs.
+``reconstruir`` refaz tudo a partir de ``parent`` (depois de gravações que
+não passam pelo ``save()``, como ``bulk_create``). A migração 0028 tem a
+sua cópia congelada.
+
+Só recebe as classes dos models (não importa ``core.models``).
+"""
+from __future__ import annotations
+
+
+class CicloNaHierarquia(ValueError):
+    pass
+
+
+def forma_ciclo(fechamento, tag_id, parent_id) -> bool:
+    """Pôr ``tag_id`` debaixo de ``parent_id`` criaria um ciclo?"""
+    if parent_id is None or tag_id is None:
+        return False
+    return parent_id == tag_id or fechamento.objects.filter(
+        ancestral_id=tag_id, descendente_id=parent_id
+    ).exists()
+
+
+def inserir(fechamento, tag_id, parent_id):
+    """Tag recém-criada: a linha dela mesma + uma por ancestral do pai."""
+    fechamento.objects.create(ancestral_id=tag_id, descendente_id=tag_id, profundidade=0)
+    if parent_id is not None:
+        _ligar(fechamento, [(tag_id, 0)], parent_id)
+
+
+def inserir_raizes(fechamento, tag_ids):
+    """Tags sem pai criadas em lote (``bulk_create``): só a linha de cada uma."""
+    fechamento.objects.bulk_create(
+        [fechamento(ancestral_id=t, descendente_id=t, profundidade=0) for t in tag_ids],
+        ignore_conflicts=True,
+    )
+
+
+def mover(fechamento, tag_id, parent_id):
+    """Move a subárvore de ``tag_id`` para debaixo de ``parent_id`` (None = raiz)."""
+    if forma_ciclo(fechamento, tag_id, parent_id):
+        raise CicloNaHierarquia("Uma tag não pode ficar debaixo dela mesma ou de uma subtag sua.")
+    subarvore = list(
+        fechamento.objects.filter(ancestral_id=tag_id).values_list("descendente_id", "profundidade")
+    )
+    ids = [d for d, _ in subarvore]
+    # desliga a subárvore dos ancestrais antigos; os caminhos internos ficam
+    fechamento.objects.filter(descendente_id__in=ids).exclude(ancestral_id__in=ids).delete()
+    if parent_id is not None:
+        _ligar(fechamento, subarvore, parent_id)
+
+
+def _ligar(fechamento, subarvore, parent_id):
+    ancestrais = fechamento.objects.filter(descendente_id=parent_id).values_list("ancestral_id", "profundidade")
+    fechamento.objects.bulk_create([
+        fechamento(ancestral_id=a, descendente_id=d, profundidade=pa + pd + 1)
+        for a, pa in ancestrais
+        for d, pd in subarvore
+    ])
+
+
+def reconstruir(tag_model, fechamento) -> int:
+    """Apaga e recria o fechamento a partir de ``parent``. Retorna quantas linhas gravou."""
+    pais = dict(tag_model._default_manager.values_list("id", "parent_id"))
+    linhas = []
+    for tag_id in pais:
+        atual, profundidade, vistos = tag_id, 0, set()
+        while atual is not None and atual not in vistos:
+            vistos.add(atual)
+            linhas.append(fechamento(ancestral_id=atual, descendente_id=tag_id, profundidade=profundidade))
+            atual, profundidade = pais.get(atual), profundidade + 1
+    fechamento.objects.all().delete()
+    fechamento.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
+
+
+def arvore(linhas) -> list[dict]:
+    """
+    Linhas ``{"id", "nome", "parent_id", ...}`` (uma consulta) em pré-ordem,
+    irmãs por nome, cada uma com ``profundidade`` e ``filhos`` (ids diretos).
+    """
+    por_pai = {}
+    por_id = {}
+    for linha in linhas:
+        no = dict(linha, filhos=[])
+        por_id[no["id"]] = no
+        por_pai.setdefault(no["parent_id"], []).append(no)
+    for irmas in por_pai.values():
+        irmas.sort(key=lambda no: no["nome"].lower())
+
+    # pai inexistente (linha fora do conjunto) vira raiz
+    raizes = [no for no in por_id.values() if no["parent_id"] not in por_id]
+    raizes.sort(key=lambda no: no["nome"].lower())
+
+    resultado = []
+    pilha = [(no, 0) for no in reversed(raizes)]
+    while pilha:
+        no, profundidade = pilha.pop()
+        no["profundidade"] = profundidade
+        filhos = por_pai.get(no["id"], [])
+        no["filhos"] = [f["id"] for f in filhos]
+        resultado.append(no)
+        pilha.extend((f, profundidade + 1) for f in reversed(filhos))
+    return resultado
@@ -0,0 +1,202 @@
+# core/cache_paginas.py
+"""
+Cache de página inteira para visitantes anônimos.
+
+``pagina_anonima`` guarda o HTML (ou JSON) de GETs anônimos no cache
+compartilhado. A chave junta o nome da view, a URL com a query string
+normalizada (ordenada, sem parâmetros vazios nem de rastreamento) e as
+versões dos "escopos" de que a página depende:
+
+- ``catalogo``: home e listagem (qualquer empresa, imagem, avaliação ou tag);
+- ``empresa(slug)``: a página de detalhe daquela empresa;
+- ``tags``: nomes de tags aparecem em todas as páginas de detalhe.
+
+Os signals avançam só os escopos afetados (``invalidar_*``), então uma edição
+aparece na hora, sem esperar TTL; as entradas antigas simplesmente expiram.
+Acertos e faltas são contados por página (``estatisticas()``).
+
+O base2.html sempre emite um token CSRF; ele é guardado como um marcador e
+cada acerto recebe o token do próprio visitante (``get_token``, que também
+manda o cookie).
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .cache_versionado import CacheVersionado
+
+PREFIXO = "paginas"
+PARAMETROS_IGNORADOS = {"fbclid", "gclid", "_"}
+MARCADOR_CSRF = b"__csrf_token_da_pagina__"
+# {% csrf_token %} e a <meta name="csrf-token"> do base2.html
+RE_CSRF = re.compile(rb'(?:name="csrfmiddlewaretoken" value|name="csrf-token" content)="([A-Za-z0-9]{64})"')
+
+catalogo = CacheVersionado(f"{PREFIXO}:catalogo")
+tags = CacheVersionado(f"{PREFIXO}:tags")
+PAGINAS = set()  # nomes das views decoradas (para as estatísticas)
+
+
+def empresa(slug):
+    return CacheVersionado(f"{PREFIXO}:empresa:{slug}")
+
+
+# ============================================================
+# Invalidação
+# ============================================================
+
+def invalidar_catalogo():
+    catalogo.invalidar()
+
+
+def invalidar_empresas(slugs):
+    """Detalhe das empresas de ``slugs`` + home/listagem."""
+    for slug in set(slugs):
+        if slug:
+            empresa(slug).invalidar()
+    catalogo.invalidar()
+
+
+def invalidar_tags():
+    tags.invalidar()
+    catalogo.invalidar()
+
+
+# ============================================================
+# Estatísticas
+# ============================================================
+
+def _chave_contador(pagina, tipo):
+    return f"{PREFIXO}:{tipo}:{pagina}"
+
+
+def _contar(pagina, tipo):
+    chave = _chave_contador(pagina, tipo)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        if not cache.add(chave, 1, None):
+            cache.incr(chave)
+
+
+def estatisticas():
+    """{pagina: {"hits", "misses", "taxa_acerto"}} desde o último ``zerar_estatisticas()``."""
+    chaves = [_chave_contador(p, t) for p in sorted(PAGINAS) for t in ("hits", "misses")]
+    valores = cache.get_many(chaves)
+    resultado = {}
+    for pagina in sorted(PAGINAS):
+        hits = valores.get(_chave_contador(pagina, "hits"), 0)
+        misses = valores.get(_chave_contador(pagina, "misses"), 0)
+        total = hits + misses
+        resultado[pagina] = {
+            "hits": hits,
+            "misses": misses,
+            "taxa_acerto": round(hits / total, 4) if total else None,
+        }
+    return resultado
+
+
+def zerar_estatisticas():
+    cache.delete_many([_chave_contador(p, t) for p in PAGINAS for t in ("hits", "misses")])
+
+
+# ============================================================
+# Decorator
+# ============================================================
+
+def _query_normalizada(request):
+    itens = sorted(
+        (k, v) for k, valores in request.GET.lists()
+        if k not in PARAMETROS_IGNORADOS and not k.startswith("utm_")
+        for v in valores if v.strip()
+    )
+    return urlencode(itens)
+
+
+def _versoes(escopos):
+    achadas = cache.get_many([e.chave_versao for e in escopos])
+    return [achadas.get(e.chave_versao) or e.versao() for e in escopos]
+
+
+def anonimo_sem_mensagens(request):
+    """Visitante anônimo cuja página é igual à de qualquer outro anônimo."""
+    if request.user.is_authenticated:
+        return False
+    # mensagens pendentes (ex.: "você saiu") são de um visitante só
+    return "messages" not in request.COOKIES and not request.session.get("_messages")
+
+
+def _cacheavel(request):
+    if not getattr(settings, "CACHE_PAGINAS", True) or request.method not in ("GET", "HEAD"):
+        return False
+    return anonimo_sem_mensagens(request)
+
+
+def _pode_guardar(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not (set(response.cookies) - {settings.CSRF_COOKIE_NAME})
+        and "private" not in response.get("Cache-Control", "")
+    )
+
+
+def _sem_csrf(conteudo):
+    for token in set(RE_CSRF.findall(conteudo)):
+        conteudo = conteudo.replace(token, MARCADOR_CSRF)
+    return conteudo
+
+
+def _com_csrf(request, conteudo):
+    if MARCADOR_CSRF not in conteudo:
+        return conteudo
+    return conteudo.replace(MARCADOR_CSRF, get_token(request).encode())
+
+
+def pagina_anonima(escopos, variacao=None):
+    """
+    Cacheia a view para visitantes anônimos.
+
+    ``escopos(*args, **kwargs)``: lista de ``CacheVersionado`` de que a página
+    depende (recebe os argumentos da URL). ``variacao(request)``: o que mais
+    muda a resposta para a mesma URL (ex.: HTML x JSON do "carregar mais").
+    """
+    def decorator(view):
+        nome = view.__name__
+        PAGINAS.add(nome)
+
+        @wraps(view)
+        def _view(request, *args, **kwargs):
+            if not _cacheavel(request):
+                return view(request, *args, **kwargs)
+
+            # versões lidas antes de renderizar: se alguém invalidar no meio,
+            # o que for guardado fica na versão velha e nunca é servido
+            versoes = ":".join(map(str, _versoes(escopos(*args, **kwargs))))
+            url = f"{request.path}?{_query_normalizada(request)}|{variacao(request) if variacao else ''}"
+            chave = f"{PREFIXO}:{nome}:{versoes}:{hashlib.md5(url.encode()).hexdigest()}"
+
+            guardada = cache.get(chave)
+            if guardada is not None:
+                _contar(nome, "hits")
+                conteudo, content_type = guardada
+                response = HttpResponse(_com_csrf(request, conteudo), content_type=content_type)
+                response["X-Cache"] = "HIT"
+                return response
+
+            _contar(nome, "misses")
+            response = view(request, *args, **kwargs)
+            if _pode_guardar(response):
+                guardada = (_sem_csrf(response.content), response["Content-Type"])
+                cache.set(chave, guardada, settings.CACHE_PAGINAS_TIMEOUT)
+                response["X-Cache"] = "MISS"
+            return response
+        return _view
+    return decorator
@@ -0,0 +1,70 @@
+# core/cache_versionado.py
+"""
+Cache de dados derivados com invalidação por versão.
+
+Dois níveis: memória do processo + cache compartilhado (``CACHES['default']``),
+ambos chaveados por um número de versão guardado no cache compartilhado.
+``invalidar()`` incrementa a versão; nenhum processo serve dado velho depois
+disso, e as entradas antigas simplesmente expiram.
+
+A versão só é vista por todos os processos se ``CACHES['default']`` for
+compartilhado (``CACHE_URL``). Com o locmem padrão, cada worker tem a sua e
+as invalidações não chegam aos outros; em produção com mais de um worker,
+``CACHE_URL`` é obrigatório (o ``core.apps`` avisa no boot).
+"""
+from __future__ import annotations
+
+import threading
+import time
+
+from django.core.cache import cache
+
+TIMEOUT_PADRAO = 60 * 60 * 24
+
+
+class CacheVersionado:
+    def __init__(self, prefixo: str, timeout: int = TIMEOUT_PADRAO):
+        self.prefixo = prefixo
+        self.chave_versao = f"{prefixo}:versao"
+        self.timeout = timeout
+        self._local = {"versao": None, "dados": {}}
+        self._lock = threading.Lock()
+
+    def versao(self) -> int:
+        v = cache.get(self.chave_versao)
+        if v is None:
+            # começa de um timestamp para não repetir uma versão antiga caso o
+            # cache seja limpo; add() não sobrescreve se outro processo já criou
+            cache.add(self.chave_versao, time.time_ns(), None)
+            v = cache.get(self.chave_versao, 0)
+        return v
+
+    def invalidar(self):
+        try:
+            cache.incr(self.chave_versao)
+        except ValueError:
+            cache.set(self.chave_versao, time.time_ns(), None)
+        with self._lock:
+            self._local["versao"] = None
+            self._local["dados"] = {}
+
+    def obter(self, nome, carregar):
+        """Valor de ``nome`` na versão atual; ``carregar()`` só roda se ninguém tiver em cache."""
+        v = self.versao()
+        with self._lock:
+            if self._local["versao"] != v:
+                self._local["versao"] = v
+                self._local["dados"] = {}
+            if nome in self._local["dados"]:
+                return self._local["dados"][nome]
+
+        chave = f"{self.prefixo}:{nome}:{v}"
+        dados = cache.get(chave)
+        if dados is None:
+            dados = carregar()
+            cache.set(chave, dados, self.timeout)
+
+        with self._lock:
+            if self._local["versao"] == v:
+                self._local["dados"][nome] = dados
+        return dados
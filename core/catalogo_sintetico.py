@@ -0,0 +1,324 @@
+# core/catalogo_sintetico.py
+"""
+Catálogo sintético e reproduzível (mesma ``semente`` = mesmos dados) para
+benchmark (``manage.py bench``) e testes de carga.
+
+Tudo é gravado em lotes, sem ``save()`` nem signals: ``bulk_create`` para o
+que precisa do id de volta (usuários, perfis, tags, empresas, imagens) e
+INSERT direto de tuplas para as tabelas grandes de ligação (avaliações,
+favoritos, tags das empresas). Os agregados de avaliação são calculados
+antes e entram com as empresas; o resto que os signals manteriam
+(fechamento das tags, índice de busca, caches) é refeito uma vez no fim.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import arvore_tags, cache_paginas, facets, geo, indice_facetas, mapa, search, slugs
+from .utils.cpf import completar_cnpj, completar_cpf
+
+PREFIXO_USUARIO = "sintetico"
+LOTE = 5000
+PROFUNDIDADE_MAXIMA = 2  # raiz -> subtag -> sub-subtag
+DIAS_DE_AVALIACOES = 2 * 365  # data_criacao espalhada pelos últimos dois anos
+
+# (cidade, latitude, longitude, peso)
+CIDADES = [
+    ("Araranguá", -28.9356, -49.4918, 6),
+    ("Balneário Arroio do Silva", -28.9847, -49.4133, 2),
+    ("Criciúma", -28.6775, -49.3697, 2),
+    ("Içara", -28.7133, -49.3000, 1),
+    ("Maracajá", -28.8472, -49.4600, 1),
+    ("Sombrio", -29.1039, -49.6286, 1),
+    ("Balneário Gaivota", -29.1536, -49.5808, 1),
+]
+BAIRROS_ARARANGUA = [
+    "Centro", "Cidade Alta", "Mato Alto", "Urussanguinha", "Morro dos Conventos", "Barranca",
+    "Coloninha", "Jardim das Avenidas", "Sangão", "Vila São José", "Divinéia", "Polícia Rodoviária",
+]
+BAIRROS_OUTROS = ["Centro", "Vila Nova", "Praia", "São Luiz", "Santa Bárbara", "Operária"]
+RUAS = [
+    "Rua Coronel João Fernandes", "Avenida XV de Novembro", "Rua Caetano Lummertz", "Avenida Getúlio Vargas",
+    "Rua Sete de Setembro", "Rua Barão do Rio Branco", "Avenida Beira Mar", "Rua das Gaivotas",
+]
+TIPOS = [
+    "Pousada", "Hotel", "Restaurante", "Pizzaria", "Café", "Sorveteria", "Camping", "Museu",
+    "Parque", "Quiosque", "Bar", "Padaria", "Hostel", "Chalés", "Churrascaria", "Loja",
+]
+NOMES = [
+    "do Mar", "Beira-Rio", "Sol Nascente", "Morro dos Conventos", "Lagoa Azul", "Dona Maria", "Bom Gosto",
+    "Recanto Verde", "Barra Velha", "Três Irmãos", "Gaivota", "Farol", "Pôr do Sol", "Colonial", "Vale Verde",
+]
+CATEGORIAS = ["Hospedagem", "Gastronomia", "Natureza", "Cultura", "Compras", "Lazer", "Serviços", "Eventos"]
+SUBCATEGORIAS = [
+    "Pousada", "Hotel", "Camping", "Hostel", "Restaurante", "Pizzaria", "Cafeteria", "Frutos do mar",
+    "Trilha", "Lagoa", "Dunas", "Museu", "Artesanato", "Feira", "Passeio de barco", "Pesca",
+    "Surf", "Balonismo", "Guia", "Transporte",
+]
+NOTAS = (1, 2, 3, 4, 5)
+PESOS_NOTAS = (5, 8, 17, 35, 35)
+COMENTARIOS = ["Ótimo atendimento.", "Voltaria com certeza.", "Preço justo.", "Lugar bonito, mas cheio.", ""]
+
+
+@dataclass
+class Tamanho:
+    empresas: int = 20_000
+    tags: int = 500
+    usuarios: int = 5_000
+    avaliacoes: int = 200_000
+    favoritos: int = 50_000
+    imagens: int = 20_000
+
+
+def _lotes(objetos, tamanho):
+    lote = []
+    for obj in objetos:
+        lote.append(obj)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _gravar(model, objetos, lote=LOTE):
+    """bulk_create em lotes; retorna os pks na ordem de ``objetos``."""
+    pks = []
+    for bloco in _lotes(objetos, lote):
+        pks.extend(obj.pk for obj in model.objects.bulk_create(bloco, batch_size=lote))
+    return pks
+
+
+def _pares(rng, linhas, colunas, quantidade):
+    """``quantidade`` pares (linha, coluna) distintos (restrições unique das tabelas)."""
+    quantidade = min(quantidade, linhas * colunas)
+    for indice in rng.sample(range(linhas * colunas), quantidade):
+        yield divmod(indice, colunas)
+
+
+# ============================================================
+# Geração
+# ============================================================
+
+def _usuarios(rng, quantidade):
+    from .models import PerfilUsuario
+    inicio = User.objects.filter(username__startswith=PREFIXO_USUARIO).count()
+    senha = make_password(None)  # inutilizável: os usuários sintéticos não fazem login por senha
+    user_ids = _gravar(User, (
+        User(username=f"{PREFIXO_USUARIO}{n}", email=f"{PREFIXO_USUARIO}{n}@example.com", password=senha)
+        for n in range(inicio, inicio + quantidade)
+    ))
+    # CPFs distintos a partir do número do usuário (sem as sondagens de generate_unique_cpf)
+    perfis = []
+    for n, user_id in enumerate(user_ids, start=inicio):
+        nove = f"{(700_000_000 + n * 7) % 10**9:09d}"
+        perfis.append(PerfilUsuario(user_id=user_id, cpf_cnpj=completar_cpf(nove)))
+    return user_ids, _gravar(PerfilUsuario, perfis)
+
+
+def _tags(rng, quantidade):
+    """Árvore de até três níveis; nomes numerados não colidem com as tags existentes."""
+    from .models import Tag
+    if quantidade <= 0:
+        return []
+    inicio = Tag.objects.count()
+    raizes = max(1, quantidade // 20)
+    niveis = [[] for _ in range(PROFUNDIDADE_MAXIMA + 1)]  # [(n, índice do pai)]
+    for n in range(quantidade):
+        if n < raizes:
+            niveis[0].append((n, None))
+            continue
+        profundidade = 1 if rng.random() < 0.6 or not niveis[1] else 2
+        niveis[profundidade].append((n, rng.randrange(len(niveis[profundidade - 1]))))
+
+    pks_por_nivel = []
+    for profundidade, nivel in enumerate(niveis):
+        nomes = CATEGORIAS if profundidade == 0 else SUBCATEGORIAS
+        pais = pks_por_nivel[-1] if pks_por_nivel else []
+        pks_por_nivel.append(_gravar(Tag, (
+            Tag(nome=f"{rng.choice(nomes)} {inicio + n + 1}", parent_id=pais[pai] if pai is not None else None)
+            for n, pai in nivel
+        )))
+    return [pk for pks in pks_por_nivel for pk in pks]
+
+
+def _cnpj(rng):
+    # matriz (0001) de uma raiz sorteada; dígitos verificadores válidos
+    return completar_cnpj(f"{rng.randrange(10**7, 10**8)}0001")
+
+
+def _endereco(rng):
+    cidade, lat, lng, _ = rng.choices(CIDADES, weights=[c[3] for c in CIDADES])[0]
+    bairro = rng.choice(BAIRROS_ARARANGUA if cidade == "Araranguá" else BAIRROS_OUTROS)
+    lat = Decimal(f"{lat + rng.uniform(-0.04, 0.04):.7f}")
+    lng = Decimal(f"{lng + rng.uniform(-0.04, 0.04):.7f}")
+    return cidade, bairro, lat, lng
+
+
+def _empresas(rng, quantidade, dono_ids, plano):
+    from .models import Empresa
+    # os nomes são numerados: basta ler os slugs existentes uma vez
+    alocador = slugs.AlocadorSlugs(Empresa)
+    for slug in Empresa.objects.exclude(slug__isnull=True).values_list("slug", flat=True).iterator(chunk_size=5000):
+        alocador.ocupar(slug)
+    alocador.marcar_tudo_carregado()
+    inicio = Empresa.objects.count()
+
+    def objetos():
+        for n in range(quantidade):
+            nome = f"{rng.choice(TIPOS)} {rng.choice(NOMES)} {inicio + n + 1}"
+            cidade, bairro, lat, lng = _endereco(rng)
+            slug = alocador.alocar(nome)
+            yield Empresa(
+                user_id=rng.choice(dono_ids), nome=nome, slug=slug, cnpj=_cnpj(rng),
+                descricao=f"{nome} em {bairro}, {cidade}.",
+                rua=rng.choice(RUAS), numero=str(rng.randrange(1, 3000)), bairro=bairro, cidade=cidade,
+                cep=f"88900-{rng.randrange(1000):03d}", latitude=lat, longitude=lng,
+                geohash=geo.geohash_de(lat, lng), telefone=f"(48) 9{rng.randrange(10**7, 10**8)}",
+                email=f"contato@{slug}.example.com", **plano.campos(n),
+            )
+    return _gravar(Empresa, objetos())
+
+
+def _inserir_linhas(model, colunas, linhas, lote=LOTE) -> int:
+    """
+    INSERT direto de tuplas (sem instanciar models) para as tabelas grandes
+    de ligação: no SQLite um ``executemany`` por lote; nos outros bancos um
+    INSERT de várias linhas por lote. Retorna quantas linhas gravou.
+    """
+    conn = transaction.get_connection()
+    tabela = conn.ops.quote_name(model._meta.db_table)
+    nomes = ", ".join(conn.ops.quote_name(model._meta.get_field(c).column) for c in colunas)
+    marcadores = "(" + ", ".join(["%s"] * len(colunas)) + ")"
+    total = 0
+    with conn.cursor() as cur:
+        for bloco in _lotes(linhas, lote):
+            if conn.vendor == "sqlite":
+                cur.executemany(f"INSERT INTO {tabela} ({nomes}) VALUES {marcadores}", bloco)
+            else:
+                valores = ", ".join([marcadores] * len(bloco))
+                cur.execute(f"INSERT INTO {tabela} ({nomes}) VALUES {valores}", [v for linha in bloco for v in linha])
+            total += len(bloco)
+    return total
+
+
+def _tags_das_empresas(rng, empresa_ids, tag_ids):
+    from .models import Empresa
+    if not tag_ids:
+        return 0
+    return _inserir_linhas(Empresa.tags.through, ("empresa", "tag"), (
+        (empresa_id, tag_id)
+        for empresa_id in empresa_ids
+        for tag_id in rng.sample(tag_ids, min(len(tag_ids), rng.randint(1, 4)))
+    ))
+
+
+class _PlanoAvaliacoes:
+    """
+    Pares (empresa, usuário) e notas sorteados antes de gravar as empresas,
+    para que os agregados (nota_media, histograma) já entrem no bulk_create
+    delas em vez de um recálculo com bulk_update no fim.
+    """
+
+    def __init__(self, rng, quantidade, empresas, usuarios):
+        self.usuarios = usuarios
+        # índice = empresa * usuarios + usuário (a unique de Avaliacao)
+        self.pares = rng.sample(range(empresas * usuarios), min(quantidade, empresas * usuarios))
+        self.notas = bytes(rng.choices(NOTAS, weights=PESOS_NOTAS, k=len(self.pares)))
+        self.contagens = {}
+        for indice, nota in zip(self.pares, self.notas):
+            por_nota = self.contagens.setdefault(indice // usuarios, {})
+            por_nota[nota] = por_nota.get(nota, 0) + 1
+
+    def campos(self, empresa):
+        from .models import campos_avaliacao
+        return campos_avaliacao(self.contagens.get(empresa, {}))
+
+    def gravar(self, rng, empresa_ids, user_ids):
+        from .models import Avaliacao
+        agora = timezone.now()
+        comentarios = rng.choices(COMENTARIOS, k=len(self.pares))
+        segundos = [rng.randrange(DIAS_DE_AVALIACOES * 86400) for _ in self.pares]
+        return _inserir_linhas(Avaliacao, ("empresa", "user", "nota", "comentario", "data_criacao"), (
+            (empresa_ids[indice // self.usuarios], user_ids[indice % self.usuarios], nota, comentario,
+             agora - timedelta(seconds=atraso))
+            for indice, nota, comentario, atraso in zip(self.pares, self.notas, comentarios, segundos)
+        ))
+
+
+def _favoritos(rng, quantidade, empresa_ids, perfil_ids):
+    from .models import PerfilUsuario
+    return _inserir_linhas(PerfilUsuario.favoritos.through, ("perfilusuario", "empresa"), (
+        (perfil_ids[p], empresa_ids[e])
+        for p, e in _pares(rng, len(perfil_ids), len(empresa_ids), quantidade)
+    ))
+
+
+def _imagens(rng, quantidade, empresa_ids):
+    from .models import ImagemEmpresa
+    # só as linhas (sem arquivo): a listagem e o detalhe leem nome, tamanho e derivados
+    return len(_gravar(ImagemEmpresa, (
+        ImagemEmpresa(
+            empresa_id=empresa_ids[n % len(empresa_ids)], principal=n < len(empresa_ids),
+            imagem=f"empresas/galeria/sintetica-{empresa_ids[n % len(empresa_ids)]}-{n}.jpg",
+            largura=1600, altura=1067,
+        )
+        for n in range(quantidade)
+    )))
+
+
+def _pos_gravacao(empresa_ids):
+    # o que os signals fariam, uma vez para o lote todo (os agregados de
+    # avaliação já foram gravados com as empresas)
+    from .models import Tag, TagAncestral
+    arvore_tags.reconstruir(Tag, TagAncestral)
+    for i in range(0, len(empresa_ids), 500):
+        search.indexar(empresa_ids[i:i + 500])
+    facets.invalidar()
+    indice_facetas.invalidar()
+    mapa.invalidar()
+    cache_paginas.invalidar_tags()
+
+
+def gerar(tamanho: Tamanho, semente: int = 42, progresso=None) -> dict:
+    """
+    Grava um catálogo sintético de ``tamanho``. ``progresso(etapa)`` é chamado
+    antes de cada etapa. Retorna quantas linhas de cada tipo foram criadas.
+    """
+    rng = random.Random(semente)
+    avisar = progresso or (lambda etapa: None)
+    with transaction.atomic():
+        avisar("usuarios")
+        user_ids, perfil_ids = _usuarios(rng, max(tamanho.usuarios, 1))
+        avisar("tags")
+        tag_ids = _tags(rng, tamanho.tags)
+        plano = _PlanoAvaliacoes(rng, tamanho.avaliacoes, tamanho.empresas, len(user_ids))
+        avisar("empresas")
+        empresa_ids = _empresas(rng, tamanho.empresas, user_ids, plano)
+        avisar("tags_das_empresas")
+        total_tags = _tags_das_empresas(rng, empresa_ids, tag_ids)
+        avisar("avaliacoes")
+        total_avaliacoes = plano.gravar(rng, empresa_ids, user_ids)
+        avisar("favoritos")
+        total_favoritos = _favoritos(rng, tamanho.favoritos, empresa_ids, perfil_ids) if empresa_ids else 0
+        avisar("imagens")
+        total_imagens = _imagens(rng, tamanho.imagens, empresa_ids) if empresa_ids else 0
+        avisar("pos_gravacao")
+        _pos_gravacao(empresa_ids)
+    return {
+        "usuarios": len(user_ids),
+        "tags": len(tag_ids),
+        "empresas": len(empresa_ids),
+        "tags_das_empresas": total_tags,
+        "avaliacoes": total_avaliacoes,
+        "favoritos": total_favoritos,
+        "imagens": total_imagens,
+    }
@@ -1,14 +1,10 @@
-from .models import Tag, Empresa
+from django.utils.functional import SimpleLazyObject
+
+from . import facets
 
 def search_filters(request):
-    tags = list(Tag.objects.order_by('nome').values('id', 'nome')) 
-    
-    cidades = list(
-        Empresa.objects.exclude(cidade__isnull=True).exclude(cidade__exact='')
-        .order_by('cidade').values_list('cidade', flat=True).distinct()
-    )
-    
+    # Lazy: só consulta (cache/banco) se o template realmente usar as variáveis
     return {
-        'GLOBAL_TAGS': tags, 
-        'GLOBAL_CITIES': cidades,
-    }
\ No newline at end of file
+        'GLOBAL_TAGS': SimpleLazyObject(facets.tags),
+        'GLOBAL_CITIES': SimpleLazyObject(facets.cidades),
+    }
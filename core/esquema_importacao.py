@@ -0,0 +1,176 @@
+# core/esquema_importacao.py
+"""
+Esquema das planilhas de importação: que cabeçalho corresponde a que campo
+canônico e em que formato (modelo padrão ou exportação do Google Contacts)
+o arquivo está.
+
+Tudo que depende só dos aliases é montado uma vez, na importação do módulo:
+o mapa normalizado alias -> canônico fica congelado e cada rótulo de
+cabeçalho já resolvido fica em cache, então montar o parser de um arquivo
+não repete normalização por requisição.
+"""
+from __future__ import annotations
+
+import difflib
+import re
+import unicodedata
+from functools import lru_cache
+from types import MappingProxyType
+
+FORMATO_PADRAO = "padrao"
+FORMATO_GOOGLE = "google"
+
+# Similaridade mínima (difflib) para aceitar um cabeçalho "parecido" com um alias
+SIMILARIDADE_MINIMA = 0.85
+
+# nomes aceitos por campo canônico (comparados já normalizados, sem acento)
+COLUMN_ALIASES = {
+    # --- Modelo Padrão (Mantido para compatibilidade) ---
+    "nome": ["nome", "razão social", "razao social"],
+    "categoria": ["ramo atividade", "ramo de atividade", "categoria", "ramo"],
+    "bairro": ["bairro"], "rua": ["endereço", "endereco", "logouro", "endereço completo"],
+    "numero": ["número", "numero", "nº"], "cidade": ["cidade", "municipio", "município"],
+    "cep": ["cep", "c.e.p."], "telefone": ["telefone", "fone", "whatsapp"],
+    "contato": ["contato direto", "contato"], "descricao": ["descrição", "descricao", "observacao", "obs"],
+    "cnpj": ["cnpj", "cpf/cnpj", "cpf ou cnpj"],
+    "horario_semana": ["horário semana", "horário seg-sex", "horario de segunda a sexta"],
+    "horario_sabado": ["horário sábado", "horario sabado"],
+    "horario_domingo": ["horário domingo", "horario domingo"],
+    "horario_observacoes": ["observações horário", "observações do horário", "obs horário"],
+    # ... outros do modelo padrão
+
+    # --- MAPEAMENTO COMPLETO PARA GOOGLE CONTACTS ---
+    # Nomes
+    "google_nome_contato": ["Name"],
+    "google_tag": ["First Name"], 
+    "google_nome_do_meio": ["Middle Name"],
+    "google_sobrenome": ["Last Name"],
+    "google_apelido": ["Nickname"],
+    "google_file_as": ["File As"],
+    
+    # Organização
+    "google_nome_empresa": ["Organization Name"],
+    "google_cargo": ["Organization Title"],
+    "google_departamento": ["Organization Department"],
+    
+    # Contatos
+    "google_email_1": ["E-mail 1 - Value"],
+    "google_email_2": ["E-mail 2 - Value"],
+    "google_telefone_1": ["Phone 1 - Value"],
+    "google_telefone_2": ["Phone 2 - Value"],
+    "google_telefone_3": ["Phone 3 - Value"],
+    
+    # Endereços
+    "google_endereco_formatado": ["Address 1 - Formatted"],
+    "google_rua": ["Address 1 - Street"],
+    "google_cidade": ["Address 1 - City"],
+    "google_estado": ["Address 1 - Region"],
+    "google_cep": ["Address 1 - Postal Code"],
+    "google_pais": ["Address 1 - Country"],
+    
+    # Websites
+    "google_website_1": ["Website 1 - Value"],
+    "google_website_2": ["Website 2 - Value"],
+    
+    # Outros
+    "google_aniversario": ["Birthday"],
+    "google_notas": ["Notes"],
+    
+    "google_custom_1_label": ["Custom Field 1 - Label"], 
+    "google_custom_1_value": ["Custom Field 1 - Value"], 
+    "google_custom_2_label": ["Custom Field 2 - Label"],
+    "google_custom_2_value": ["Custom Field 2 - Value"],
+    "google_custom_3_label": ["Custom Field 3 - Label"],
+    "google_custom_3_value": ["Custom Field 3 - Value"],
+}
+
+# Cabeçalhos do modelo para download (download_template_empresas)
+CABECALHO_MODELO = (
+    "CNPJ",
+    "CATEGORIA",
+    "NOME",
+    "BAIRRO",
+    "ENDEREÇO COMPLETO",
+    "TELEFONE",
+    "CONTATO DIRETO",
+    "DIGITAL (site/redes)",
+    "CADASTUR",
+    "MAPS (link)",
+    "APP",
+    "DESCRIÇÃO",
+    "NÚMERO",
+    "CEP",
+    "CIDADE",
+    "HORÁRIO SEMANA (seg-sex)",
+    "HORÁRIO SÁBADO",
+    "HORÁRIO DOMINGO",
+    "OBSERVAÇÕES HORÁRIO",
+)
+
+_PARENTESES_RE = re.compile(r"\([^)]*\)")
+_NAO_PALAVRA_RE = re.compile(r"[\W_]+")
+_NAO_DIGITO_RE = re.compile(r"\D")
+
+
+def normalizar_rotulo(s: str | None) -> str:
+    """'HORÁRIO SEMANA (seg-sex)' -> 'horario semana'; 'E-mail 1 - Value' -> 'e mail 1 value'."""
+    s = unicodedata.normalize("NFKD", str(s or ""))
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    s = _PARENTESES_RE.sub(" ", s)
+    return _NAO_PALAVRA_RE.sub(" ", s).strip().lower()
+
+
+def digitos(s: str | None) -> str:
+    return _NAO_DIGITO_RE.sub("", s or "")
+
+
+def _montar_aliases():
+    mapa = {}
+    for canon, alts in COLUMN_ALIASES.items():
+        for alias in alts:
+            # o primeiro canônico que declara o alias vence
+            mapa.setdefault(normalizar_rotulo(alias), canon)
+    return MappingProxyType(mapa)
+
+
+ALIASES = _montar_aliases()
+_CHAVES = tuple(ALIASES)
+CANONICOS_GOOGLE = frozenset(c for c in COLUMN_ALIASES if c.startswith("google_"))
+
+
+@lru_cache(maxsize=2048)
+def canonico(rotulo: str | None) -> tuple[str | None, bool]:
+    """
+    (campo canônico, exato?) para um rótulo de cabeçalho. Sem casamento
+    exato tenta o alias mais parecido, desde que os números coincidam
+    ('Phone 2 - Value' nunca vira o campo do 'Phone 1 - Value').
+    """
+    chave = normalizar_rotulo(rotulo)
+    if not chave:
+        return None, False
+    if chave in ALIASES:
+        return ALIASES[chave], True
+    for parecido in difflib.get_close_matches(chave, _CHAVES, n=3, cutoff=SIMILARIDADE_MINIMA):
+        if digitos(parecido) == digitos(chave):
+            return ALIASES[parecido], False
+    return None, False
+
+
+def mapear_cabecalho(cabecalho) -> dict[int, str]:
+    """{índice da coluna: campo canônico}. Casamentos exatos têm prioridade e
+    nenhum campo é atribuído a duas colunas."""
+    resolvidos = [(idx, *canonico(rotulo)) for idx, rotulo in enumerate(cabecalho or [])]
+    mapa, usados = {}, set()
+    for exato in (True, False):
+        for idx, canon, foi_exato in resolvidos:
+            if canon and foi_exato is exato and canon not in usados:
+                mapa[idx] = canon
+                usados.add(canon)
+    return mapa
+
+
+def detectar_formato(mapa: dict[int, str]) -> str:
+    """Google Contacts quando a maioria das colunas reconhecidas é do Google."""
+    canons = set(mapa.values())
+    google = len(canons & CANONICOS_GOOGLE)
+    return FORMATO_GOOGLE if google > len(canons) - google else FORMATO_PADRAO
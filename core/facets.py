@@ -0,0 +1,45 @@
+# core/facets.py
+"""
+Facetas globais de filtro (lista de tags e de cidades) em cache.
+
+Usa ``core.cache_versionado`` (memória do processo + cache compartilhado,
+chaveados por versão). Os signals em ``core.signals`` chamam ``invalidar()``
+quando Tag/Empresa mudam, o que incrementa a versão; nenhum dado velho é
+servido depois disso.
+"""
+from __future__ import annotations
+
+from .cache_versionado import CacheVersionado
+
+_cache = CacheVersionado("facetas")
+
+CHAVE_VERSAO = _cache.chave_versao
+versao = _cache.versao
+invalidar = _cache.invalidar
+
+
+def _carregar_tags():
+    from .arvore_tags import arvore
+    from .models import Tag
+    return [
+        {'id': no['id'], 'nome': no['nome'], 'parent_id': no['parent_id'], 'profundidade': no['profundidade']}
+        for no in arvore(Tag.objects.values('id', 'nome', 'parent_id'))
+    ]
+
+
+def _carregar_cidades():
+    from .models import Empresa
+    return list(
+        Empresa.objects.exclude(cidade__isnull=True).exclude(cidade__exact='')
+        .order_by('cidade').values_list('cidade', flat=True).distinct()
+    )
+
+
+def tags() -> list[dict]:
+    """[{'id', 'nome', 'parent_id', 'profundidade'}, ...] em ordem de árvore (subtags logo abaixo da mãe)."""
+    return _cache.obter("tags", _carregar_tags)
+
+
+def cidades() -> list[str]:
+    """Cidades distintas (não vazias) ordenadas."""
+    return _cache.obter("cidades", _carregar_cidades)
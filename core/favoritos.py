@@ -0,0 +1,93 @@
+# core/favoritos.py
+"""
+Favoritos do usuário (``PerfilUsuario.favoritos``) sem carregar a lista.
+
+- ``adicionar``/``remover``: um INSERT-OU-IGNORA / um DELETE direto na tabela
+  intermediária — idempotentes, custo constante qualquer que seja o tamanho
+  da lista;
+- ``alternar``: tenta remover; se não havia o que remover, adiciona;
+- ``ids(user)``: o conjunto de ids favoritados, guardado no cache por
+  usuário e usado por todas as views que desenham o botão de coração (zero
+  consultas por página depois da primeira).
+
+Quem grava por aqui invalida o conjunto na hora e de novo depois do commit;
+mudanças por fora (admin, ``perfil.favoritos.add``) passam pelo
+``m2m_changed`` em ``core.signals``.
+"""
+from __future__ import annotations
+
+from django.core.cache import cache
+from django.db import transaction
+
+PREFIXO = "favoritos"
+TIMEOUT = 60 * 60 * 24
+
+
+def _through():
+    from .models import PerfilUsuario
+    return PerfilUsuario.favoritos.through
+
+
+def _chave(user_id):
+    return f"{PREFIXO}:{user_id}"
+
+
+def _perfil_id(user):
+    from .models import PerfilUsuario
+    perfil, _ = PerfilUsuario.objects.only("id").get_or_create(user=user)
+    return perfil.pk
+
+
+# ============================================================
+# Leitura
+# ============================================================
+
+def ids(user) -> frozenset:
+    """Ids das empresas favoritadas por ``user`` (vazio para anônimos)."""
+    if not user.is_authenticated:
+        return frozenset()
+    chave = _chave(user.pk)
+    favoritos = cache.get(chave)
+    if favoritos is None:
+        favoritos = frozenset(
+            _through().objects.filter(perfilusuario__user_id=user.pk).values_list("empresa_id", flat=True)
+        )
+        cache.set(chave, favoritos, TIMEOUT)
+    return favoritos
+
+
+# ============================================================
+# Escrita
+# ============================================================
+
+def invalidar(user_ids):
+    chaves = [_chave(u) for u in set(user_ids) if u]
+    if chaves:
+        cache.delete_many(chaves)
+        transaction.on_commit(lambda: cache.delete_many(chaves))
+
+
+def adicionar(user, empresa_id):
+    # bulk_create não dispara m2m_changed: a invalidação é aqui
+    Through = _through()
+    Through.objects.bulk_create(
+        [Through(perfilusuario_id=_perfil_id(user), empresa_id=empresa_id)],
+        ignore_conflicts=True,
+    )
+    invalidar([user.pk])
+
+
+def remover(user, empresa_id) -> bool:
+    """Remove; retorna se havia o favorito."""
+    removidos, _ = _through().objects.filter(perfilusuario__user_id=user.pk, empresa_id=empresa_id).delete()
+    invalidar([user.pk])
+    return bool(removidos)
+
+
+def alternar(user, empresa_id) -> bool:
+    """Inverte o favorito; retorna se a empresa ficou favoritada."""
+    with transaction.atomic():
+        if remover(user, empresa_id):
+            return False
+        adicionar(user, empresa_id)
+        return True
@@ -0,0 +1,154 @@
+# core/fila_imagens.py
+"""
+Fila de imagens enviadas para a galeria e da capa do cadastro da empresa
+(``UploadImagem``).
+
+A requisição só grava cada arquivo no diretório local de staging
+(``settings.IMAGENS_STAGING_ROOT``) e cria o registro; o processamento —
+``imagens.normalizar`` (limites, EXIF, metadados, recompressão), envio ao
+storage de mídia e geração dos derivados — roda fora dela, conforme
+``settings.IMAGENS_EXECUTOR``:
+
+- ``"thread"``: pool limitado (``IMAGENS_THREADS``) no próprio processo web;
+- ``"sincrono"``: processa na hora, dentro da requisição (testes).
+
+Uploads que ficaram para trás (processo reiniciado) são retomados com
+``manage.py processar_uploads_imagem``.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import imagens
+from .models import ImagemEmpresa, UploadImagem
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.IMAGENS_THREADS),
+                thread_name_prefix="imagens",
+            )
+        return _executor
+
+
+# ============================================================
+# Recebimento
+# ============================================================
+
+def receber(empresa, user, arquivos, principal=False):
+    """
+    Grava os arquivos no staging local e enfileira cada um. Retorna os UploadImagem.
+    Com ``principal``, a primeira imagem vira a capa da empresa quando for processada.
+    """
+    uploads = []
+    for i, arquivo in enumerate(arquivos):
+        nome = arquivo.name or "imagem"
+        upload = UploadImagem(empresa=empresa, user=user, nome_arquivo=nome[:255], principal=principal and i == 0)
+        upload.arquivo.save(nome, arquivo, save=False)
+        upload.save()
+        uploads.append(upload)
+    for upload in uploads:
+        enfileirar(upload.pk)
+    return uploads
+
+
+def enfileirar(upload_id):
+    if settings.IMAGENS_EXECUTOR == "sincrono":
+        processar(upload_id)
+    else:
+        # só depois do commit: a thread usa outra conexão e precisa enxergar o registro
+        transaction.on_commit(lambda: _pool().submit(_processar_em_thread, upload_id))
+
+
+def _processar_em_thread(upload_id):
+    close_old_connections()
+    try:
+        processar(upload_id)
+    finally:
+        connections.close_all()
+
+
+# ============================================================
+# Processamento
+# ============================================================
+
+def reivindicar(upload_id) -> bool:
+    return UploadImagem.objects.filter(pk=upload_id, status=UploadImagem.PENDENTE).update(
+        status=UploadImagem.PROCESSANDO, iniciado_em=timezone.now()
+    ) == 1
+
+
+def recolocar_travados(minutos=30) -> int:
+    """Uploads "processando" há mais de ``minutos`` (processo morreu) voltam para a fila."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return UploadImagem.objects.filter(
+        status=UploadImagem.PROCESSANDO, iniciado_em__lt=limite
+    ).update(status=UploadImagem.PENDENTE, iniciado_em=None)
+
+
+def processar(upload_id):
+    """Reivindica e executa o upload (no-op se outra thread já o pegou)."""
+    if reivindicar(upload_id):
+        executar(upload_id)
+
+
+def _nome_final(nome_arquivo, extensao):
+    base = slugify(os.path.splitext(os.path.basename(nome_arquivo))[0])[:60] or "imagem"
+    return f"{base}.{extensao}"
+
+
+def _finalizar(upload_id, status, **campos):
+    UploadImagem.objects.filter(pk=upload_id).update(status=status, concluido_em=timezone.now(), **campos)
+
+
+def executar(upload_id):
+    """Processa um upload já reivindicado (status "processando")."""
+    try:
+        upload = UploadImagem.objects.select_related('empresa').get(pk=upload_id)
+    except UploadImagem.DoesNotExist:
+        return  # empresa excluída enquanto estava na fila (o staging sai no post_delete)
+
+    try:
+        with upload.arquivo.open('rb') as arquivo:
+            conteudo, extensao = imagens.normalizar(
+                arquivo, settings.IMAGEM_MAX_PIXELS, settings.IMAGEM_MAX_LADO
+            )
+        if upload.principal:
+            upload.empresa.imagens.update(principal=False)
+        # o save() envia o original ao storage de mídia e gera os derivados
+        imagem = ImagemEmpresa.objects.create(
+            empresa=upload.empresa,
+            imagem=ContentFile(conteudo, name=_nome_final(upload.nome_arquivo, extensao)),
+            principal=upload.principal,
+        )
+    except imagens.ImagemInvalida as e:
+        _finalizar(upload_id, UploadImagem.FALHOU, erro=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao processar o upload de imagem #{upload_id}: {e}", exc_info=True)
+        _finalizar(upload_id, UploadImagem.FALHOU, erro="Não foi possível processar a imagem.")
+    else:
+        _finalizar(upload_id, UploadImagem.CONCLUIDO, imagem=imagem)
+    finally:
+        try:
+            upload.arquivo.delete(save=False)
+        except OSError:
+            logger.warning("Não foi possível remover o arquivo do upload #%s", upload_id)
+        UploadImagem.objects.filter(pk=upload_id).update(arquivo='')
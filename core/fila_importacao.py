@@ -0,0 +1,212 @@
+# core/fila_importacao.py
+"""
+Fila de importações de planilha (``ImportacaoJob``).
+
+A requisição de upload só grava o arquivo e cria o job; o processamento roda
+fora dela, conforme ``settings.IMPORTACAO_EXECUTOR``:
+
+- ``"thread"``: pool de threads no próprio processo web (padrão, sem infra extra);
+- ``"worker"``: só enfileira; ``manage.py run_import_worker`` consulta a tabela;
+- ``"sincrono"``: processa na hora, dentro da requisição (testes).
+
+Um job é "reivindicado" com um UPDATE condicional (pendente -> processando),
+então threads e workers podem conviver sem processar o mesmo job duas vezes.
+Cada bloco do importador é commitado e o progresso gravado no job logo depois.
+
+Jobs de um processo que morreu no meio ficam "processando" (ou pendentes
+sem thread nenhuma). O worker os recoloca ao iniciar; no modo thread,
+``retomar()`` faz o mesmo no boot do processo web (``wsgi.py``) e, só para
+o job consultado, quando o status de um job parado é lido (``parado``). Cada
+processo guarda os ids que já pôs no seu pool (``_enviados``) e não os envia
+de novo enquanto estiverem lá: um job pendente atrás de uma importação longa
+não é reenviado a cada consulta de status.
+
+A planilha fica no disco local (``settings.IMPORTACAO_ROOT``; o storage de
+mídia só aceita imagem): no modo worker em outra máquina/contêiner, esse
+diretório tem que ser compartilhado com o processo web.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .importacao import ErroArquivo, importar_arquivo
+from .models import ImportacaoJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+_enviados = set()  # jobs no pool deste processo (na fila ou rodando)
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.IMPORTACAO_THREADS),
+                thread_name_prefix="importacao",
+            )
+        return _executor
+
+
+# ============================================================
+# Enfileiramento
+# ============================================================
+
+def criar_job(user, upload):
+    """Grava a planilha enviada e enfileira o processamento."""
+    job = ImportacaoJob(user=user, nome_arquivo=(upload.name or "planilha")[:255])
+    job.arquivo.save(upload.name or "planilha", upload, save=False)
+    job.save()
+    enfileirar(job.pk)
+    return job
+
+
+def enfileirar(job_id):
+    modo = settings.IMPORTACAO_EXECUTOR
+    if modo == "sincrono":
+        processar(job_id)
+    elif modo == "thread":
+        # só depois do commit: a thread usa outra conexão e precisa enxergar o job
+        transaction.on_commit(lambda: _submeter(job_id))
+    # "worker": run_import_worker pega da tabela
+
+
+def _submeter(job_id) -> bool:
+    """Põe o job no pool deste processo, a menos que ele já esteja lá."""
+    with _lock:
+        if job_id in _enviados:
+            return False
+        _enviados.add(job_id)
+    _pool().submit(_processar_em_thread, job_id)
+    return True
+
+
+def _processar_em_thread(job_id):
+    close_old_connections()
+    try:
+        processar(job_id)
+    finally:
+        with _lock:
+            _enviados.discard(job_id)
+        # conexões são por thread; não deixa uma aberta por thread do pool
+        connections.close_all()
+
+
+# ============================================================
+# Processamento
+# ============================================================
+
+def reivindicar(job_id) -> bool:
+    return ImportacaoJob.objects.filter(pk=job_id, status=ImportacaoJob.PENDENTE).update(
+        status=ImportacaoJob.PROCESSANDO, iniciado_em=timezone.now()
+    ) == 1
+
+
+def reivindicar_proximo():
+    """Reivindica o job pendente mais antigo. Retorna o id ou None."""
+    pendentes = (
+        ImportacaoJob.objects.filter(status=ImportacaoJob.PENDENTE)
+        .order_by('criado_em', 'id').values_list('pk', flat=True)[:10]
+    )
+    for pk in pendentes:
+        if reivindicar(pk):
+            return pk
+    return None
+
+
+def recolocar_travados(minutos=None, ids=None) -> int:
+    """Jobs "processando" há mais de ``minutos`` (processo morreu) voltam para a fila."""
+    if minutos is None:
+        minutos = settings.IMPORTACAO_TRAVADO_MINUTOS
+    limite = timezone.now() - timedelta(minutes=minutos)
+    travados = ImportacaoJob.objects.filter(status=ImportacaoJob.PROCESSANDO, iniciado_em__lt=limite)
+    if ids is not None:
+        travados = travados.filter(pk__in=ids)
+    return travados.update(status=ImportacaoJob.PENDENTE, iniciado_em=None)
+
+
+def parado(job) -> bool:
+    """
+    Pendente sem ninguém pegar (e fora do pool deste processo), ou
+    "processando" há mais que o limite de travado.
+    """
+    agora = timezone.now()
+    if job.status == ImportacaoJob.PENDENTE:
+        return job.pk not in _enviados and job.criado_em < agora - timedelta(minutes=1)
+    if job.status == ImportacaoJob.PROCESSANDO and job.iniciado_em:
+        return job.iniciado_em < agora - timedelta(minutes=settings.IMPORTACAO_TRAVADO_MINUTOS)
+    return False
+
+
+def retomar(job=None) -> int:
+    """
+    Modo thread: recoloca os travados e põe os pendentes no pool deste
+    processo — todos (boot) ou só ``job`` (consulta de status). Os que já
+    estão no pool ficam de fora; reivindicar() impede que dois processos
+    peguem o mesmo job. Retorna quantos foram enviados ao pool.
+    """
+    if settings.IMPORTACAO_EXECUTOR != "thread":
+        return 0
+    ids = None if job is None else [job.pk]
+    recolocar_travados(ids=ids)
+    pendentes = ImportacaoJob.objects.filter(status=ImportacaoJob.PENDENTE)
+    if ids is not None:
+        pendentes = pendentes.filter(pk__in=ids)
+    return sum(_submeter(pk) for pk in pendentes.order_by('criado_em', 'id').values_list('pk', flat=True))
+
+
+def processar(job_id):
+    """Reivindica e executa o job (no-op se outro processo já o pegou)."""
+    if reivindicar(job_id):
+        executar(job_id)
+
+
+def _contadores(importador):
+    return {
+        "total_linhas": importador.total_linhas,
+        "linhas_processadas": importador.linhas_processadas,
+        "criados": importador.criados,
+        "atualizados": importador.atualizados,
+        "sem_alteracao": importador.sem_alteracao,
+        "erros": importador.erros,
+        "mensagens": importador.mensagens,
+    }
+
+
+def _finalizar(job_id, status, **campos):
+    ImportacaoJob.objects.filter(pk=job_id).update(status=status, concluido_em=timezone.now(), **campos)
+
+
+def executar(job_id):
+    """Processa um job já reivindicado (status "processando")."""
+    job = ImportacaoJob.objects.select_related('user').get(pk=job_id)
+
+    def progresso(importador):
+        ImportacaoJob.objects.filter(pk=job_id).update(**_contadores(importador))
+
+    try:
+        with job.arquivo.open('rb') as arquivo:
+            importador = importar_arquivo(arquivo, job.nome_arquivo, job.user, progresso=progresso)
+    except ErroArquivo as e:
+        _finalizar(job_id, ImportacaoJob.FALHOU, erro=str(e))
+    except Exception as e:
+        logger.error(f"Erro catastrófico na importação #{job_id}: {e}", exc_info=True)
+        _finalizar(job_id, ImportacaoJob.FALHOU, erro=f"Erro inesperado: {e}")
+    else:
+        _finalizar(job_id, ImportacaoJob.CONCLUIDO, **_contadores(importador))
+    finally:
+        # o resultado fica no job; a planilha não é mais necessária
+        try:
+            job.arquivo.delete(save=False)
+        except OSError:
+            logger.warning("Não foi possível remover a planilha do job #%s", job_id)
+        ImportacaoJob.objects.filter(pk=job_id).update(arquivo='')
@@ -272,6 +272,22 @@ class CustomLoginForm(forms.Form):
         self.user = authenticated_user
         return cleaned_data
             
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleImageField(forms.ImageField):
+    """Vários arquivos num só input; valida cada um e devolve a lista."""
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        if isinstance(data, (list, tuple)):
+            return [super(MultipleImageField, self).clean(d, initial) for d in data]
+        return [super().clean(data, initial)] if data else []
+
+
 class EmpresaForm(forms.ModelForm):
     tags = forms.ModelMultipleChoiceField(
         queryset=Tag.objects.all().order_by('nome'),
@@ -326,11 +342,9 @@ class EmpresaForm(forms.ModelForm):
 
         # Adiciona os campos de imagem condicionalmente
         if is_editing:
-             self.fields['novas_imagens'] = forms.ImageField(
+             self.fields['novas_imagens'] = MultipleImageField(
                 label="Adicionar novas imagens (até 5 no total)",
                 required=False,
-                # ✅ CORREÇÃO: Usar ClearableFileInput, mas o template adicionará 'multiple' ✅
-                widget=forms.ClearableFileInput(attrs={'multiple': True}) # O attr multiple aqui é só para o HTML
             )
         else: # Criação
             self.fields['imagem'] = forms.ImageField(
@@ -361,8 +375,7 @@ class EmpresaForm(forms.ModelForm):
 
     # ... (resto do seu EmpresaForm clean methods) ...
     def clean_novas_imagens(self):
-        # Validação movida para a view onde temos acesso ao request.FILES
-        return self.cleaned_data.get('novas_imagens')
+        return self.cleaned_data.get('novas_imagens') or []
     
     def clean_cnpj(self):
         cnpj = self.cleaned_data.get('cnpj')
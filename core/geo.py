@@ -0,0 +1,173 @@
+# core/geo.py
+"""
+Busca por proximidade ("perto de mim").
+
+Cada empresa guarda o geohash da sua coordenada (``Empresa.geohash``, com
+índice B-tree). Para um raio em volta de um ponto:
+
+1. escolhe-se a precisão de geohash cujas células cobrem o retângulo do raio
+   com poucas células;
+2. cada célula vira um filtro por prefixo no índice (lookup ``prefixo``,
+   abaixo), poda dos candidatos sem varrer a tabela;
+3. os candidatos são ordenados pela distância exata (haversine) e quem fica
+   fora do raio é descartado.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+
+from django.db.models import CharField, Q
+from django.db.models.lookups import StartsWith
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISAO = 9          # ~5 m; o que fica gravado em Empresa.geohash
+RAIO_TERRA_KM = 6371.0088
+MAX_CELULAS = 16      # células (intervalos no índice) por consulta
+RAIO_MAXIMO_KM = 100.0
+
+
+def codificar(lat, lng, precisao: int = PRECISAO) -> str:
+    """Geohash de (lat, lng) com ``precisao`` caracteres."""
+    lat, lng = float(lat), float(lng)
+    lat_int, lng_int = [-90.0, 90.0], [-180.0, 180.0]
+    hash_, bits, ch, par = [], 0, 0, True
+    while len(hash_) < precisao:
+        intervalo, valor = (lng_int, lng) if par else (lat_int, lat)
+        meio = (intervalo[0] + intervalo[1]) / 2
+        if valor >= meio:
+            ch = (ch << 1) | 1
+            intervalo[0] = meio
+        else:
+            ch <<= 1
+            intervalo[1] = meio
+        par = not par
+        bits += 1
+        if bits == 5:
+            hash_.append(BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(hash_)
+
+
+def geohash_de(lat, lng) -> str:
+    """Geohash gravado na empresa ('' sem coordenada válida)."""
+    if lat is None or lng is None:
+        return ""
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return ""
+    return codificar(lat, lng)
+
+
+def tamanho_celula(precisao: int) -> tuple[float, float]:
+    """(altura em graus de latitude, largura em graus de longitude) de uma célula."""
+    bits = 5 * precisao
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _retangulo(lat, lng, raio_km):
+    dlat = math.degrees(raio_km / RAIO_TERRA_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(180.0, math.degrees(raio_km / (RAIO_TERRA_KM * cos_lat)))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def celulas_do_raio(lat, lng, raio_km) -> set[str]:
+    """Prefixos de geohash que cobrem o círculo (via retângulo envolvente)."""
+    lat_min, lat_max, lng_min, lng_max = _retangulo(lat, lng, raio_km)
+    lat_min, lat_max = max(lat_min, -90.0), min(lat_max, 90.0)
+
+    for precisao in range(PRECISAO, 0, -1):
+        alt, larg = tamanho_celula(precisao)
+        linhas = math.floor(lat_max / alt) - math.floor(lat_min / alt) + 1
+        colunas = math.floor(lng_max / larg) - math.floor(lng_min / larg) + 1
+        if linhas * colunas <= MAX_CELULAS:
+            break
+
+    celulas = set()
+    for i in range(linhas):
+        la = min(lat_min + i * alt, lat_max)
+        for j in range(colunas):
+            ln = min(lng_min + j * larg, lng_max)
+            ln = (ln + 180.0) % 360.0 - 180.0  # atravessando o antimeridiano
+            celulas.add(codificar(la, ln, precisao))
+    return celulas
+
+
+@CharField.register_lookup
+class Prefixo(StartsWith):
+    """
+    ``campo__prefixo=p``: ``startswith`` que usa o índice em qualquer collation.
+
+    PostgreSQL (e demais): ``LIKE 'p%'``, atendido pelo índice
+    ``varchar_pattern_ops`` que o Django cria junto com o ``db_index`` de um
+    CharField — um intervalo ``>= p AND < p~`` dependeria da collation (em
+    en_US/ICU o ``~`` vem antes de letras e dígitos). SQLite: o LIKE ignora
+    maiúsculas e não usa índice, mas a collation padrão (BINARY) é a ordem
+    dos bytes, então o intervalo é exato e usa o índice comum.
+    """
+    lookup_name = "prefixo"
+
+    def get_rhs_op(self, connection, rhs):
+        return connection.operators["startswith"] % rhs
+
+    def as_sqlite(self, compiler, connection):
+        if not isinstance(self.rhs, str):
+            return super().as_sql(compiler, connection)
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        # "~" (0x7E) é maior que todo caractere de geohash
+        return f"({lhs} >= %s AND {lhs} < %s)", [*lhs_params, self.rhs, self.rhs + "~"]
+
+
+def filtro_celulas(celulas, campo: str = "geohash") -> Q:
+    """OR de prefixos de célula em ``campo`` (usa o índice do geohash)."""
+    filtro = Q()
+    for prefixo in sorted(celulas):
+        filtro |= Q(**{f"{campo}__prefixo": prefixo})
+    return filtro
+
+
+@dataclass(frozen=True)
+class Proximo:
+    id: int
+    distancia_km: float
+
+
+def proximos(queryset, lat, lng, raio_km) -> list[Proximo]:
+    """
+    Empresas de ``queryset`` a até ``raio_km`` de (lat, lng), da mais perto
+    para a mais longe. Só lê id/latitude/longitude dos candidatos.
+    """
+    lat, lng, raio_km = float(lat), float(lng), float(raio_km)
+    candidatos = (
+        queryset.exclude(geohash="")
+        .filter(filtro_celulas(celulas_do_raio(lat, lng, raio_km)))
+        .values_list("id", "latitude", "longitude")
+        .order_by()
+    )
+    resultado = []
+    for pk, la, ln in candidatos.iterator(chunk_size=2000):
+        d = haversine_km(lat, lng, la, ln)
+        if d <= raio_km:
+            resultado.append(Proximo(pk, d))
+    resultado.sort(key=lambda p: (p.distancia_km, p.id))
+    return resultado
+
+
+def ponto_da_requisicao(params):
+    """(lat, lng, raio_km) de ?lat=&lng=&raio= ou None se ausente/inválido."""
+    try:
+        lat = float(str(params.get("lat", "")).replace(",", "."))
+        lng = float(str(params.get("lng", "")).replace(",", "."))
+        raio = float(str(params.get("raio") or 5).replace(",", "."))
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or math.isnan(raio):
+        return None
+    return lat, lng, min(max(raio, 0.1), RAIO_MAXIMO_KM)
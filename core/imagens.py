@@ -0,0 +1,163 @@
+# core/imagens.py
+"""
+Derivados de imagem gerados no upload.
+
+Para cada imagem enviada são gravadas versões de largura fixa (``RENDICOES``)
+em WebP e JPEG, no mesmo storage do arquivo original (FileSystemStorage em
+dev, Cloudinary em produção — ambos só recebem ``storage.save(nome, arquivo)``).
+O que foi gerado fica num dicionário JSON no próprio model:
+
+    {"card": {"w": 480, "h": 360, "webp": "<nome>", "jpeg": "<nome>"}, ...}
+
+e os templates montam ``srcset`` a partir dele. Sem derivados (arquivo que o
+Pillow não abre, imagens antigas ainda não processadas) cai no original.
+"""
+from __future__ import annotations
+
+import io
+import logging
+import uuid
+
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+# nome -> largura máxima em px (nunca amplia além do original)
+RENDICOES = {
+    "thumb": 160,
+    "card": 480,
+    "hero": 1280,
+    "full": 1920,
+}
+RENDICOES_AVATAR = {"thumb": 96, "card": 240}
+
+QUALIDADE_WEBP = 80
+QUALIDADE_JPEG = 82
+QUALIDADE_ORIGINAL = 88
+PASTA = "derivados"
+
+
+class ImagemInvalida(ValueError):
+    """Arquivo recusado no processamento (ilegível ou grande demais)."""
+
+
+def _abrir(arquivo):
+    from PIL import Image, ImageOps
+
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)
+    img = Image.open(arquivo)
+    img.load()
+    # fotos de celular vêm "deitadas" com a rotação só no EXIF
+    return ImageOps.exif_transpose(img)
+
+
+def _codificar(img, formato):
+    from PIL import Image
+
+    saida = io.BytesIO()
+    if formato == "jpeg":
+        if img.mode not in ("RGB", "L"):
+            fundo = Image.new("RGB", img.size, (255, 255, 255))
+            rgba = img.convert("RGBA")
+            fundo.paste(rgba, mask=rgba.getchannel("A"))
+            img = fundo
+        img.save(saida, "JPEG", quality=QUALIDADE_JPEG, optimize=True, progressive=True)
+    else:
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+        img.save(saida, "WEBP", quality=QUALIDADE_WEBP, method=4)
+    return saida.getvalue()
+
+
+def normalizar(arquivo, max_pixels, max_lado):
+    """
+    Prepara o original que vai para o storage de mídia: recusa arquivos
+    ilegíveis e "bombas de descompressão" (as dimensões vêm do cabeçalho, antes
+    de decodificar), aplica a rotação do EXIF, limita o maior lado a
+    ``max_lado``, descarta os metadados (EXIF/GPS; só o perfil de cor fica) e
+    recomprime. Devolve ``(bytes, extensão)``.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        img = Image.open(arquivo)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImagemInvalida("O arquivo enviado não é uma imagem válida.") from e
+    largura, altura = img.size
+    if largura * altura > max_pixels:
+        raise ImagemInvalida(f"Imagem grande demais ({largura}x{altura} px).")
+    try:
+        img.load()
+    except (OSError, ValueError) as e:
+        raise ImagemInvalida("O arquivo enviado não é uma imagem válida.") from e
+
+    icc = img.info.get("icc_profile")
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((max_lado, max_lado), Image.LANCZOS)  # só reduz
+
+    transparente = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    img = img.convert("RGBA" if transparente else "RGB")
+    img.info = {}  # nada do arquivo original é regravado além do icc
+    saida = io.BytesIO()
+    if transparente:
+        img.save(saida, "PNG", optimize=True, icc_profile=icc)
+        return saida.getvalue(), "png"
+    img.save(saida, "JPEG", quality=QUALIDADE_ORIGINAL, optimize=True, progressive=True, icc_profile=icc)
+    return saida.getvalue(), "jpg"
+
+
+def gerar(arquivo, storage, pasta, rendicoes=RENDICOES):
+    """
+    Lê ``arquivo`` (upload ou arquivo do storage), grava os derivados em
+    ``storage`` sob ``pasta/derivados/`` e devolve ``(largura, altura, derivados)``
+    da imagem original. Devolve ``(None, None, {})`` se não for uma imagem legível.
+    """
+    from PIL import Image
+
+    try:
+        original = _abrir(arquivo)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("Imagem ilegível, derivados não gerados: %s", e)
+        return None, None, {}
+    finally:
+        if hasattr(arquivo, "seek"):
+            arquivo.seek(0)
+
+    largura, altura = original.size
+    base = f"{pasta.rstrip('/')}/{PASTA}/{uuid.uuid4().hex[:16]}"
+    derivados, feitas = {}, set()
+    for nome, maximo in sorted(rendicoes.items(), key=lambda kv: kv[1]):
+        w = min(maximo, largura)
+        if w in feitas:
+            continue
+        feitas.add(w)
+        h = max(1, round(altura * w / largura))
+        img = original if w == largura else original.resize((w, h), Image.LANCZOS)
+        derivados[nome] = {"w": w, "h": h}
+        for formato, ext in (("webp", "webp"), ("jpeg", "jpg")):
+            derivados[nome][formato] = storage.save(f"{base}_{nome}.{ext}", ContentFile(_codificar(img, formato)))
+    return largura, altura, derivados
+
+
+def remover(derivados, storage):
+    for info in (derivados or {}).values():
+        for formato in ("webp", "jpeg"):
+            nome = info.get(formato)
+            if not nome:
+                continue
+            try:
+                storage.delete(nome)
+            except Exception as e:  # storage remoto fora do ar não deve travar a exclusão
+                logger.warning("Não foi possível remover o derivado %s: %s", nome, e)
+
+
+def url(derivados, storage, nome, formato="jpeg"):
+    info = (derivados or {}).get(nome)
+    return storage.url(info[formato]) if info and info.get(formato) else None
+
+
+def srcset(derivados, storage, formato="jpeg"):
+    """'url 160w, url 480w, ...' (vazio sem derivados)."""
+    itens = sorted((derivados or {}).values(), key=lambda i: i["w"])
+    return ", ".join(f"{storage.url(i[formato])} {i['w']}w" for i in itens if i.get(formato))
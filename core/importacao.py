@@ -0,0 +1,512 @@
+# core/importacao.py
+"""
+Motor de importação em lote de empresas (planilha CSV/XLSX).
+
+Em vez de 3 consultas + savepoint + get_or_create de tags por linha:
+
+- carrega uma vez os índices telefone/CNPJ/nome -> id das empresas existentes;
+- resolve todas as tags do arquivo com uma consulta (+ um bulk_create);
+- gera slugs em memória (core.slugs.AlocadorSlugs) contra os slugs já pré-carregados;
+- grava em blocos com bulk_create/bulk_update dentro de uma transação por bloco.
+
+Se um bloco falhar no banco (ex.: violação de unicidade), ele é refeito linha
+a linha para apontar exatamente quais linhas deram erro.
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import itertools
+import logging
+
+from django.db import DatabaseError, IntegrityError, models, transaction
+from django.utils import timezone
+
+from . import arvore_tags, cache_paginas, facets, geo, indice_facetas, mapa, search
+from .esquema_importacao import FORMATO_GOOGLE, FORMATO_PADRAO, detectar_formato, digitos, mapear_cabecalho
+from .models import Empresa, Tag, TagAncestral
+from .slugs import AlocadorSlugs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DESC = (
+    "Descrição ainda não informada. Este estabelecimento está em processo de "
+    "complementação de dados. Se você é o responsável, atualize as informações."
+)
+
+# Campos de Empresa que uma linha da planilha pode preencher
+CAMPOS_IMPORTAVEIS = {
+    f.name: f for f in Empresa._meta.concrete_fields
+    if f.editable and not f.primary_key and not isinstance(f, models.ForeignKey) and f.name != 'slug'
+}
+
+
+# ============================================================
+# Leitura da planilha
+# ============================================================
+
+TAMANHO_AMOSTRA = 64 * 1024
+
+
+def _detectar_codificacao(amostra: bytes) -> str:
+    """utf-8 (com ou sem BOM) quando a amostra decodifica; senão cp1252/latin-1 (Excel BR)."""
+    if amostra.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # incremental: um caractere multibyte cortado no fim da amostra não é erro
+        codecs.getincrementaldecoder("utf-8")().decode(amostra, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        pass
+    try:
+        amostra.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def _linhas_csv(file_obj):
+    bruto = getattr(file_obj, "file", file_obj)  # File do Django -> arquivo real
+    amostra = bruto.read(TAMANHO_AMOSTRA)
+    bruto.seek(0)
+    texto = io.TextIOWrapper(bruto, encoding=_detectar_codificacao(amostra), errors="replace", newline="")
+    try:
+        # TextIOWrapper decodifica em blocos; csv.reader consome linha a linha
+        yield from csv.reader(texto)
+    finally:
+        texto.detach()  # não fecha o arquivo de quem chamou
+
+
+def _linhas_xlsx(file_obj):
+    from openpyxl import load_workbook
+    # read_only: as linhas são lidas do XML sob demanda, sem montar a planilha em memória
+    wb = load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def ler_linhas(file_obj, filename):
+    """
+    Gera ``(numero_da_linha, [células em texto])`` sob demanda, de CSV ou XLSX,
+    com memória constante. Linhas totalmente vazias são puladas (mantendo a
+    numeração da planilha). A primeira linha gerada é o cabeçalho.
+    """
+    name = (filename or "").lower()
+    bruto = _linhas_csv(file_obj) if name.endswith(".csv") else _linhas_xlsx(file_obj)
+    for line_no, row in enumerate(bruto, start=1):
+        cells = ["" if c is None else str(c).strip() for c in row]
+        if any(cells):
+            yield line_no, cells
+
+
+def _parse_row_padrao(data):
+    """Extrai e normaliza dados de uma linha do modelo padrão."""
+    parsed = {
+        'nome': data.get('nome'),
+        'cnpj': digitos(data.get('cnpj')),
+        'telefone': digitos(data.get('telefone')),
+        'rua': data.get('rua'),
+        'cidade': data.get('cidade'),
+        'cep': digitos(data.get('cep')),
+        'descricao': data.get('descricao') or DEFAULT_DESC,
+        'horario_semana': data.get('horario_semana'),
+        'horario_sabado': data.get('horario_sabado'),
+        'horario_domingo': data.get('horario_domingo'),
+        'horario_observacoes': data.get('horario_observacoes'),
+        'tags': [name.strip() for name in data.get('categoria', '').split(',') if name.strip()],
+    }
+    return {k: v for k, v in parsed.items() if v or k == 'nome'}
+
+
+def _parse_row_google(data):
+    """
+    Extrai e normaliza dados de uma linha do Google Contacts, capturando todos os campos
+    não mapeados e adicionando-os à descrição.
+    """
+    parsed = {}
+    extra_descricao_parts = []
+    
+    # Lista de chaves que já têm um tratamento especial e não devem ser repetidas na descrição.
+    handled_keys = {
+        'google_nome_empresa', 'google_file_as', 'google_nome_contato', 'google_tag',
+        'google_email_1', 'google_email_2', 'google_telefones', 'google_telefone_1', 
+        'google_telefone_2', 'google_telefone_3', 'google_website_1', 'google_website_2',
+        'google_endereco_formatado', 'google_rua', 'google_cidade', 'google_cep', 'google_notas',
+        'google_custom_1_label', 'google_custom_1_value', 'google_custom_2_label', 
+        'google_custom_2_value', 'google_custom_3_label', 'google_custom_3_value',
+    }
+
+    # --- 1. MAPEAMENTO DE CAMPOS PRINCIPAIS ---
+    
+    # Nome da Empresa (com fallbacks)
+    parsed['nome'] = data.get('google_nome_empresa') or data.get('google_file_as') or data.get('google_nome_contato')
+    
+    # Tag (Primeiro Nome)
+    if data.get('google_tag'):
+        parsed['tags'] = [data.get('google_tag')]
+
+    # E-mail (pega o primeiro encontrado)
+    parsed['email'] = data.get('google_email_1') or data.get('google_email_2')
+
+    # Telefones (pega o primeiro para o campo principal, os outros vão para a descrição)
+    all_phones = [data.get('google_telefone_1', ''), data.get('google_telefone_2', ''), data.get('google_telefone_3', '')]
+    valid_phones = [phone for phone in all_phones if phone]
+    if valid_phones:
+        parsed['telefone'] = digitos(valid_phones[0])
+        if len(valid_phones) > 1:
+            extra_descricao_parts.append(f"Telefones Adicionais: {', '.join(valid_phones[1:])}")
+
+    # Endereço
+    parsed['rua'] = data.get('google_rua')
+    parsed['cidade'] = data.get('google_cidade')
+    parsed['cep'] = digitos(data.get('google_cep'))
+
+    # Websites (lógica para Instagram/Facebook)
+    website_url = data.get('google_website_1', '')
+    if 'instagram.com' in website_url: parsed['instagram'] = website_url
+    elif 'facebook.com' in website_url: parsed['facebook'] = website_url
+    elif website_url: parsed['site'] = website_url
+
+    # Campos Customizados (CNPJ e CADASTUR)
+    for i in range(1, 4):
+        label = data.get(f'google_custom_{i}_label', '').lower().strip()
+        value = data.get(f'google_custom_{i}_value', '').strip()
+        if label in ['cpf', 'cnpj', 'cpf ou cnpj']:
+            parsed['cnpj'] = digitos(value)
+        elif label == 'cadastur':
+            parsed['cadastrur'] = "Sim" if value.lower() in ['sim', 's'] else "Não"
+
+    # --- 2. CAPTURA DE TODOS OS CAMPOS NÃO MAPEADOS ---
+    
+    unmapped_data = []
+    for key, value in data.items():
+        if key not in handled_keys and value and 'label' not in key:
+            # Transforma a chave (ex: 'google_sobrenome') em um rótulo legível (ex: 'Sobrenome')
+            label_legivel = key.replace('google_', '').replace('_', ' ').title()
+            unmapped_data.append(f"{label_legivel}: {value}")
+    
+    # --- 3. MONTAGEM DA DESCRIÇÃO FINAL ---
+    
+    # Começa com o campo "Notas" do Google
+    descricao_final = data.get('google_notas', '')
+    
+    # Adiciona o endereço formatado, se existir
+    if data.get('google_endereco_formatado'):
+        descricao_final += f"\n\nEndereço Completo: {data.get('google_endereco_formatado')}"
+
+    # Adiciona a lista de telefones extras (se houver)
+    if any("Telefones Adicionais" in part for part in extra_descricao_parts):
+        descricao_final += "\n" + "\n".join(part for part in extra_descricao_parts if "Telefones Adicionais" in part)
+        
+    # Adiciona todos os outros campos não mapeados
+    if unmapped_data:
+        descricao_final += "\n\n--- Outras Informações ---\n"
+        descricao_final += "\n".join(unmapped_data)
+        
+    parsed['descricao'] = descricao_final or DEFAULT_DESC
+    
+    return parsed
+
+
+PARSERS = {FORMATO_PADRAO: _parse_row_padrao, FORMATO_GOOGLE: _parse_row_google}
+
+
+class ErroLinha(Exception):
+    """Erro de validação de uma linha (vira mensagem, não aborta o arquivo)."""
+
+
+class ErroArquivo(Exception):
+    """O arquivo inteiro não pode ser importado (vazio, formato ilegível...)."""
+
+
+class ImportadorEmpresas:
+    def __init__(self, user, lote=500):
+        self.user = user
+        self.lote = lote
+        self.criados = 0
+        self.atualizados = 0
+        self.sem_alteracao = 0
+        self.erros = 0
+        self.mensagens = []
+        self.linhas_processadas = 0
+        self.total_linhas = None
+
+        self._por_telefone = {}
+        self._por_cnpj = {}
+        self._por_nome = {}
+        self._slugs = AlocadorSlugs(Empresa)
+        self._tags = {}
+        self._carregado = False
+
+    # ------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------
+
+    def processar(self, linhas, parse, progresso=None):
+        """
+        ``linhas``: iterável de (numero_da_linha, dict canônico da planilha).
+        ``parse``: converte o dict canônico nos campos da empresa (+ 'tags').
+        ``progresso``: chamado com o importador depois de cada bloco gravado
+        (cada bloco já está commitado quando é chamado).
+        """
+        self._carregar_indices()
+        bloco = []
+        for line_no, data in linhas:
+            self.linhas_processadas += 1
+            try:
+                dados = parse(data)
+                if not dados.get('nome'):
+                    raise ErroLinha("O campo 'nome' é obrigatório.")
+            except Exception as e:
+                self._erro(line_no, f"Erro ao processar: {e}")
+                continue
+            bloco.append((line_no, dados))
+            if len(bloco) >= self.lote:
+                self._gravar_bloco(bloco)
+                bloco = []
+                if progresso:
+                    progresso(self)
+        if bloco:
+            self._gravar_bloco(bloco)
+        if progresso:
+            progresso(self)
+        return self
+
+    def resultado(self):
+        return {
+            "criados": self.criados,
+            "atualizados": self.atualizados,
+            "sem_alteracao": self.sem_alteracao,
+            "erros": self.erros,
+            "mensagens": self.mensagens,
+        }
+
+    # ------------------------------------------------------------
+    # Pré-carga
+    # ------------------------------------------------------------
+
+    def _carregar_indices(self):
+        if self._carregado:
+            return
+        linhas = Empresa.objects.order_by('-id').values_list('id', 'telefone', 'cnpj', 'nome', 'slug')
+        # ordem decrescente: o menor id sobrescreve, igual ao .first() de antes
+        for pk, telefone, cnpj, nome, slug in linhas.iterator(chunk_size=2000):
+            if telefone:
+                self._por_telefone[telefone] = pk
+            if cnpj:
+                self._por_cnpj[cnpj] = pk
+            if nome:
+                self._por_nome[nome.lower()] = pk
+            self._slugs.ocupar(slug)
+        self._slugs.marcar_tudo_carregado()
+        self._carregado = True
+
+    def _resolver_tags(self, nomes):
+        faltando = {n for n in nomes if n not in self._tags}
+        if not faltando:
+            return
+        existentes = dict(Tag.objects.filter(nome__in=faltando).values_list('nome', 'id'))
+        novas = [Tag(nome=n) for n in faltando if n not in existentes]
+        if novas:
+            Tag.objects.bulk_create(novas, ignore_conflicts=True)
+            criadas = dict(Tag.objects.filter(nome__in=[t.nome for t in novas]).values_list('nome', 'id'))
+            # bulk_create não passa pelo Tag.save(): as novas (raízes) entram no fechamento aqui
+            arvore_tags.inserir_raizes(TagAncestral, criadas.values())
+            existentes.update(criadas)
+            facets.invalidar()
+            indice_facetas.invalidar()
+        self._tags.update(existentes)
+
+    # ------------------------------------------------------------
+    # Gravação
+    # ------------------------------------------------------------
+
+    def _campos(self, dados):
+        campos = {}
+        for k, v in dados.items():
+            f = CAMPOS_IMPORTAVEIS.get(k)
+            if f is None:
+                continue
+            if isinstance(v, str) and getattr(f, 'max_length', None):
+                v = v[:f.max_length]
+            campos[k] = v
+        return campos
+
+    def _localizar(self, dados):
+        telefone = dados.get('telefone') or ''
+        cnpj = dados.get('cnpj') or ''
+        nome = dados.get('nome') or ''
+        return (
+            (telefone and self._por_telefone.get(telefone))
+            or (cnpj and self._por_cnpj.get(cnpj))
+            or self._por_nome.get(nome.lower())
+        )
+
+    def _registrar(self, alvo, campos):
+        if campos.get('telefone'):
+            self._por_telefone[campos['telefone']] = alvo
+        if campos.get('cnpj'):
+            self._por_cnpj[campos['cnpj']] = alvo
+        self._por_nome[campos['nome'].lower()] = alvo
+
+    def _planejar(self, bloco):
+        """Decide, em memória, o que criar/atualizar no bloco."""
+        ids = {self._localizar(d) for _, d in bloco}
+        existentes = Empresa.objects.in_bulk([i for i in ids if isinstance(i, int)])
+
+        novos, alterados, tags_por_empresa = [], {}, []
+        for line_no, dados in bloco:
+            nomes_tags = [n.strip() for n in dados.get('tags') or [] if n and n.strip()]
+            campos = self._campos(dados)
+            alvo = self._localizar(dados)
+            if isinstance(alvo, int):
+                alvo = existentes.get(alvo)
+
+            if alvo is None:
+                campos.setdefault('descricao', DEFAULT_DESC)
+                alvo = Empresa(user=self.user, **campos)
+                alvo.slug = self._slugs.alocar(alvo.nome)
+                alvo.geohash = geo.geohash_de(alvo.latitude, alvo.longitude)
+                novos.append((line_no, alvo))
+            else:
+                mudou = [c for c, v in campos.items() if getattr(alvo, c) != v]
+                for c in mudou:
+                    setattr(alvo, c, campos[c])
+                if {'latitude', 'longitude'} & set(mudou):
+                    # bulk_update não passa pelo save(): mantém o geohash em dia
+                    alvo.geohash = geo.geohash_de(alvo.latitude, alvo.longitude)
+                    mudou.append('geohash')
+                if mudou:
+                    alvo.updated_at = timezone.now()
+                    mudou.append('updated_at')
+                if alvo.pk is not None:
+                    if mudou:
+                        alterados.setdefault(alvo.pk, (line_no, alvo, set()))[2].update(mudou)
+                    elif alvo.pk not in alterados:
+                        self.sem_alteracao += 1
+            self._registrar(alvo, campos)
+            if nomes_tags:
+                tags_por_empresa.append((alvo, nomes_tags))
+        return novos, list(alterados.values()), tags_por_empresa
+
+    def _gravar_bloco(self, bloco):
+        self._resolver_tags({n.strip() for _, d in bloco for n in d.get('tags') or [] if n and n.strip()})
+        sem_alteracao_antes = self.sem_alteracao
+        novos = []
+        try:
+            with transaction.atomic():
+                novos, alterados, tags_por_empresa = self._planejar(bloco)
+                Empresa.objects.bulk_create([e for _, e in novos])
+                if alterados:
+                    campos = sorted(set().union(*(c for _, _, c in alterados)))
+                    Empresa.objects.bulk_update([e for _, e, _ in alterados], campos)
+                self._gravar_tags(tags_por_empresa)
+        except DatabaseError as e:
+            logger.info("Bloco de importação com conflito, refazendo linha a linha: %s", e)
+            self.sem_alteracao = sem_alteracao_antes
+            self._normalizar_registros(descartar=[emp for _, emp in novos])
+            self._gravar_linha_a_linha(bloco)
+            return
+
+        self._normalizar_registros()
+        self.criados += len(novos)
+        self.atualizados += len(alterados)
+        self._pos_gravacao([e for _, e in novos] + [e for _, e, _ in alterados]
+                           + [e for e, _ in tags_por_empresa])
+
+    def _gravar_linha_a_linha(self, bloco):
+        for line_no, dados in bloco:
+            novos = []
+            try:
+                with transaction.atomic():
+                    novos, alterados, tags_por_empresa = self._planejar([(line_no, dados)])
+                    for _, emp in novos:
+                        emp.save()
+                    for _, emp, campos in alterados:
+                        emp.save(update_fields=sorted(campos))
+                    self._gravar_tags(tags_por_empresa)
+            except Exception as e:
+                self._normalizar_registros(descartar=[emp for _, emp in novos])
+                if isinstance(e, IntegrityError):
+                    self._erro(line_no, f"Erro de integridade. Provavelmente um CNPJ duplicado não identificado. Detalhe: {e}")
+                else:
+                    self._erro(line_no, f"Erro ao processar: {e}")
+                continue
+            self._normalizar_registros()
+            self.criados += len(novos)
+            self.atualizados += len(alterados)
+            if tags_por_empresa:
+                search.indexar([e.pk for e, _ in tags_por_empresa])
+                indice_facetas.invalidar()
+
+    def _gravar_tags(self, tags_por_empresa):
+        # mesma semântica de emp.tags.set(): substitui as tags de cada empresa
+        desejado = {}
+        for emp, nomes in tags_por_empresa:
+            desejado[emp.pk] = {self._tags[n] for n in nomes if n in self._tags}
+        if not desejado:
+            return
+        Through = Empresa.tags.through
+        atual = {}
+        for eid, tid in Through.objects.filter(empresa_id__in=desejado.keys()).values_list('empresa_id', 'tag_id'):
+            atual.setdefault(eid, set()).add(tid)
+        Empresa.tocar(eid for eid, tids in desejado.items() if atual.get(eid, set()) != tids)
+        Through.objects.filter(empresa_id__in=desejado.keys()).delete()
+        Through.objects.bulk_create(
+            [Through(empresa_id=eid, tag_id=tid) for eid, tids in desejado.items() for tid in tids],
+            ignore_conflicts=True,
+        )
+
+    def _normalizar_registros(self, descartar=()):
+        """
+        Entre blocos os índices guardam só ids. Objetos de um bloco que falhou
+        são descartados (novos) ou voltam a ser id (existentes, recarregados
+        do banco na próxima vez).
+        """
+        descartar = {id(e) for e in descartar}
+        for indice in (self._por_telefone, self._por_cnpj, self._por_nome):
+            for k, v in list(indice.items()):
+                if not isinstance(v, Empresa):
+                    continue
+                if id(v) in descartar or v.pk is None:
+                    del indice[k]
+                else:
+                    indice[k] = v.pk
+
+    def _pos_gravacao(self, empresas):
+        # bulk_create/bulk_update não disparam signals: mantém índice, facetas,
+        # mapa e páginas em cache em dia
+        search.indexar({e.pk for e in empresas})
+        facets.invalidar()
+        indice_facetas.invalidar()  # remonta na próxima leitura (três consultas)
+        mapa.invalidar()
+        cache_paginas.invalidar_empresas(e.slug for e in empresas)
+
+    def _erro(self, line_no, msg):
+        self.erros += 1
+        self.mensagens.append(f"Linha {line_no}: {msg}")
+
+
+def importar_arquivo(file_obj, filename, user, progresso=None, lote=500):
+    """
+    Lê a planilha (modelo padrão ou exportação do Google Contacts) e importa
+    com ``ImportadorEmpresas``. Levanta ``ErroArquivo`` se não houver linhas.
+    """
+    planilha = ler_linhas(file_obj, filename)
+    _, headers_raw = next(planilha, (None, None))
+    primeira = next(planilha, None)
+    if headers_raw is None or primeira is None:
+        raise ErroArquivo("Arquivo vazio.")
+
+    header_map = mapear_cabecalho(headers_raw)
+    parse = PARSERS[detectar_formato(header_map)]
+
+    def linhas():
+        for line_no, r in itertools.chain([primeira], planilha):
+            yield line_no, {canon: r[idx] for idx, canon in header_map.items() if idx < len(r)}
+
+    importador = ImportadorEmpresas(user, lote=lote)
+    return importador.processar(linhas(), parse, progresso=progresso)
@@ -0,0 +1,335 @@
+# core/indice_facetas.py
+"""
+Índice de facetas em memória: bitsets de ids de empresa por tag e por cidade.
+
+Cada conjunto é um ``int`` do Python usado como bitset (bit ``n`` ligado =
+empresa de id ``n``), então E/OU entre tags é ``&``/``|`` e a contagem é
+``bit_count()`` — microssegundos, sem tocar no banco. A listagem pega os ids
+da página direto do bitset (maior id primeiro, a mesma ordem ``-id``) e o
+SQL só busca essas empresas.
+
+Cada processo tem o seu índice, montado sob demanda (três consultas) e
+marcado com a versão compartilhada (``CacheVersionado("indice_facetas")``):
+
+- os signals (``core.signals``) refazem só as empresas/tags alteradas
+  (``atualizar_empresas``/``remover_empresas``/``atualizar_tags``), na hora e
+  de novo depois do commit, quando a versão avança e os outros processos
+  remontam o índice deles;
+- gravações em lote que não passam pelos signals chamam ``invalidar()``.
+
+Uma atualização feita dentro de uma transação que acabou em rollback nunca
+chega ao ``on_commit``; a próxima leitura fora de transação percebe a
+pendência e remonta o índice.
+
+Memória: cada bitset ocupa até ``maior_id / 8`` bytes (o bit mais alto ligado
+define o tamanho), e há um por tag, um por cidade e um por tag com subtags
+já consultada. Por worker, no pior caso, (2 × tags + cidades) × maior_id / 8:
+com 100 mil ids, 500 tags e 200 cidades, ~15 MB. Ids esparsos (muitas
+empresas apagadas) contam pelo maior id, não pelo total. O cache de
+``com_subtags`` só guarda o que foi pedido e é esvaziado a cada mudança.
+
+Só a listagem sem busca nem "perto de mim" pagina pelo bitset; a busca e a
+proximidade filtram tag/cidade em SQL (``_restringir`` em ``core.views``), já
+que os ids de uma tag ampla não cabem como parâmetros de uma consulta.
+"""
+from __future__ import annotations
+
+import threading
+from itertools import count
+
+from django.db import transaction
+
+from .cache_versionado import CacheVersionado
+from .pagination import PaginaCursor, cursor_apos, posicao_do_cursor
+
+MODO_OU = "ou"
+MODO_E = "e"
+ORDENACAO = ("-id",)
+
+_versao = CacheVersionado("indice_facetas")
+_lock = threading.RLock()
+_tokens = count(1)
+
+
+def chave_cidade(cidade) -> str:
+    return (cidade or "").strip().casefold()
+
+
+def _bitset(ids) -> int:
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, "little")
+
+
+class _Indice:
+    def __init__(self):
+        self.versao = None
+        self.todas = 0
+        self.por_tag = {}       # tag_id -> bitset (só a tag, sem subtags)
+        self.por_cidade = {}    # chave_cidade -> bitset
+        self.cidade_de = {}     # empresa_id -> chave_cidade
+        self.descendentes = {}  # tag_id -> [ela mesma e as subtags]
+        self.pendentes = set()  # atualizações ainda sem commit
+        self._com_subtags = {}
+
+    # --------------------------------------------------------
+    # Montagem
+    # --------------------------------------------------------
+
+    def montar(self, versao):
+        from .models import Empresa
+        cidades, ids_por_tag, ids_por_cidade = {}, {}, {}
+        for pk, cidade in Empresa.objects.values_list("id", "cidade").iterator(chunk_size=5000):
+            chave = chave_cidade(cidade)
+            cidades[pk] = chave
+            if chave:
+                ids_por_cidade.setdefault(chave, []).append(pk)
+        Through = Empresa.tags.through
+        for tag_id, empresa_id in Through.objects.values_list("tag_id", "empresa_id").iterator(chunk_size=5000):
+            ids_por_tag.setdefault(tag_id, []).append(empresa_id)
+
+        self.todas = _bitset(cidades)
+        self.cidade_de = cidades
+        self.por_cidade = {c: _bitset(ids) for c, ids in ids_por_cidade.items()}
+        self._carregar_descendentes()
+        self.por_tag = {t: _bitset(ids_por_tag.get(t, ())) for t in self.descendentes}
+        self.pendentes = set()
+        self._com_subtags = {}
+        self.versao = versao
+
+    def _carregar_descendentes(self):
+        # de Tag.parent, e não de TagAncestral: no post_save de uma tag nova o
+        # fechamento dela ainda não foi gravado (Tag.save grava depois)
+        from .models import Tag
+        filhos = {}
+        for tag_id, parent_id in Tag.objects.values_list("id", "parent_id"):
+            filhos.setdefault(tag_id, [])
+            filhos.setdefault(parent_id, []).append(tag_id)
+        self.descendentes = {}
+        for tag_id in filhos:
+            if tag_id is None:
+                continue
+            descendentes, pilha = [], [tag_id]
+            while pilha:
+                atual = pilha.pop()
+                if atual in descendentes:
+                    continue
+                descendentes.append(atual)
+                pilha.extend(filhos.get(atual, ()))
+            self.descendentes[tag_id] = descendentes
+
+    # --------------------------------------------------------
+    # Atualização incremental
+    # --------------------------------------------------------
+
+    def _tirar(self, empresa_id):
+        mascara = ~(1 << empresa_id)
+        self.todas &= mascara
+        chave = self.cidade_de.pop(empresa_id, "")
+        if chave in self.por_cidade:
+            self.por_cidade[chave] &= mascara
+            if not self.por_cidade[chave]:
+                del self.por_cidade[chave]
+        for tag_id, bits in self.por_tag.items():
+            if bits >> empresa_id & 1:
+                self.por_tag[tag_id] = bits & mascara
+
+    def atualizar_empresas(self, ids):
+        from .models import Empresa
+        ids = {i for i in ids if i}
+        if not ids:
+            return
+        linhas = dict(Empresa.objects.filter(id__in=ids).values_list("id", "cidade"))
+        tags = Empresa.tags.through.objects.filter(empresa_id__in=linhas).values_list("empresa_id", "tag_id")
+        for pk in ids:
+            self._tirar(pk)
+        for pk, cidade in linhas.items():
+            bit = 1 << pk
+            self.todas |= bit
+            chave = chave_cidade(cidade)
+            self.cidade_de[pk] = chave
+            if chave:
+                self.por_cidade[chave] = self.por_cidade.get(chave, 0) | bit
+        for pk, tag_id in tags:
+            self.por_tag[tag_id] = self.por_tag.get(tag_id, 0) | (1 << pk)
+        self._com_subtags = {}
+
+    def remover_empresas(self, ids):
+        for pk in ids:
+            self._tirar(pk)
+        self._com_subtags = {}
+
+    def atualizar_tags(self):
+        self._carregar_descendentes()
+        self.por_tag = {t: self.por_tag.get(t, 0) for t in self.descendentes}
+        self._com_subtags = {}
+
+    # --------------------------------------------------------
+    # Consultas
+    # --------------------------------------------------------
+
+    def com_subtags(self, tag_id) -> int:
+        """Bitset da tag ou de qualquer subtag dela (mesma regra do filtro em SQL)."""
+        if tag_id not in self._com_subtags:
+            bits = 0
+            for descendente in self.descendentes.get(tag_id, ()):
+                bits |= self.por_tag.get(descendente, 0)
+            self._com_subtags[tag_id] = bits
+        return self._com_subtags[tag_id]
+
+
+_indice = _Indice()
+
+
+def _atual() -> _Indice:
+    versao = _versao.versao()
+    with _lock:
+        rollback = _indice.pendentes and not transaction.get_connection().in_atomic_block
+        if _indice.versao != versao or rollback:
+            _indice.montar(versao)
+        return _indice
+
+
+# ============================================================
+# Manutenção (chamada pelos signals)
+# ============================================================
+
+versao = _versao.versao
+
+
+def invalidar():
+    _versao.invalidar()
+
+
+def _aplicar(funcao, *args):
+    """Aplica já (a transação enxerga a mudança) e de novo depois do commit."""
+    token = next(_tokens)
+    with _lock:
+        # não montado ainda: a primeira leitura monta do banco
+        if _indice.versao is not None:
+            _indice.pendentes.add(token)
+            getattr(_indice, funcao)(*args)
+
+    def depois_do_commit():
+        with _lock:
+            _indice.pendentes.discard(token)
+            em_dia = _indice.versao is not None and _indice.versao == _versao.versao()
+            if em_dia:
+                getattr(_indice, funcao)(*args)
+            _versao.invalidar()
+            # os outros processos remontam; este já está em dia
+            if em_dia:
+                _indice.versao = _versao.versao()
+
+    transaction.on_commit(depois_do_commit)
+
+
+def atualizar_empresas(ids):
+    _aplicar("atualizar_empresas", list(ids))
+
+
+def remover_empresas(ids):
+    _aplicar("remover_empresas", list(ids))
+
+
+def atualizar_tags():
+    _aplicar("atualizar_tags")
+
+
+# ============================================================
+# Consultas
+# ============================================================
+
+def todas() -> int:
+    return _atual().todas
+
+
+def filtrar(tag_ids=(), cidade=None, modo=MODO_OU):
+    """Bitset das empresas com as tags (OU/E, cada uma com subtags) e a cidade; None sem filtros."""
+    tag_ids = [int(t) for t in tag_ids if str(t).strip().isdigit()]
+    chave = chave_cidade(cidade)
+    if not tag_ids and not chave:
+        return None
+    with _lock:
+        indice = _atual()
+        bits = indice.todas
+        if tag_ids:
+            conjuntos = [indice.com_subtags(t) for t in tag_ids]
+            if modo == MODO_E:
+                for conjunto in conjuntos:
+                    bits &= conjunto
+            else:
+                uniao = 0
+                for conjunto in conjuntos:
+                    uniao |= conjunto
+                bits &= uniao
+        if chave:
+            bits &= indice.por_cidade.get(chave, 0)
+        return bits
+
+
+def contar(bits) -> int:
+    return bits.bit_count()
+
+
+def contem(bits, empresa_id) -> bool:
+    return bool(bits >> empresa_id & 1)
+
+
+def contagens(bits=None) -> dict:
+    """
+    Quantas empresas de ``bits`` (None = todas) cada tag (com subtags) e cada
+    cidade devolveria: {"tags": {tag_id: n}, "cidades": {chave_cidade: n}}.
+    """
+    with _lock:
+        indice = _atual()
+        base = indice.todas if bits is None else bits
+        return {
+            "tags": {t: (base & indice.com_subtags(t)).bit_count() for t in indice.descendentes},
+            "cidades": {c: (base & b).bit_count() for c, b in indice.por_cidade.items()},
+        }
+
+
+def ids(bits, abaixo=None, pular=0, limite=None) -> list[int]:
+    """Ids de ``bits`` do maior para o menor, só os < ``abaixo``, pulando ``pular``."""
+    if abaixo is not None:
+        # acima do maior id o corte não muda nada: não aloca a máscara inteira
+        bits &= (1 << min(max(abaixo, 0), bits.bit_length())) - 1
+    resultado = []
+    while bits and (limite is None or len(resultado) < pular + limite):
+        maior = bits.bit_length() - 1
+        resultado.append(maior)
+        bits ^= 1 << maior
+    return resultado[pular:]
+
+
+def pagina(bits, cursor, por_pagina) -> PaginaCursor:
+    """Uma página de ids (ordem ``-id``) no mesmo formato de cursor de ``paginar_por_cursor``."""
+    chave, deslocamento = posicao_do_cursor(cursor, ORDENACAO)
+    if chave and (isinstance(chave[0], bool) or not isinstance(chave[0], int)):
+        chave = None  # cursor adulterado: primeira página
+    itens = ids(bits, abaixo=chave[0] if chave else None, pular=deslocamento, limite=por_pagina + 1)
+    proximo = cursor_apos({"id": itens[por_pagina - 1]}, ORDENACAO) if len(itens) > por_pagina else None
+    return PaginaCursor(itens[:por_pagina], proximo)
+
+
+class ListaDoBitset:
+    """Sequência para o ``Paginator``: ``len`` vem do bitset e cada fatia carrega só os seus ids."""
+
+    def __init__(self, bits, carregar):
+        self.bits = bits
+        self.carregar = carregar
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __getitem__(self, fatia):
+        if not isinstance(fatia, slice):
+            return self[fatia:fatia + 1][0]
+        inicio = fatia.start or 0
+        limite = None if fatia.stop is None else max(fatia.stop - inicio, 0)
+        return self.carregar(ids(self.bits, pular=inicio, limite=limite))
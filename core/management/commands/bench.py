@@ -0,0 +1,216 @@
+# core/management/commands/bench.py
+import json
+import logging
+import random
+import re
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, fields
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import catalogo_sintetico, pagination
+from core.models import Empresa, Tag
+
+RE_CONSULTAS = re.compile(r'db;dur=[\d.]+;desc="(\d+) consultas"')
+TERMOS_BUSCA = ["pousada", "restaurante mar", "farol", "lagoa azul", "cafe colonial"]
+AMOSTRA = 500
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, round(p * len(ordenados) + 0.5) - 1))]
+
+
+def _commit():
+    try:
+        saida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return saida.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = ('Monta um catálogo sintético num banco de teste descartável e mede as views mais usadas '
+            '(p50/p95, consultas e pico de memória por cenário), com saída em JSON para comparar commits.')
+
+    def add_arguments(self, parser):
+        padrao = catalogo_sintetico.Tamanho()
+        for campo in fields(catalogo_sintetico.Tamanho):
+            parser.add_argument(f'--{campo.name}', type=int, default=getattr(padrao, campo.name),
+                                help=f'Quantidade de {campo.name} sintéticos (default: {getattr(padrao, campo.name)}).')
+        parser.add_argument('--repeticoes', type=int, default=30, help='Requisições medidas por cenário (default: 30).')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do catálogo e dos parâmetros (default: 42).')
+        parser.add_argument('--saida', help='Grava o JSON também neste arquivo.')
+        parser.add_argument('--cenario', action='append', dest='cenarios',
+                            help='Mede só este cenário (pode repetir).')
+        parser.add_argument('--cache-paginas', action='store_true',
+                            help='Mantém o cache de páginas anônimas ligado (padrão: medir as views).')
+        parser.add_argument('--banco-atual', action='store_true',
+                            help='Usa o banco configurado em vez de um banco de teste descartável '
+                                 '(os dados sintéticos ficam lá; com --empresas 0 mede o catálogo existente).')
+
+    def handle(self, *args, **options):
+        tamanho = catalogo_sintetico.Tamanho(
+            **{campo.name: options[campo.name] for campo in fields(catalogo_sintetico.Tamanho)}
+        )
+        nome_original = None
+        if not options['banco_atual']:
+            self.stderr.write("Criando banco de teste...")
+            nome_original = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        # cache só do benchmark: versões e páginas do catálogo sintético não
+        # podem ir para o cache compartilhado de produção
+        medicao = logging.getLogger("core.medicao")
+        nivel = medicao.level
+        medicao.setLevel(logging.WARNING)
+        try:
+            with override_settings(
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench"}},
+                CACHE_PAGINAS=options['cache_paginas'],
+                SERVER_TIMING=True,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ):
+                resultado = self._medir(tamanho, options)
+        finally:
+            medicao.setLevel(nivel)
+            if nome_original is not None:
+                connection.creation.destroy_test_db(nome_original, verbosity=0)
+
+        saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(saida + "\n")
+        self.stdout.write(saida)
+
+    # --------------------------------------------------------
+    # Catálogo e cenários
+    # --------------------------------------------------------
+
+    def _medir(self, tamanho, options):
+        catalogo = {"semente": options['semente'], **asdict(tamanho)}
+        if tamanho.empresas > 0:
+            self.stderr.write("Gerando catálogo sintético...")
+            inicio = time.perf_counter()
+            catalogo["criados"] = catalogo_sintetico.gerar(
+                tamanho, options['semente'], progresso=lambda etapa: self.stderr.write(f"  {etapa}...")
+            )
+            catalogo["geracao_s"] = round(time.perf_counter() - inicio, 2)
+        if not Empresa.objects.exists():
+            raise CommandError("Nenhuma empresa no banco para medir.")
+
+        cenarios = self._cenarios(random.Random(options['semente']))
+        if options['cenarios']:
+            desconhecidos = set(options['cenarios']) - set(cenarios)
+            if desconhecidos:
+                raise CommandError(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}.")
+            cenarios = {nome: cenarios[nome] for nome in options['cenarios']}
+
+        anonimo, logado = Client(), Client()
+        usuario = User.objects.filter(perfil__favoritos__isnull=False).order_by('id').first() \
+            or User.objects.order_by('id').first()
+        logado.force_login(usuario)
+
+        resultados = {}
+        for nome, (precisa_login, requisicao) in cenarios.items():
+            self.stderr.write(f"Medindo {nome}...")
+            resultados[nome] = self._medir_cenario(logado if precisa_login else anonimo, requisicao,
+                                                   options['repeticoes'])
+        return {
+            "commit": _commit(),
+            "data": timezone.now().isoformat(),
+            "banco": connection.vendor,
+            "catalogo": catalogo,
+            "repeticoes": options['repeticoes'],
+            "cenarios": resultados,
+        }
+
+    def _cenarios(self, rng):
+        """{nome: (precisa_login, () -> (método, url, params))}; parâmetros sorteados a cada chamada."""
+        slugs = list(Empresa.objects.order_by('id').values_list('slug', flat=True))
+        slugs = rng.sample(slugs, min(len(slugs), AMOSTRA))
+        tags = list(Tag.objects.filter(empresas__isnull=False).distinct().order_by('id').values_list('id', flat=True))
+        cidades = sorted(set(Empresa.objects.exclude(cidade='').values_list('cidade', flat=True).distinct()))
+        total = Empresa.objects.count()
+        ids = Empresa.objects.order_by('id').values_list('id', flat=True)
+        # 80% do catálogo para trás na ordem -id
+        id_profundo = ids[total // 5]
+        pagina_profunda = max(1, int(total / 12 * 0.8))
+        cursor_profundo = pagination.cursor_apos({"id": id_profundo}, ("-id",))
+
+        listar = reverse('listar_empresas')
+
+        def get(url, **params):
+            return lambda: ("get", url, {k: (v() if callable(v) else v) for k, v in params.items()})
+
+        def sorteio(opcoes):
+            return (lambda: rng.choice(opcoes)) if opcoes else ""
+
+        tag, cidade, termo = sorteio(tags), sorteio(cidades), sorteio(TERMOS_BUSCA)
+        return {
+            "home": (False, get(reverse('home'))),
+            "home_logado": (True, get(reverse('home'))),
+            "listar_empresas": (False, get(listar)),
+            "listar_empresas_logado": (True, get(listar)),
+            "listar_empresas_busca": (False, get(listar, q=termo)),
+            "listar_empresas_tag": (False, get(listar, tag=tag)),
+            "listar_empresas_cidade": (False, get(listar, cidade=cidade)),
+            "listar_empresas_pagina_profunda": (False, get(listar, page=pagina_profunda)),
+            "listar_empresas_json": (False, get(listar, ajax="1")),
+            "listar_empresas_json_busca": (False, get(listar, ajax="1", q=termo)),
+            "listar_empresas_json_tag": (False, get(listar, ajax="1", tag=tag)),
+            "listar_empresas_json_cursor_profundo": (False, get(listar, ajax="1", cursor=cursor_profundo)),
+            "empresa_detalhe": (False, lambda: ("get", reverse('empresa_detalhe', args=[rng.choice(slugs)]), {})),
+            "empresa_detalhe_logado": (True, lambda: ("get", reverse('empresa_detalhe', args=[rng.choice(slugs)]), {})),
+            "filtros_empresas": (False, get(reverse('filtros_empresas'), tag=tag)),
+            "toggle_favorito": (True, lambda: ("post", reverse('toggle_favorito', args=[rng.choice(slugs)]), {})),
+        }
+
+    # --------------------------------------------------------
+    # Medição
+    # --------------------------------------------------------
+
+    def _medir_cenario(self, client, requisicao, repeticoes):
+        def executar():
+            metodo, url, params = requisicao()
+            return getattr(client, metodo)(url, params)
+
+        executar()  # aquece caches de processo (facetas, índice, templates)
+        tempos, consultas, status = [], [], set()
+        for _ in range(max(repeticoes, 1)):
+            inicio = time.perf_counter()
+            response = executar()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            status.add(response.status_code)
+            achado = RE_CONSULTAS.search(response.get("Server-Timing", ""))
+            if achado:
+                consultas.append(int(achado.group(1)))
+
+        # memória numa passada à parte: o tracemalloc distorce os tempos
+        tracemalloc.start()
+        try:
+            executar()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "p50_ms": round(_percentil(tempos, 0.50), 2),
+            "p95_ms": round(_percentil(tempos, 0.95), 2),
+            "media_ms": round(sum(tempos) / len(tempos), 2),
+            "consultas": max(consultas) if consultas else None,
+            "memoria_pico_kb": round(pico / 1024, 1),
+            "status": sorted(status),
+        }
@@ -0,0 +1,50 @@
+# core/management/commands/gerar_derivados_imagens.py
+from django.core.management.base import BaseCommand
+
+from core import imagens
+from core.models import ImagemEmpresa, PerfilUsuario
+
+
+class Command(BaseCommand):
+    help = ('Gera as versões redimensionadas (WebP/JPEG) das imagens de empresas e avatares '
+            'enviados antes do pipeline de derivados.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true',
+                            help='Regera também as imagens que já têm derivados.')
+
+    def handle(self, *args, **options):
+        qs = ImagemEmpresa.objects.exclude(imagem='').order_by('id')
+        if not options['todas']:
+            qs = qs.filter(derivados={})
+        feitas = falhas = 0
+        for img in qs.iterator(chunk_size=100):
+            try:
+                img.gerar_derivados()
+            except OSError as e:
+                falhas += 1
+                self.stderr.write(f"Imagem #{img.pk}: {e}")
+                continue
+            ImagemEmpresa.objects.filter(pk=img.pk).update(
+                largura=img.largura, altura=img.altura, derivados=img.derivados
+            )
+            feitas += 1
+
+        perfis = PerfilUsuario.objects.exclude(avatar='').exclude(avatar__isnull=True).order_by('id')
+        if not options['todas']:
+            perfis = perfis.filter(avatar_derivados={})
+        for perfil in perfis.iterator(chunk_size=100):
+            try:
+                with perfil.avatar.open('rb') as original:
+                    _, _, derivados = imagens.gerar(
+                        original, perfil.avatar.storage, 'avatars', imagens.RENDICOES_AVATAR
+                    )
+            except OSError as e:
+                falhas += 1
+                self.stderr.write(f"Avatar do perfil #{perfil.pk}: {e}")
+                continue
+            imagens.remover(perfil.avatar_derivados, perfil.avatar.storage)
+            PerfilUsuario.objects.filter(pk=perfil.pk).update(avatar_derivados=derivados)
+            feitas += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{feitas} imagem(ns) processada(s), {falhas} falha(s)."))
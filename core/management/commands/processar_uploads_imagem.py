@@ -0,0 +1,26 @@
+# core/management/commands/processar_uploads_imagem.py
+from django.core.management.base import BaseCommand
+
+from core import fila_imagens
+from core.models import UploadImagem
+
+
+class Command(BaseCommand):
+    help = ('Processa as imagens da galeria que ficaram na fila (UploadImagem pendente), '
+            'por exemplo depois de o processo web reiniciar no meio do processamento.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--travado-minutos', type=int, default=30,
+                            help='Uploads "processando" há mais tempo que isso voltam para a fila (default: 30).')
+
+    def handle(self, *args, **options):
+        recolocados = fila_imagens.recolocar_travados(options['travado_minutos'])
+        if recolocados:
+            self.stdout.write(self.style.WARNING(f"{recolocados} upload(s) travado(s) recolocado(s) na fila."))
+
+        pendentes = list(
+            UploadImagem.objects.filter(status=UploadImagem.PENDENTE).values_list('pk', flat=True)
+        )
+        for pk in pendentes:
+            fila_imagens.processar(pk)
+        self.stdout.write(self.style.SUCCESS(f"{len(pendentes)} upload(s) processado(s)."))
@@ -0,0 +1,20 @@
+# core/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de busca textual das empresas (FTS5 no SQLite, tsvector no PostgreSQL).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Empresas por lote (default: 500).')
+
+    def handle(self, *args, **options):
+        if not search.suportado():
+            self.stdout.write(self.style.WARNING("Banco sem suporte a índice textual; a busca usa icontains."))
+            return
+
+        self.stdout.write("Reconstruindo índice de busca...")
+        total = search.reindexar_tudo(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"Índice reconstruído! {total} empresas indexadas."))
@@ -0,0 +1,18 @@
+# core/management/commands/recalcular_avaliacoes.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Empresa, Avaliacao, recalcular_avaliacoes_em_lote
+
+
+class Command(BaseCommand):
+    help = 'Recalcula nota média, total e histograma de avaliações de todas as empresas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Empresas por bulk_update (default: 1000).')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Recalculando agregados de avaliação...")
+        with transaction.atomic():
+            total = recalcular_avaliacoes_em_lote(Empresa, Avaliacao, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"Operação concluída! {total} empresas atualizadas."))
@@ -0,0 +1,39 @@
+# core/management/commands/run_import_worker.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import fila_importacao
+
+
+class Command(BaseCommand):
+    help = ('Processa a fila de importações de planilha (ImportacaoJob) consultando o banco. '
+            'Use com IMPORTACAO_EXECUTOR=worker.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos entre consultas quando a fila está vazia (default: 2).')
+        parser.add_argument('--uma-vez', action='store_true',
+                            help='Esvazia a fila e termina, em vez de ficar escutando.')
+        parser.add_argument('--travado-minutos', type=int, default=None,
+                            help='Jobs "processando" há mais tempo que isso voltam para a fila '
+                                 '(default: settings.IMPORTACAO_TRAVADO_MINUTOS).')
+
+    def handle(self, *args, **options):
+        recolocados = fila_importacao.recolocar_travados(options['travado_minutos'])
+        if recolocados:
+            self.stdout.write(self.style.WARNING(f"{recolocados} job(s) travado(s) recolocado(s) na fila."))
+
+        self.stdout.write("Aguardando importações...")
+        while True:
+            close_old_connections()
+            job_id = fila_importacao.reivindicar_proximo()
+            if job_id is None:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+            self.stdout.write(f"Processando importação #{job_id}...")
+            fila_importacao.executar(job_id)
+            self.stdout.write(self.style.SUCCESS(f"Importação #{job_id} finalizada."))
@@ -0,0 +1,56 @@
+# core/management/commands/seed_catalog.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import catalogo_sintetico
+
+
+class Command(BaseCommand):
+    help = ('Popula o banco com um catálogo sintético (usuários, tags, empresas, avaliações, favoritos e '
+            'imagens) para testes de carga, gravando em lotes sem passar pelos signals.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresas', type=int, default=1000, help='Empresas (default: 1000).')
+        parser.add_argument('--users', '--usuarios', dest='usuarios', type=int, default=200,
+                            help='Usuários, cada um com perfil e CPF válido (default: 200).')
+        parser.add_argument('--reviews', '--avaliacoes', dest='avaliacoes', type=int, default=10000,
+                            help='Avaliações, no máximo uma por usuário e empresa (default: 10000).')
+        parser.add_argument('--tags', type=int, default=100, help='Tags em até três níveis (default: 100).')
+        parser.add_argument('--favoritos', type=int, default=2000, help='Favoritos (default: 2000).')
+        parser.add_argument('--imagens', type=int, default=None,
+                            help='Linhas de imagem, sem arquivo (default: uma capa por empresa).')
+        parser.add_argument('--semente', type=int, default=42, help='Mesma semente, mesmos dados (default: 42).')
+        parser.add_argument('--forcar', action='store_true', help='Permite rodar com DEBUG=False.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forcar']:
+            raise CommandError("DEBUG=False: isto parece produção. Use --forcar se for mesmo o que você quer.")
+
+        tamanho = catalogo_sintetico.Tamanho(
+            empresas=options['empresas'],
+            usuarios=options['usuarios'],
+            avaliacoes=options['avaliacoes'],
+            tags=options['tags'],
+            favoritos=options['favoritos'],
+            imagens=options['empresas'] if options['imagens'] is None else options['imagens'],
+        )
+        inicio = anterior = time.perf_counter()
+        etapa_atual = None
+
+        def progresso(etapa):
+            nonlocal anterior, etapa_atual
+            agora = time.perf_counter()
+            if etapa_atual:
+                self.stdout.write(f"  {etapa_atual}: {agora - anterior:.1f}s")
+            self.stdout.write(f"{etapa}...")
+            anterior, etapa_atual = agora, etapa
+
+        criados = catalogo_sintetico.gerar(tamanho, options['semente'], progresso=progresso)
+        self.stdout.write(f"  {etapa_atual}: {time.perf_counter() - anterior:.1f}s")
+
+        resumo = ", ".join(f"{n} {nome}" for nome, n in criados.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Catálogo sintético gravado em {time.perf_counter() - inicio:.1f}s: {resumo}."
+        ))
@@ -0,0 +1,191 @@
+# core/mapa.py
+"""
+Mapa da cidade com todos os pontos, agrupados no servidor.
+
+Para cada nível de zoom os pontos são agrupados numa grade em pixels da
+projeção Web Mercator (a mesma do Leaflet), com células de ``RAIO_PX``:
+cada célula com mais de um ponto vira um cluster (centroide + quantidade).
+O índice de cada zoom (célula -> cluster) é montado uma vez, sob demanda, e
+guardado via ``core.cache_versionado``; salvar ou excluir uma Empresa
+invalida todos os zooms (``invalidar()``, chamado pelos signals).
+
+Uma requisição de pan/zoom só percorre as células que caem no retângulo
+visível, então o custo não depende do total de pontos.
+
+O retângulo pedido tem de caber numa tela (``TELA_MAXIMA_PX``) no zoom
+informado; se não couber (bbox grande com zoom alto), o zoom é reduzido até
+caber. A partir de ``ZOOM_SEM_CLUSTER`` os pontos vão soltos, lidos de uma
+grade por célula (só as células visíveis) e limitados a
+``MAX_PONTOS_SOLTOS``; acima disso a resposta volta a ser agrupada.
+"""
+from __future__ import annotations
+
+import math
+from itertools import islice
+
+from django.urls import reverse
+
+from .cache_versionado import CacheVersionado
+
+RAIO_PX = 60          # lado da célula de agrupamento, em pixels de tela
+TILE_PX = 256
+ZOOM_MINIMO = 0
+ZOOM_MAXIMO = 18      # a partir de ZOOM_SEM_CLUSTER os pontos vão soltos
+ZOOM_SEM_CLUSTER = 17
+LAT_MAXIMA = 85.05112878
+TELA_MAXIMA_PX = 4096  # maior lado do retângulo visível, em pixels do zoom pedido
+MAX_PONTOS_SOLTOS = 2000
+
+_cache = CacheVersionado("mapa")
+invalidar = _cache.invalidar
+
+
+def _pixel(lat, lng, zoom):
+    """(x, y) em pixels do mundo no ``zoom`` (Web Mercator)."""
+    escala = TILE_PX * 2 ** zoom
+    lat = max(-LAT_MAXIMA, min(LAT_MAXIMA, lat))
+    seno = math.sin(math.radians(lat))
+    x = (lng + 180.0) / 360.0 * escala
+    y = (0.5 - math.log((1 + seno) / (1 - seno)) / (4 * math.pi)) * escala
+    return x, y
+
+
+def _carregar_pontos():
+    from .models import Empresa
+    pontos = []
+    for pk, nome, slug, lat, lng in (
+        Empresa.objects.exclude(geohash='').exclude(slug__isnull=True).order_by('id')
+        .values_list('id', 'nome', 'slug', 'latitude', 'longitude')
+        .iterator(chunk_size=2000)
+    ):
+        pontos.append((pk, nome, reverse('empresa_detalhe', args=[slug]), float(lat), float(lng)))
+    return pontos
+
+
+def pontos():
+    """[(id, nome, url, lat, lng), ...] de todas as empresas com coordenada."""
+    return _cache.obter("pontos", _carregar_pontos)
+
+
+def _montar_indice(zoom):
+    # célula -> [soma_lat, soma_lng, quantidade, ponto (se único)]
+    celulas = {}
+    for ponto in pontos():
+        _, _, _, lat, lng = ponto
+        x, y = _pixel(lat, lng, zoom)
+        chave = (int(x // RAIO_PX), int(y // RAIO_PX))
+        c = celulas.get(chave)
+        if c is None:
+            celulas[chave] = [lat, lng, 1, ponto]
+        else:
+            c[0] += lat
+            c[1] += lng
+            c[2] += 1
+            c[3] = None
+    return {k: (sl / n, sg / n, n, p) for k, (sl, sg, n, p) in celulas.items()}
+
+
+def indice(zoom):
+    """Clusters do ``zoom``: {(cx, cy): (lat, lng, quantidade, ponto ou None)}."""
+    return _cache.obter(f"z{zoom}", lambda: _montar_indice(zoom))
+
+
+def _montar_grade():
+    grade = {}
+    for ponto in pontos():
+        x, y = _pixel(ponto[3], ponto[4], ZOOM_SEM_CLUSTER)
+        grade.setdefault((int(x // RAIO_PX), int(y // RAIO_PX)), []).append(ponto)
+    return grade
+
+
+def grade():
+    """Pontos soltos por célula de ``ZOOM_SEM_CLUSTER``: {(cx, cy): [ponto, ...]}."""
+    return _cache.obter("grade", _montar_grade)
+
+
+def _visiveis(celulas, zoom, bbox):
+    """Valores de ``celulas`` (indexadas pela grade do ``zoom``) que cruzam ``bbox``."""
+    oeste, sul, leste, norte = bbox
+    x1, y1 = _pixel(norte, oeste, zoom)
+    x2, y2 = _pixel(sul, leste, zoom)
+    cx1, cx2 = int(x1 // RAIO_PX), int(x2 // RAIO_PX)
+    cy1, cy2 = int(y1 // RAIO_PX), int(y2 // RAIO_PX)
+
+    if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) < len(celulas):
+        return (
+            celulas[(cx, cy)]
+            for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)
+            if (cx, cy) in celulas
+        )
+    return (
+        v for (cx, cy), v in celulas.items()
+        if cx1 <= cx <= cx2 and cy1 <= cy <= cy2
+    )
+
+
+def zoom_visivel(zoom, bbox):
+    """Maior zoom (até ``zoom``) em que ``bbox`` cabe em ``TELA_MAXIMA_PX``."""
+    oeste, sul, leste, norte = bbox
+    while zoom > ZOOM_MINIMO:
+        x1, y1 = _pixel(norte, oeste, zoom)
+        x2, y2 = _pixel(sul, leste, zoom)
+        if max(x2 - x1, y2 - y1) <= TELA_MAXIMA_PX:
+            break
+        zoom -= 1
+    return zoom
+
+
+def _feature(lat, lng, propriedades):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [round(lng, 7), round(lat, 7)]},
+        "properties": propriedades,
+    }
+
+
+def _feature_ponto(ponto):
+    pk, nome, url, lat, lng = ponto
+    return _feature(lat, lng, {"cluster": False, "id": pk, "nome": nome, "url": url})
+
+
+def features(zoom, bbox):
+    """Features GeoJSON visíveis em ``bbox`` = (oeste, sul, leste, norte) no ``zoom``."""
+    oeste, sul, leste, norte = bbox
+    zoom = zoom_visivel(zoom, bbox)
+    if zoom >= ZOOM_SEM_CLUSTER:
+        soltos = list(islice(
+            (
+                p for celula in _visiveis(grade(), ZOOM_SEM_CLUSTER, bbox) for p in celula
+                if sul <= p[3] <= norte and oeste <= p[4] <= leste
+            ),
+            MAX_PONTOS_SOLTOS + 1,
+        ))
+        if len(soltos) <= MAX_PONTOS_SOLTOS:
+            return [_feature_ponto(p) for p in sorted(soltos)]
+        zoom = ZOOM_SEM_CLUSTER - 1
+
+    resultado = []
+    for lat, lng, quantidade, ponto in _visiveis(indice(zoom), zoom, bbox):
+        if ponto is not None:
+            resultado.append(_feature_ponto(ponto))
+        else:
+            resultado.append(_feature(lat, lng, {"cluster": True, "quantidade": quantidade}))
+    return resultado
+
+
+def parametros(params):
+    """(zoom, bbox) de ?zoom=&bbox=oeste,sul,leste,norte, ou None se inválidos."""
+    try:
+        zoom = int(params.get("zoom", ""))
+        oeste, sul, leste, norte = (float(v) for v in params.get("bbox", "").split(","))
+    except ValueError:
+        return None
+    if any(math.isnan(v) for v in (oeste, sul, leste, norte)) or sul > norte:
+        return None
+    zoom = max(ZOOM_MINIMO, min(ZOOM_MAXIMO, zoom))
+    if leste - oeste >= 360 or oeste > leste:
+        # mapa dando a volta no mundo (ou cruzando o antimeridiano): largura toda
+        oeste, leste = -180.0, 180.0
+    oeste, leste = max(-180.0, oeste), min(180.0, leste)
+    sul, norte = max(-LAT_MAXIMA, sul), min(LAT_MAXIMA, norte)
+    return zoom, (oeste, sul, leste, norte)
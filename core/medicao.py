@@ -0,0 +1,117 @@
+# core/medicao.py
+"""
+Medição por requisição: consultas ao banco, tempo de banco, de templates e
+da view.
+
+``core.middleware.MedicaoMiddleware`` abre uma ``Medicao`` por requisição
+(guardada num ``ContextVar``, então threads da fila de importação não
+entram na conta) e instala um ``execute_wrapper`` nas conexões. O tempo de
+templates vem de ``Template.render`` (só o template de fora: ``include`` e
+``extends`` já estão dentro dele), instrumentado uma vez em ``instalar()``.
+
+O resultado vai para o cabeçalho ``Server-Timing`` (``server_timing``) e
+para uma linha de log ``chave=valor`` (``linha_de_log``) no logger
+``core.medicao``.
+"""
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+
+_atual: ContextVar["Medicao | None"] = ContextVar("medicao", default=None)
+_instalado = False
+
+
+def _ms(segundos) -> float:
+    return round(segundos * 1000, 1)
+
+
+class Medicao:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_db = 0.0
+        self.tempo_templates = 0.0
+        self.tempo_view = 0.0
+        self.total = 0.0
+        self._em_template = False
+
+    def encerrar(self):
+        self.total = time.perf_counter() - self.inicio
+
+    def metricas(self) -> dict:
+        return {
+            "consultas": self.consultas,
+            "db_ms": _ms(self.tempo_db),
+            "templates_ms": _ms(self.tempo_templates),
+            "view_ms": _ms(self.tempo_view),
+            "total_ms": _ms(self.total),
+        }
+
+    def server_timing(self) -> str:
+        return ", ".join([
+            f'db;dur={_ms(self.tempo_db)};desc="{self.consultas} consultas"',
+            f"tpl;dur={_ms(self.tempo_templates)}",
+            f"view;dur={_ms(self.tempo_view)}",
+            f"total;dur={_ms(self.total)}",
+        ])
+
+
+def iniciar() -> tuple[Medicao, object]:
+    medicao = Medicao()
+    return medicao, _atual.set(medicao)
+
+
+def terminar(token):
+    _atual.reset(token)
+
+
+def atual() -> Medicao | None:
+    return _atual.get()
+
+
+def linha_de_log(request_id, metodo, rota, status, medicao) -> str:
+    campos = {"id": request_id, "metodo": metodo, "rota": rota, "status": status, **medicao.metricas()}
+    return " ".join(f"{chave}={valor}" for chave, valor in campos.items())
+
+
+# ============================================================
+# Instrumentação (banco e templates)
+# ============================================================
+
+def contar_consulta(execute, sql, params, many, context):
+    """``execute_wrapper`` das conexões durante a requisição."""
+    medicao = _atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.consultas += 1
+        medicao.tempo_db += time.perf_counter() - inicio
+
+
+def instalar():
+    """Envolve ``Template.render`` uma vez por processo."""
+    global _instalado
+    if _instalado:
+        return
+    from django.template.base import Template
+
+    render_original = Template.render
+
+    def render(self, context):
+        medicao = _atual.get()
+        if medicao is None or medicao._em_template:
+            return render_original(self, context)
+        medicao._em_template = True
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, context)
+        finally:
+            medicao.tempo_templates += time.perf_counter() - inicio
+            medicao._em_template = False
+
+    Template.render = render
+    _instalado = True
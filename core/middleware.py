@@ -1,13 +1,60 @@
-from django.shortcuts import render
+import logging
+import re
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import medicao
+
+logger = logging.getLogger("core.medicao")
+RE_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class MedicaoMiddleware:
+    """
+    Mede cada requisição (core.medicao) e registra uma linha no logger
+    ``core.medicao``. O cabeçalho ``Server-Timing`` vai para staff ou, com
+    ``SERVER_TIMING = True``, para todos. Usa o ``X-Request-ID`` do proxy
+    quando vier um válido e devolve o id na resposta.
+    """
 
-class Custom404Middleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        medicao.instalar()
 
     def __call__(self, request):
-        response = self.get_response(request)
+        recebido = request.headers.get("X-Request-ID", "")
+        request.request_id = recebido if RE_REQUEST_ID.match(recebido) else uuid.uuid4().hex
+
+        atual, token = medicao.iniciar()
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(medicao.contar_consulta))
+                response = self.get_response(request)
+            if getattr(request, "_medicao_inicio_view", None) is not None:
+                atual.tempo_view = time.perf_counter() - request._medicao_inicio_view
+            atual.encerrar()
+        finally:
+            medicao.terminar(token)
+
+        match = getattr(request, "resolver_match", None)
+        rota = (match.view_name if match else None) or "-"
+        logger.info(medicao.linha_de_log(request.request_id, request.method, rota, response.status_code, atual))
+
+        response["X-Request-ID"] = request.request_id
+        if getattr(settings, "SERVER_TIMING", False) or self._staff(request):
+            response["Server-Timing"] = atual.server_timing()
+        return response
 
-        if response.status_code == 404:
-            return render(request, 'core/404.html', status=404)
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # view = daqui até a resposta voltar (inclui templates e banco)
+        request._medicao_inicio_view = time.perf_counter()
 
-        return response
\ No newline at end of file
+    @staticmethod
+    def _staff(request):
+        user = getattr(request, "user", None)
+        return bool(user is not None and user.is_authenticated and user.is_staff)
@@ -1,13 +1,31 @@
 # Em core/migrations/0012_populate_slugs.py
 
 from django.db import migrations
+from django.db.models import Q
 from django.utils.text import slugify
 
+LOTE = 1000
+
+
 def generate_slugs(apps, schema_editor):
+    # Cópia congelada do core.slugs: a migração não pode depender do código vivo
     Empresa = apps.get_model('core', 'Empresa')
-    for empresa in Empresa.objects.all():
-        # Não precisa gerar o slug manualmente, o método save() já faz isso
-        empresa.save()
+    db = schema_editor.connection.alias
+    tamanho = Empresa._meta.get_field('slug').max_length
+    usados = set(Empresa.objects.using(db).exclude(slug__isnull=True).exclude(slug='').values_list('slug', flat=True))
+    pendentes = []
+    vazios = Empresa.objects.using(db).filter(Q(slug__isnull=True) | Q(slug=''))
+    for pk, nome in vazios.order_by('pk').values_list('pk', 'nome'):
+        base = slugify(nome or '')[:tamanho - 8].strip('-') or 'empresa'
+        slug, n = base, 1
+        while slug in usados:
+            slug = f"{base}-{n}"
+            n += 1
+        usados.add(slug)
+        pendentes.append(Empresa(pk=pk, slug=slug))
+    for i in range(0, len(pendentes), LOTE):
+        Empresa.objects.using(db).bulk_update(pendentes[i:i + LOTE], ['slug'])
+
 
 class Migration(migrations.Migration):
 
@@ -17,4 +35,4 @@ class Migration(migrations.Migration):
 
     operations = [
         migrations.RunPython(generate_slugs),
-    ]
\ No newline at end of file
+    ]
@@ -0,0 +1,86 @@
+import unicodedata
+
+from django.db import migrations
+
+# Cópia congelada do core.search (estrutura e documentos da época desta
+# migração): a migração não pode depender do código vivo.
+TABELA = 'core_empresa_busca'
+PESOS_PG = ('A', 'B', 'C', 'D')
+LOTE = 500
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def _documento(empresa):
+    endereco = ' '.join(
+        filter(None, [empresa.rua, empresa.numero, empresa.bairro, empresa.cidade, empresa.endereco_full])
+    )
+    return (
+        empresa.id,
+        _normalizar(empresa.nome),
+        _normalizar(' '.join(t.nome for t in empresa.tags.all())),
+        _normalizar(endereco),
+        _normalizar(empresa.descricao),
+    )
+
+
+def criar_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABELA} ("
+            " empresa_id bigint PRIMARY KEY REFERENCES core_empresa(id) ON DELETE CASCADE"
+            " DEFERRABLE INITIALLY DEFERRED,"
+            " documento tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABELA}_documento_gin ON {TABELA} USING gin (documento)"
+        )
+        vetor = ' || '.join(f"setweight(to_tsvector('simple', %s), '{peso}')" for peso in PESOS_PG)
+        insert = f"INSERT INTO {TABELA} (empresa_id, documento) VALUES (%s, {vetor})"
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA} USING fts5("
+            "nome, tags, endereco, descricao, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insert = f"INSERT INTO {TABELA} (rowid, nome, tags, endereco, descricao) VALUES (%s, %s, %s, %s, %s)"
+    else:
+        return
+
+    Empresa = apps.get_model('core', 'Empresa')
+    db = schema_editor.connection.alias
+    empresas = (
+        Empresa.objects.using(db).order_by('id')
+        .only('id', 'nome', 'descricao', 'rua', 'numero', 'bairro', 'cidade', 'endereco_full')
+        .prefetch_related('tags')
+    )
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(f"DELETE FROM {TABELA}")
+        docs = []
+        for emp in empresas.iterator(chunk_size=LOTE):
+            docs.append(_documento(emp))
+            if len(docs) >= LOTE:
+                cur.executemany(insert, docs)
+                docs = []
+        if docs:
+            cur.executemany(insert, docs)
+
+
+def remover_indice(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABELA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_remove_empresa_core_empres_cnpj_70d9ec_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, reverse_code=remover_indice),
+    ]
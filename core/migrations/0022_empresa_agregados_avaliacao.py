@@ -0,0 +1,110 @@
+# Generated by Django 4.2.13 on 2026-10-17 21:12
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+LOTE = 1000
+
+
+def preencher_agregados(apps, schema_editor):
+    # Cópia congelada de recalcular_avaliacoes_em_lote: a migração não importa core.models
+    Empresa = apps.get_model('core', 'Empresa')
+    Avaliacao = apps.get_model('core', 'Avaliacao')
+    db = schema_editor.connection.alias
+    contagens = {}
+    linhas = Avaliacao.objects.using(db).values_list('empresa_id', 'nota').annotate(qtd=models.Count('id')).order_by()
+    for empresa_id, nota, qtd in linhas:
+        contagens.setdefault(empresa_id, {})[nota] = qtd
+
+    campos = [f'avaliacoes_{n}' for n in range(1, 6)] + ['total_avaliacoes', 'nota_media']
+    ids = list(Empresa.objects.using(db).order_by('id').values_list('id', flat=True))
+    for i in range(0, len(ids), LOTE):
+        objs = []
+        for empresa_id in ids[i:i + LOTE]:
+            por_nota = contagens.get(empresa_id, {})
+            total = sum(por_nota.values())
+            soma = sum(nota * qtd for nota, qtd in por_nota.items())
+            obj = Empresa(id=empresa_id, total_avaliacoes=total)
+            for n in range(1, 6):
+                setattr(obj, f'avaliacoes_{n}', por_nota.get(n, 0))
+            obj.nota_media = Decimal(soma / total).quantize(Decimal('0.01')) if total else Decimal('0')
+            objs.append(obj)
+        Empresa.objects.using(db).bulk_update(objs, campos)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_empresa_busca'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='avaliacao',
+            options={'ordering': ('-data_criacao',), 'verbose_name': 'Avaliação', 'verbose_name_plural': 'Avaliações'},
+        ),
+        migrations.AlterModelOptions(
+            name='empresa',
+            options={'verbose_name': 'Ponto Turístico', 'verbose_name_plural': 'Pontos Turísticos'},
+        ),
+        migrations.AlterModelOptions(
+            name='imagemempresa',
+            options={'ordering': [models.OrderBy(models.F('principal'), descending=True), '-data_upload'], 'verbose_name': 'Imagem da Empresa', 'verbose_name_plural': 'Imagens dos Pontos Turísticos / Empresas'},
+        ),
+        migrations.AlterModelOptions(
+            name='perfilusuario',
+            options={'verbose_name': 'Perfil de Usuário', 'verbose_name_plural': 'Detalhes dos Usuários'},
+        ),
+        migrations.AlterModelOptions(
+            name='tag',
+            options={'ordering': ['nome'], 'verbose_name': 'Categoria / Tag', 'verbose_name_plural': 'Categorias / Tags'},
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='avaliacoes_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='avaliacoes_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='avaliacoes_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='avaliacoes_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='avaliacoes_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='nota_media',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='total_avaliacoes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='empresa',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='empresas', to='core.tag', verbose_name='Tags'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='core.tag', verbose_name='Categoria Pai'),
+        ),
+        migrations.RunPython(preencher_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.13 on 2026-10-17 21:19
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0022_empresa_agregados_avaliacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacaoJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(blank=True, storage=core.models.ArmazenamentoImportacao(), upload_to='%Y/%m/')),
+                ('nome_arquivo', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pendente', 'Na fila'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('falhou', 'Falhou')], db_index=True, default='pendente', max_length=12)),
+                ('total_linhas', models.PositiveIntegerField(blank=True, null=True)),
+                ('linhas_processadas', models.PositiveIntegerField(default=0)),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('atualizados', models.PositiveIntegerField(default=0)),
+                ('sem_alteracao', models.PositiveIntegerField(default=0)),
+                ('erros', models.PositiveIntegerField(default=0)),
+                ('mensagens', models.JSONField(blank=True, default=list)),
+                ('erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='importacoes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Importação de Planilha',
+                'verbose_name_plural': 'Importações de Planilhas',
+                'ordering': ('-criado_em',),
+            },
+        ),
+    ]
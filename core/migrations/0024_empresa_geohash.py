@@ -0,0 +1,63 @@
+# Generated by Django 4.2.13 on 2026-10-17 21:24
+
+from django.db import migrations, models
+
+# Cópia congelada do core.geo: a migração não pode depender do código vivo
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISAO = 9
+
+
+def geohash_de(lat, lng):
+    if lat is None or lng is None:
+        return ''
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return ''
+    lat_int, lng_int = [-90.0, 90.0], [-180.0, 180.0]
+    hash_, bits, ch, par = [], 0, 0, True
+    while len(hash_) < PRECISAO:
+        intervalo, valor = (lng_int, lng) if par else (lat_int, lat)
+        meio = (intervalo[0] + intervalo[1]) / 2
+        if valor >= meio:
+            ch = (ch << 1) | 1
+            intervalo[0] = meio
+        else:
+            ch <<= 1
+            intervalo[1] = meio
+        par = not par
+        bits += 1
+        if bits == 5:
+            hash_.append(BASE32[ch])
+            bits, ch = 0, 0
+    return ''.join(hash_)
+
+
+def preencher_geohash(apps, schema_editor):
+    Empresa = apps.get_model('core', 'Empresa')
+    db = schema_editor.connection.alias
+    pendentes = []
+    com_coordenada = Empresa.objects.using(db).filter(latitude__isnull=False, longitude__isnull=False)
+    for emp in com_coordenada.only('id', 'latitude', 'longitude').iterator(chunk_size=1000):
+        emp.geohash = geohash_de(emp.latitude, emp.longitude)
+        pendentes.append(emp)
+        if len(pendentes) >= 1000:
+            Empresa.objects.using(db).bulk_update(pendentes, ['geohash'])
+            pendentes = []
+    if pendentes:
+        Empresa.objects.using(db).bulk_update(pendentes, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_importacaojob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(preencher_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.13 on 2026-10-17 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_empresa_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemempresa',
+            name='altura',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagemempresa',
+            name='derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='imagemempresa',
+            name='largura',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='avatar_derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
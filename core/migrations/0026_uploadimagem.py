@@ -0,0 +1,38 @@
+# Generated by Django 4.2.13 on 2026-10-17 21:32
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0025_imagem_derivados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadImagem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(blank=True, storage=core.models.ArmazenamentoUploadImagem(), upload_to='%Y/%m/%d/')),
+                ('nome_arquivo', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pendente', 'Na fila'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('falhou', 'Falhou')], db_index=True, default='pendente', max_length=12)),
+                ('erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads_imagem', to='core.empresa')),
+                ('imagem', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.imagemempresa')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads_imagem', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Upload de Imagem',
+                'verbose_name_plural': 'Uploads de Imagens',
+                'ordering': ('criado_em', 'id'),
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.13 on 2026-10-17 22:05
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def preencher_updated_at(apps, schema_editor):
+    # sem histórico de alterações: parte da data de cadastro
+    Empresa = apps.get_model('core', 'Empresa')
+    Empresa.objects.using(schema_editor.connection.alias).update(updated_at=F('data_cadastro'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_uploadimagem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(preencher_updated_at, migrations.RunPython.noop),
+    ]
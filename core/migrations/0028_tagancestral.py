@@ -0,0 +1,51 @@
+# Generated by Django 4.2.13 on 2026-10-17 21:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def preencher_fechamento(apps, schema_editor):
+    # árvore atual (Tag.parent) -> pares (ancestral, descendente); cópia
+    # congelada de core.arvore_tags.reconstruir
+    Tag = apps.get_model('core', 'Tag')
+    TagAncestral = apps.get_model('core', 'TagAncestral')
+    db = schema_editor.connection.alias
+    pais = dict(Tag.objects.using(db).values_list('id', 'parent_id'))
+    linhas = []
+    for tag_id in pais:
+        atual, profundidade, vistos = tag_id, 0, set()
+        while atual is not None and atual not in vistos:
+            vistos.add(atual)
+            linhas.append(TagAncestral(ancestral_id=atual, descendente_id=tag_id, profundidade=profundidade))
+            atual, profundidade = pais.get(atual), profundidade + 1
+    TagAncestral.objects.using(db).all().delete()
+    TagAncestral.objects.using(db).bulk_create(linhas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_empresa_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagAncestral',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profundidade', models.PositiveSmallIntegerField()),
+                ('ancestral', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendentes', to='core.tag')),
+                ('descendente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestrais', to='core.tag')),
+            ],
+            options={
+                'verbose_name': 'Ancestral de tag',
+                'verbose_name_plural': 'Ancestrais de tags',
+                'indexes': [models.Index(fields=['descendente', 'profundidade'], name='core_taganc_descend_1f246e_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tagancestral',
+            constraint=models.UniqueConstraint(fields=('ancestral', 'descendente'), name='tagancestral_unico'),
+        ),
+        migrations.RunPython(preencher_fechamento, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-17 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_tagancestral'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadimagem',
+            name='principal',
+            field=models.BooleanField(default=False, help_text='A imagem vira a capa da empresa ao ser processada.'),
+        ),
+    ]
@@ -1,9 +1,17 @@
-from django.db import models
+import os
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
-from django.utils.text import slugify
-from django.db.models import F, Avg
+from django.utils import timezone
+from django.db.models import F, Avg, Count
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from . import arvore_tags, geo, imagens, slugs
+
 class PerfilUsuario(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='perfil')
     cpf_cnpj = models.CharField(max_length=14, unique=True, db_index=True) 
@@ -29,14 +37,42 @@ class PerfilUsuario(models.Model):
         default='light',
         verbose_name="Tema de preferência"
     )
+    avatar_derivados = models.JSONField(default=dict, blank=True, editable=False)
     
     class Meta:
         verbose_name = "Perfil de Usuário"
         verbose_name_plural = "Detalhes dos Usuários"
-    
+
     def __str__(self):
         return self.user.username
-    
+
+    def save(self, *args, **kwargs):
+        if self.avatar and not self.avatar._committed:
+            imagens.remover(self.avatar_derivados, self.avatar.storage)
+            _, _, self.avatar_derivados = imagens.gerar(
+                self.avatar.file, self.avatar.storage, 'avatars', imagens.RENDICOES_AVATAR
+            )
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'avatar_derivados'}
+        elif not self.avatar and self.avatar_derivados:
+            imagens.remover(self.avatar_derivados, self.avatar.storage)
+            self.avatar_derivados = {}
+        super().save(*args, **kwargs)
+
+    def _avatar_url(self, nome):
+        if not self.avatar:
+            return None
+        return imagens.url(self.avatar_derivados, self.avatar.storage, nome) or self.avatar.url
+
+    @property
+    def avatar_pequeno_url(self):
+        """Avatar reduzido (cabeçalho, avaliações); o original se não houver derivado."""
+        return self._avatar_url('thumb')
+
+    @property
+    def avatar_medio_url(self):
+        return self._avatar_url('card')
+
     @property
     def display_name(self):
         full = (self.full_name or self.user.get_full_name() or self.user.first_name or "").strip()
@@ -65,6 +101,83 @@ class Tag(models.Model):
             return f"— {self.nome}"
         return self.nome
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # save() só mexe no fechamento (TagAncestral) se o pai mudar
+        instance._parent_do_banco = instance.__dict__.get('parent_id')
+        return instance
+
+    def clean(self):
+        if not self._state.adding and arvore_tags.forma_ciclo(TagAncestral, self.pk, self.parent_id):
+            raise ValidationError({'parent': "Uma tag não pode ficar debaixo dela mesma ou de uma subtag sua."})
+
+    def save(self, *args, **kwargs):
+        criando = self._state.adding
+        # sem _parent_do_banco (instância montada à mão) o fechamento é refeito por garantia
+        mudou_pai = not criando and self.parent_id != getattr(self, '_parent_do_banco', object())
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'parent' not in update_fields:
+            mudou_pai = False
+
+        with transaction.atomic():
+            if mudou_pai:
+                arvore_tags.mover(TagAncestral, self.pk, self.parent_id)
+            super().save(*args, **kwargs)
+            if criando:
+                arvore_tags.inserir(TagAncestral, self.pk, self.parent_id)
+        self._parent_do_banco = self.parent_id
+
+
+class TagAncestral(models.Model):
+    """Fechamento transitivo de Tag.parent (ver core.arvore_tags)."""
+    ancestral = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='descendentes')
+    descendente = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='ancestrais')
+    profundidade = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestral', 'descendente'], name='tagancestral_unico'),
+        ]
+        indexes = [models.Index(fields=['descendente', 'profundidade'])]
+        verbose_name = "Ancestral de tag"
+        verbose_name_plural = "Ancestrais de tags"
+
+
+def campos_avaliacao(contagem_por_nota):
+    """Converte {nota: quantidade} nos valores dos campos agregados de Empresa."""
+    total = sum(contagem_por_nota.values())
+    soma = sum(nota * qtd for nota, qtd in contagem_por_nota.items())
+    campos = {f'avaliacoes_{n}': contagem_por_nota.get(n, 0) for n in range(1, 6)}
+    campos['total_avaliacoes'] = total
+    campos['nota_media'] = Decimal(soma / total).quantize(Decimal('0.01')) if total else Decimal('0')
+    return campos
+
+
+def recalcular_avaliacoes_em_lote(empresa_model, avaliacao_model, lote=1000, using='default'):
+    """Recalcula os agregados de todas as empresas com um GROUP BY e bulk_update."""
+    contagens = {}
+    linhas = (
+        avaliacao_model.objects.using(using)
+        .values_list('empresa_id', 'nota').annotate(qtd=Count('id')).order_by()
+    )
+    for empresa_id, nota, qtd in linhas:
+        contagens.setdefault(empresa_id, {})[nota] = qtd
+
+    campos = list(campos_avaliacao({}).keys())
+    total = 0
+    ids = list(empresa_model.objects.using(using).order_by('id').values_list('id', flat=True))
+    for i in range(0, len(ids), lote):
+        objs = []
+        for empresa_id in ids[i:i + lote]:
+            obj = empresa_model(id=empresa_id)
+            for campo, valor in campos_avaliacao(contagens.get(empresa_id, {})).items():
+                setattr(obj, campo, valor)
+            objs.append(obj)
+        empresa_model.objects.using(using).bulk_update(objs, campos)
+        total += len(objs)
+    return total
+
 
 class Empresa(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='empresas', db_index=True)
@@ -82,6 +195,8 @@ class Empresa(models.Model):
     endereco_full = models.CharField(max_length=300, blank=True, default='')
     latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True) 
     longitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    # geohash de latitude/longitude (core.geo): índice para a busca "perto de mim"
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     telefone = models.CharField(max_length=60, blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
     contato_direto = models.CharField(max_length=255, blank=True, null=True)
@@ -91,6 +206,17 @@ class Empresa(models.Model):
     sem_telefone = models.BooleanField(default=False)
     sem_email = models.BooleanField(default=False)
     data_cadastro = models.DateTimeField(auto_now_add=True, db_index=True)
+    # também tocado (Empresa.tocar) por mudanças em imagens, avaliações e tags
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Agregados de Avaliacao (desnormalizados; mantidos por core.signals)
+    nota_media = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    total_avaliacoes = models.PositiveIntegerField(default=0, editable=False)
+    avaliacoes_1 = models.PositiveIntegerField(default=0, editable=False)
+    avaliacoes_2 = models.PositiveIntegerField(default=0, editable=False)
+    avaliacoes_3 = models.PositiveIntegerField(default=0, editable=False)
+    avaliacoes_4 = models.PositiveIntegerField(default=0, editable=False)
+    avaliacoes_5 = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         indexes = [ models.Index(fields=['cidade', 'bairro']), ]
@@ -100,39 +226,98 @@ class Empresa(models.Model):
     def __str__(self):
         return self.nome
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # slug lido do banco já é único: save() só volta a alocar se ele mudar
+        instance._slug_do_banco = instance.__dict__.get('slug')
+        return instance
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.nome)
-
-        original_slug = self.slug
-        counter = 1
-        queryset = Empresa.objects.filter(slug=self.slug)
-        if self.pk:
-            queryset = queryset.exclude(pk=self.pk)
-        
-        while queryset.exists():
-            self.slug = f'{original_slug}-{counter}'
-            counter += 1
-            queryset = Empresa.objects.filter(slug=self.slug)
-            if self.pk:
-                queryset = queryset.exclude(pk=self.pk)
-            
-        super().save(*args, **kwargs)
+        self.geohash = geo.geohash_de(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extras = {'updated_at'}
+            if {'latitude', 'longitude'} & set(update_fields):
+                extras.add('geohash')
+            kwargs['update_fields'] = {*update_fields, *extras}
+
+        if update_fields is not None and 'slug' not in update_fields:
+            return super().save(*args, **kwargs)
+        if self.slug and self.slug == getattr(self, '_slug_do_banco', None):
+            return super().save(*args, **kwargs)
+
+        # slug novo ou alterado: uma consulta de colisões; o índice único decide
+        # a corrida com um insert concorrente (realoca e tenta de novo)
+        texto = self.slug or self.nome
+        for tentativa in range(slugs.TENTATIVAS):
+            self.slug = slugs.alocar(Empresa, texto, excluir_pk=self.pk)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                break
+            except IntegrityError:
+                if tentativa == slugs.TENTATIVAS - 1 or not (
+                    Empresa.objects.filter(slug=self.slug).exclude(pk=self.pk).exists()
+                ):
+                    raise
+        self._slug_do_banco = self.slug
+
+    @classmethod
+    def recalcular_avaliacoes(cls, empresa_id):
+        """Recalcula média/total/histograma de uma empresa (trava a linha durante a conta)."""
+        with transaction.atomic():
+            if not cls.objects.select_for_update().filter(pk=empresa_id).exists():
+                return
+            contagem = dict(
+                Avaliacao.objects.filter(empresa_id=empresa_id)
+                .values_list('nota').annotate(qtd=Count('id')).order_by()
+            )
+            cls.objects.filter(pk=empresa_id).update(**campos_avaliacao(contagem), updated_at=timezone.now())
+
+    @classmethod
+    def tocar(cls, ids):
+        """Marca as empresas como alteradas (updated_at) sem passar pelo save()."""
+        ids = {i for i in ids if i}
+        if ids:
+            cls.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+
+    @property
+    def histograma_notas(self):
+        """[(5, qtd, pct), ..., (1, qtd, pct)] para as barras de estrelas."""
+        total = self.total_avaliacoes or 0
+        return [
+            (n, getattr(self, f'avaliacoes_{n}'), round(100 * getattr(self, f'avaliacoes_{n}') / total) if total else 0)
+            for n in range(5, 0, -1)
+        ]
 
     @property
     def imagem_principal(self):
-        if hasattr(self, 'imagem_principal_list') and self.imagem_principal_list:
-            return self.imagem_principal_list[0]
+        # preenchido por Prefetch(..., to_attr='imagem_principal_list') nas listagens
+        if hasattr(self, 'imagem_principal_list'):
+            return self.imagem_principal_list[0] if self.imagem_principal_list else None
         img = self.imagens.filter(principal=True).first()
         if img:
             return img
         return self.imagens.order_by('data_upload').first()
     
+class ImagemEmpresaQuerySet(models.QuerySet):
+    def capas(self):
+        """Uma imagem por empresa: a marcada como principal ou, na falta, a mais antiga."""
+        return self.order_by('-principal', 'data_upload', 'id')[:1]
+
+
 class ImagemEmpresa(models.Model):
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='imagens')
     imagem = models.ImageField(upload_to='empresas/galeria/')
     principal = models.BooleanField(default=False, help_text="Marque se esta é a imagem principal/capa da empresa.")
     data_upload = models.DateTimeField(auto_now_add=True)
+    largura = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    altura = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # {"thumb"|"card"|"hero"|"full": {"w", "h", "webp", "jpeg"}} — ver core.imagens
+    derivados = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = ImagemEmpresaQuerySet.as_manager()
 
     class Meta:
         ordering = [F('principal').desc(), '-data_upload'] 
@@ -141,7 +326,52 @@ class ImagemEmpresa(models.Model):
 
     def __str__(self):
         return f"Imagem para {self.empresa.nome}"
-    
+
+    def save(self, *args, **kwargs):
+        if self.imagem and not self.imagem._committed:
+            # upload novo: gera as versões a partir do arquivo ainda em memória/temp
+            self.gerar_derivados(self.imagem.file)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'largura', 'altura', 'derivados'}
+        super().save(*args, **kwargs)
+
+    def gerar_derivados(self, arquivo=None):
+        """(Re)gera as versões redimensionadas; sem ``arquivo`` lê o original do storage."""
+        if arquivo is None:
+            with self.imagem.open('rb') as original:
+                return self.gerar_derivados(original)
+        antigos = self.derivados
+        self.largura, self.altura, self.derivados = imagens.gerar(arquivo, self.imagem.storage, 'empresas/galeria')
+        imagens.remover(antigos, self.imagem.storage)
+
+    def url_rendicao(self, nome, formato='jpeg'):
+        return imagens.url(self.derivados, self.imagem.storage, nome, formato) or self.imagem.url
+
+    @property
+    def url_thumb(self):
+        return self.url_rendicao('thumb')
+
+    @property
+    def url_card(self):
+        return self.url_rendicao('card')
+
+    @property
+    def url_hero(self):
+        return self.url_rendicao('hero')
+
+    @property
+    def url_full(self):
+        return self.url_rendicao('full')
+
+    @property
+    def srcset_webp(self):
+        return imagens.srcset(self.derivados, self.imagem.storage, 'webp')
+
+    @property
+    def srcset_jpeg(self):
+        return imagens.srcset(self.derivados, self.imagem.storage, 'jpeg')
+
+
 class Avaliacao(models.Model):
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='avaliacoes')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='avaliacoes')
@@ -159,4 +389,133 @@ class Avaliacao(models.Model):
         verbose_name_plural = "Avaliações"
 
     def __str__(self):
-        return f'Avaliação de {self.user.username} para {self.empresa.nome}: {self.nota} estrelas'
\ No newline at end of file
+        return f'Avaliação de {self.user.username} para {self.empresa.nome}: {self.nota} estrelas'
+
+
+class ArmazenamentoImportacao(FileSystemStorage):
+    """
+    Planilhas enviadas para importação ficam no disco local (settings.IMPORTACAO_ROOT),
+    nunca no storage de mídia (Cloudinary só aceita imagem), até o job terminar.
+    Um worker em outra máquina precisa do mesmo diretório (volume compartilhado).
+    """
+    @property
+    def base_location(self):
+        return settings.IMPORTACAO_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+class ImportacaoJob(models.Model):
+    PENDENTE = 'pendente'
+    PROCESSANDO = 'processando'
+    CONCLUIDO = 'concluido'
+    FALHOU = 'falhou'
+    STATUS_ESCOLHAS = [
+        (PENDENTE, 'Na fila'),
+        (PROCESSANDO, 'Processando'),
+        (CONCLUIDO, 'Concluído'),
+        (FALHOU, 'Falhou'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='importacoes')
+    arquivo = models.FileField(upload_to='%Y/%m/', storage=ArmazenamentoImportacao(), blank=True)
+    nome_arquivo = models.CharField(max_length=255)
+    status = models.CharField(max_length=12, choices=STATUS_ESCOLHAS, default=PENDENTE, db_index=True)
+
+    total_linhas = models.PositiveIntegerField(null=True, blank=True)
+    linhas_processadas = models.PositiveIntegerField(default=0)
+    criados = models.PositiveIntegerField(default=0)
+    atualizados = models.PositiveIntegerField(default=0)
+    sem_alteracao = models.PositiveIntegerField(default=0)
+    erros = models.PositiveIntegerField(default=0)
+    mensagens = models.JSONField(default=list, blank=True)
+    erro = models.TextField(blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('-criado_em',)
+        verbose_name = "Importação de Planilha"
+        verbose_name_plural = "Importações de Planilhas"
+
+    def __str__(self):
+        return f'{self.nome_arquivo} ({self.get_status_display()})'
+
+    @property
+    def finalizado(self):
+        return self.status in (self.CONCLUIDO, self.FALHOU)
+
+    def progresso_dict(self):
+        """Payload do endpoint de progresso (mesmas chaves da resposta síncrona antiga)."""
+        return {
+            "ok": self.status != self.FALHOU,
+            "id": self.pk,
+            "status": self.status,
+            "finalizado": self.finalizado,
+            "total_linhas": self.total_linhas,
+            "linhas_processadas": self.linhas_processadas,
+            "criados": self.criados,
+            "atualizados": self.atualizados,
+            "sem_alteracao": self.sem_alteracao,
+            "erros": self.erros,
+            "mensagens": self.mensagens,
+            "error": self.erro,
+        }
+
+
+class ArmazenamentoUploadImagem(ArmazenamentoImportacao):
+    """Imagens recém-enviadas esperam o processamento no disco local (settings.IMAGENS_STAGING_ROOT)."""
+    @property
+    def base_location(self):
+        return settings.IMAGENS_STAGING_ROOT
+
+
+class UploadImagem(models.Model):
+    """Imagem enviada para a galeria de uma empresa, na fila de processamento (core.fila_imagens)."""
+    PENDENTE = ImportacaoJob.PENDENTE
+    PROCESSANDO = ImportacaoJob.PROCESSANDO
+    CONCLUIDO = ImportacaoJob.CONCLUIDO
+    FALHOU = ImportacaoJob.FALHOU
+    STATUS_ESCOLHAS = ImportacaoJob.STATUS_ESCOLHAS
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='uploads_imagem')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads_imagem')
+    arquivo = models.FileField(upload_to='%Y/%m/%d/', storage=ArmazenamentoUploadImagem(), blank=True)
+    nome_arquivo = models.CharField(max_length=255)
+    status = models.CharField(max_length=12, choices=STATUS_ESCOLHAS, default=PENDENTE, db_index=True)
+    erro = models.TextField(blank=True)
+    imagem = models.ForeignKey(ImagemEmpresa, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    principal = models.BooleanField(default=False, help_text="A imagem vira a capa da empresa ao ser processada.")
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('criado_em', 'id')
+        verbose_name = "Upload de Imagem"
+        verbose_name_plural = "Uploads de Imagens"
+
+    def __str__(self):
+        return f'{self.nome_arquivo} ({self.get_status_display()})'
+
+    @property
+    def finalizado(self):
+        return self.status in (self.CONCLUIDO, self.FALHOU)
+
+    def status_dict(self):
+        imagem = None
+        if self.imagem_id and self.imagem:
+            imagem = {"id": self.imagem_id, "url": self.imagem.url_card}
+        return {
+            "id": self.pk,
+            "nome": self.nome_arquivo,
+            "status": self.status,
+            "finalizado": self.finalizado,
+            "erro": self.erro,
+            "imagem": imagem,
+        }
@@ -0,0 +1,199 @@
+# core/paginas_prontas.py
+"""
+Páginas pré-renderizadas: erros (404/500) e páginas de conteúdo fixo
+(sobre, termos, privacidade).
+
+Cada página é renderizada uma vez por processo (e de novo só quando a sua
+versão muda) e guardada em memória já com ETag e as versões comprimidas
+(gzip e, com o ``brotli`` do whitenoise instalado, br). Servir é escolher os
+bytes pelo ``Accept-Encoding`` — sem banco, sem template, sem context
+processors.
+
+- 404/500: os templates são autônomos (não estendem o base2.html), então a
+  versão é fixa: uma renderização por deploy. Requisições de JSON e de
+  arquivos (estáticos, mídia, ``.png``...) recebem um 404 curto, sem HTML.
+- conteúdo fixo: só o visitante anônimo sem mensagens recebe a versão
+  pronta (logados veem menu, tema e avatar próprios). O cabeçalho lista
+  tags e cidades, então a versão é a das facetas (``core.facets``). O
+  token CSRF sai vazio: o HTML é o mesmo para todos e essas páginas não
+  fazem POST para anônimos.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import re
+import threading
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from . import cache_paginas, facets
+
+try:
+    import brotli
+except ImportError:  # opcional (whitenoise[brotli])
+    brotli = None
+
+TAMANHO_MINIMO_COMPRESSAO = 200
+RE_ARQUIVO = re.compile(r"\.(?:css|js|mjs|map|png|jpe?g|gif|webp|avif|svg|ico|woff2?|ttf|eot|txt|xml|json|webmanifest)$", re.I)
+TEMPLATE_404 = "core/404.html"
+TEMPLATE_500 = "core/500.html"
+
+
+@dataclass(frozen=True)
+class Pagina:
+    conteudo: bytes
+    etag: str
+    gzip: bytes | None = None
+    br: bytes | None = None
+    content_type: str = "text/html; charset=utf-8"
+
+
+def preparar(conteudo, content_type="text/html; charset=utf-8") -> Pagina:
+    """Bytes + ETag + versões comprimidas (só quando compensam)."""
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode()
+    comprimido_gzip = comprimido_br = None
+    if len(conteudo) >= TAMANHO_MINIMO_COMPRESSAO:
+        comprimido_gzip = gzip.compress(conteudo, compresslevel=9, mtime=0)
+        if brotli is not None:
+            comprimido_br = brotli.compress(conteudo)
+    return Pagina(
+        conteudo=conteudo,
+        etag=f'"{hashlib.md5(conteudo).hexdigest()}"',
+        gzip=comprimido_gzip,
+        br=comprimido_br,
+        content_type=content_type,
+    )
+
+
+# ============================================================
+# Guarda em memória
+# ============================================================
+
+_prontas = {}  # nome -> (versao, Pagina)
+_lock = threading.Lock()
+
+
+def obter(nome, versao, renderizar) -> Pagina:
+    """A página ``nome`` na ``versao``; ``renderizar()`` só roda se ela mudou."""
+    guardada = _prontas.get(nome)
+    if guardada is not None and guardada[0] == versao:
+        return guardada[1]
+    pagina = preparar(renderizar())
+    with _lock:
+        _prontas[nome] = (versao, pagina)
+    return pagina
+
+
+def esquecer():
+    with _lock:
+        _prontas.clear()
+
+
+def _aceita(request, codificacao):
+    return codificacao in request.META.get("HTTP_ACCEPT_ENCODING", "")
+
+
+def resposta(request, pagina: Pagina, status=200) -> HttpResponse:
+    if status == 200 and pagina.etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = HttpResponse(status=304)
+        response["ETag"] = pagina.etag
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+    conteudo, codificacao = pagina.conteudo, None
+    if pagina.br is not None and _aceita(request, "br"):
+        conteudo, codificacao = pagina.br, "br"
+    elif pagina.gzip is not None and _aceita(request, "gzip"):
+        conteudo, codificacao = pagina.gzip, "gzip"
+
+    response = HttpResponse(conteudo, content_type=pagina.content_type, status=status)
+    response["Content-Length"] = str(len(conteudo))
+    response["ETag"] = pagina.etag
+    if codificacao:
+        response["Content-Encoding"] = codificacao
+    if pagina.gzip is not None:
+        patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+# ============================================================
+# Erros
+# ============================================================
+
+def _pede_json(request):
+    return (
+        request.path.startswith("/api/")
+        or "application/json" in request.META.get("HTTP_ACCEPT", "")
+        or request.headers.get("x-requested-with") == "XMLHttpRequest"
+    )
+
+
+def _pede_arquivo(request):
+    prefixos = [p for p in (settings.STATIC_URL, getattr(settings, "MEDIA_URL", None)) if p and p.startswith("/")]
+    return any(request.path.startswith(p) for p in prefixos) or bool(RE_ARQUIVO.search(request.path))
+
+
+def nao_encontrada(request) -> HttpResponse:
+    if _pede_json(request):
+        return JsonResponse({"erro": "Não encontrado."}, status=404)
+    if _pede_arquivo(request):
+        return HttpResponse(b"Not found", content_type="text/plain; charset=utf-8", status=404)
+    return resposta(request, obter("404", None, lambda: render_to_string(TEMPLATE_404)), status=404)
+
+
+def erro_interno(request) -> HttpResponse:
+    if _pede_json(request):
+        return JsonResponse({"erro": "Erro interno."}, status=500)
+    try:
+        pagina = obter("500", None, lambda: render_to_string(TEMPLATE_500))
+    except Exception:
+        # o próprio erro pode ser de template/estáticos: não derruba o handler
+        return HttpResponse(b"Erro interno.", content_type="text/plain; charset=utf-8", status=500)
+    return resposta(request, pagina, status=500)
+
+
+def preparar_erros():
+    """Renderiza 404/500 já no boot: o 500 não depende de renderizar nada na hora do erro."""
+    obter("404", None, lambda: render_to_string(TEMPLATE_404))
+    obter("500", None, lambda: render_to_string(TEMPLATE_500))
+
+
+# ============================================================
+# Páginas de conteúdo fixo
+# ============================================================
+
+def _requisicao_anonima(request):
+    """GET anônimo "limpo" (sem query, sessão nem mensagens) para renderizar a versão de todos."""
+    anonima = HttpRequest()
+    anonima.method = "GET"
+    anonima.path = anonima.path_info = request.path
+    anonima.META = {k: request.META[k] for k in ("HTTP_HOST", "SERVER_NAME", "SERVER_PORT") if k in request.META}
+    anonima.user = AnonymousUser()
+    anonima.session = {}
+    return anonima
+
+
+def _sem_token_csrf(html):
+    return cache_paginas.RE_CSRF.sub(
+        lambda m: m.group(0).replace(m.group(1), b""), html.encode()
+    )
+
+
+def pagina_fixa(request, template) -> HttpResponse:
+    """``template`` pronto para anônimos; os demais recebem a página renderizada na hora."""
+    if request.method not in ("GET", "HEAD") or not cache_paginas.anonimo_sem_mensagens(request):
+        return render(request, template)
+    pagina = obter(
+        template, facets.versao(),
+        lambda: _sem_token_csrf(render_to_string(template, request=_requisicao_anonima(request))),
+    )
+    return resposta(request, pagina)
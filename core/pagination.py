@@ -0,0 +1,174 @@
+# core/pagination.py
+"""
+Paginação por cursor (keyset) para o "carregar mais" das listagens.
+
+Em vez de ``Paginator`` (COUNT(*) + OFFSET), a próxima página é buscada com
+``WHERE (chave) < (última chave vista)`` na mesma ordenação da listagem, sem
+contagem. O cursor é opaco para o cliente (base64 de um JSON).
+
+Listagens cuja ordem não é uma chave estável (ex.: busca ordenada por
+relevância) usam cursor de deslocamento, ainda sem COUNT.
+
+O cursor vem do cliente: tipo e faixa de cada valor são conferidos na
+leitura e um cursor adulterado vale como a primeira página.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# faixa de um inteiro no banco (BIGINT); acima disso não é cursor nosso
+LIMITE_INTEIRO = 2 ** 63
+MAX_DESLOCAMENTO = 10 ** 9
+
+
+@dataclass
+class PaginaCursor:
+    object_list: list
+    next_cursor: str | None
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _codificar(dados: dict) -> str:
+    bruto = json.dumps(dados, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def _decodificar(cursor: str | None) -> dict | None:
+    if not cursor:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        dados = json.loads(bruto)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return dados if isinstance(dados, dict) else None
+
+
+def _valor_json(v):
+    return {"dt": v.isoformat()} if isinstance(v, datetime) else v
+
+
+def _valor_python(v):
+    """Valor da chave vindo do JSON; ``ValueError`` se não for um que ``_valor_json`` produz."""
+    if isinstance(v, dict):
+        if set(v) != {"dt"} or not isinstance(v["dt"], str):
+            raise ValueError("valor de cursor inválido")
+        return datetime.fromisoformat(v["dt"])
+    if isinstance(v, bool) or not isinstance(v, (int, str)):
+        raise ValueError("valor de cursor inválido")
+    return v
+
+
+def _inteiro_valido(v) -> bool:
+    return not isinstance(v, int) or isinstance(v, bool) or -LIMITE_INTEIRO <= v < LIMITE_INTEIRO
+
+
+def _campos(ordenacao):
+    return [(c.lstrip("-"), c.startswith("-")) for c in ordenacao]
+
+
+def cursor_apos(obj, ordenacao) -> str:
+    """Cursor que aponta para depois de ``obj`` (último item da página; instância ou linha de ``.values()``)."""
+    ler = obj.get if isinstance(obj, dict) else lambda campo: getattr(obj, campo)
+    return _codificar({"k": [_valor_json(ler(campo)) for campo, _ in _campos(ordenacao)]})
+
+
+def cursor_deslocamento(offset: int) -> str:
+    return _codificar({"o": int(offset)})
+
+
+def _deslocamento(dados) -> int:
+    o = dados.get("o") or 0
+    if isinstance(o, bool) or not isinstance(o, int) or not 0 <= o <= MAX_DESLOCAMENTO:
+        return 0
+    return o
+
+
+def _posicao(dados, ordenacao, modelo=None):
+    """(valores da chave ou None, deslocamento), com cada valor conferido contra o campo de ``modelo``."""
+    if dados.get("o"):
+        return None, _deslocamento(dados)
+    chave = dados.get("k")
+    if not isinstance(chave, list) or len(chave) != len(ordenacao):
+        return None, 0
+    try:
+        valores = [_valor_python(v) for v in chave]
+        if modelo is not None:
+            valores = [modelo._meta.get_field(campo).to_python(v)
+                       for (campo, _), v in zip(_campos(ordenacao), valores)]
+    except (ValueError, TypeError, ValidationError):
+        return None, 0
+    if not all(_inteiro_valido(v) for v in valores):
+        return None, 0
+    return valores, 0
+
+
+def posicao_do_cursor(cursor: str | None, ordenacao, modelo=None):
+    """(valores da chave ou None, deslocamento) de um cursor de ``paginar_por_cursor``."""
+    return _posicao(_decodificar(cursor) or {}, ordenacao, modelo)
+
+
+def _filtro_keyset(ordenacao, valores):
+    # (a, b) "depois de" (va, vb) => a < va OR (a = va AND b < vb), respeitando asc/desc
+    filtro = Q()
+    iguais = {}
+    for (campo, desc), valor in zip(_campos(ordenacao), valores):
+        lookup = "lt" if desc else "gt"
+        filtro |= Q(**iguais, **{f"{campo}__{lookup}": valor})
+        iguais[campo] = valor
+    return filtro
+
+
+def paginar_por_cursor(queryset, ordenacao, cursor: str | None, por_pagina: int,
+                       ordenado_por_chave: bool = True) -> PaginaCursor:
+    """
+    Devolve ``por_pagina`` itens a partir de ``cursor`` (sem COUNT).
+
+    ``ordenacao`` é a tupla de campos da chave, ex.: ``('-id',)`` ou
+    ``('-data_cadastro', '-id')``; o queryset é ordenado por ela. Com
+    ``ordenado_por_chave=False`` o queryset mantém a própria ordem e o
+    cursor guarda só o deslocamento.
+    """
+    dados = _decodificar(cursor) or {}
+
+    if not ordenado_por_chave:
+        offset = _deslocamento(dados)
+        itens = list(queryset[offset:offset + por_pagina + 1])
+        proximo = cursor_deslocamento(offset + por_pagina) if len(itens) > por_pagina else None
+        return PaginaCursor(itens[:por_pagina], proximo)
+
+    queryset = queryset.order_by(*ordenacao)
+    chave, offset = _posicao(dados, ordenacao, queryset.model)
+    if offset:
+        # cursor de deslocamento vindo do ?page= antigo
+        queryset = queryset[offset:]
+    elif chave is not None:
+        queryset = queryset.filter(_filtro_keyset(ordenacao, chave))
+
+    itens = list(queryset[:por_pagina + 1])
+    proximo = cursor_apos(itens[por_pagina - 1], ordenacao) if len(itens) > por_pagina else None
+    return PaginaCursor(itens[:por_pagina], proximo)
+
+
+def cursor_para_pagina(page_obj, ordenacao, ordenado_por_chave: bool = True) -> str | None:
+    """Cursor para continuar depois de uma página do ``Paginator`` (primeiro render HTML)."""
+    if not page_obj.has_next():
+        return None
+    if not ordenado_por_chave or not len(page_obj.object_list):
+        return cursor_deslocamento(page_obj.end_index())
+    return cursor_apos(list(page_obj.object_list)[-1], ordenacao)
@@ -0,0 +1,221 @@
+# core/search.py
+"""
+Índice de busca textual das empresas.
+
+Mantém uma tabela auxiliar (``core_empresa_busca``) com o texto já normalizado
+(sem acentos, minúsculo) de nome, tags, endereço e descrição:
+
+- PostgreSQL: coluna ``tsvector`` com índice GIN, rank via ``ts_rank``;
+- SQLite: tabela virtual FTS5 (``rowid`` = id da empresa), rank via ``bm25``.
+
+Em bancos sem suporte cai no filtro ``icontains`` antigo.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TABELA = "core_empresa_busca"
+
+# Pesos por coluna (nome > tags > endereço > descrição)
+PESOS_FTS5 = (10.0, 5.0, 2.0, 1.0)
+PESOS_PG = ("A", "B", "C", "D")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalizar(texto: str | None) -> str:
+    """Remove acentos e coloca em minúsculas ('Araranguá' -> 'ararangua')."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return texto.lower()
+
+
+def tokenizar(texto: str | None) -> list[str]:
+    return _TOKEN_RE.findall(normalizar(texto))
+
+
+def suportado(conn=None) -> bool:
+    conn = conn or connection
+    return conn.vendor in ("postgresql", "sqlite")
+
+
+# ============================================================
+# Estrutura (a migração 0021 tem a sua cópia congelada)
+# ============================================================
+
+def criar_estrutura(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABELA} ("
+            " empresa_id bigint PRIMARY KEY REFERENCES core_empresa(id) ON DELETE CASCADE"
+            " DEFERRABLE INITIALLY DEFERRED,"
+            " documento tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABELA}_documento_gin ON {TABELA} USING gin (documento)"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA} USING fts5("
+            "nome, tags, endereco, descricao, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def remover_estrutura(schema_editor):
+    if schema_editor.connection.vendor in ("postgresql", "sqlite"):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABELA}")
+
+
+# ============================================================
+# Escrita
+# ============================================================
+
+def _documento(empresa, nomes_tags) -> tuple[str, str, str, str]:
+    endereco = " ".join(
+        filter(None, [empresa.rua, empresa.numero, empresa.bairro, empresa.cidade, empresa.endereco_full])
+    )
+    return (
+        normalizar(empresa.nome),
+        normalizar(" ".join(nomes_tags)),
+        normalizar(endereco),
+        normalizar(empresa.descricao),
+    )
+
+
+def indexar(empresa_ids, using="default", modelo=None):
+    """(Re)indexa as empresas informadas. Ids inexistentes são removidos do índice."""
+    if modelo is None:
+        from .models import Empresa as modelo
+
+    ids = [int(i) for i in empresa_ids if i is not None]
+    conn = transaction.get_connection(using)
+    if not ids or not suportado(conn):
+        return
+
+    docs = []
+    empresas = (
+        modelo.objects.using(using)
+        .filter(id__in=ids)
+        .only("id", "nome", "descricao", "rua", "numero", "bairro", "cidade", "endereco_full")
+        .prefetch_related("tags")
+    )
+    for emp in empresas:
+        docs.append((emp.id, *_documento(emp, [t.nome for t in emp.tags.all()])))
+
+    with transaction.atomic(using=using), conn.cursor() as cur:
+        _apagar(cur, conn, ids)
+        _inserir(cur, conn, docs)
+
+
+def remover(empresa_ids, using="default"):
+    conn = transaction.get_connection(using)
+    ids = [int(i) for i in empresa_ids if i is not None]
+    if not ids or not suportado(conn):
+        return
+    with conn.cursor() as cur:
+        _apagar(cur, conn, ids)
+
+
+def reindexar_tudo(using="default", lote=500, modelo=None):
+    """Reconstrói o índice inteiro. Retorna a quantidade de empresas indexadas."""
+    if modelo is None:
+        from .models import Empresa as modelo
+
+    conn = transaction.get_connection(using)
+    if not suportado(conn):
+        return 0
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {TABELA}")
+
+    ids = list(modelo.objects.using(using).order_by("id").values_list("id", flat=True))
+    for i in range(0, len(ids), lote):
+        indexar(ids[i:i + lote], using=using, modelo=modelo)
+    return len(ids)
+
+
+def _apagar(cur, conn, ids):
+    marcadores = ", ".join(["%s"] * len(ids))
+    coluna = "rowid" if conn.vendor == "sqlite" else "empresa_id"
+    cur.execute(f"DELETE FROM {TABELA} WHERE {coluna} IN ({marcadores})", ids)
+
+
+def _inserir(cur, conn, docs):
+    if not docs:
+        return
+    if conn.vendor == "sqlite":
+        cur.executemany(
+            f"INSERT INTO {TABELA} (rowid, nome, tags, endereco, descricao) VALUES (%s, %s, %s, %s, %s)",
+            docs,
+        )
+    else:
+        vetor = " || ".join(
+            f"setweight(to_tsvector('simple', %s), '{peso}')" for peso in PESOS_PG
+        )
+        cur.executemany(
+            f"INSERT INTO {TABELA} (empresa_id, documento) VALUES (%s, {vetor})",
+            docs,
+        )
+
+
+# ============================================================
+# Consulta
+# ============================================================
+
+def _consulta(tokens, vendor) -> str:
+    if vendor == "sqlite":
+        # cada token vira prefixo entre aspas ("pous"*) — sem operadores do usuário
+        return " AND ".join(f'"{t}"*' for t in tokens)
+    return " & ".join(f"{t}:*" for t in tokens)
+
+
+def filtrar(queryset, termo: str):
+    """
+    Restringe ``queryset`` às empresas que casam com ``termo`` e anota
+    ``busca_rank`` (menor = mais relevante). Ordene com ``order_by('busca_rank', ...)``.
+    """
+    tokens = tokenizar(termo)
+    if not tokens:
+        return queryset
+
+    vendor = connection.vendor
+    if not suportado():
+        return _filtrar_icontains(queryset, termo)
+
+    consulta = _consulta(tokens, vendor)
+    if vendor == "sqlite":
+        pesos = ", ".join(str(p) for p in PESOS_FTS5)
+        ids_sql = f"SELECT rowid FROM {TABELA} WHERE {TABELA} MATCH %s"
+        rank_sql = (
+            f"SELECT bm25({TABELA}, {pesos}) FROM {TABELA} "
+            f"WHERE {TABELA} MATCH %s AND rowid = core_empresa.id"
+        )
+    else:
+        ids_sql = f"SELECT empresa_id FROM {TABELA} WHERE documento @@ to_tsquery('simple', %s)"
+        rank_sql = (
+            f"SELECT -ts_rank(documento, to_tsquery('simple', %s)) FROM {TABELA} "
+            f"WHERE empresa_id = core_empresa.id"
+        )
+
+    return queryset.filter(id__in=RawSQL(ids_sql, [consulta])).annotate(
+        busca_rank=RawSQL(rank_sql, [consulta])
+    )
+
+
+def _filtrar_icontains(queryset, termo):
+    from .models import Empresa
+
+    por_tag = Empresa.tags.through.objects.filter(tag__nome__icontains=termo).values("empresa_id")
+    return queryset.filter(
+        Q(nome__icontains=termo)
+        | Q(descricao__icontains=termo)
+        | Q(bairro__icontains=termo)
+        | Q(cidade__icontains=termo)
+        | Q(id__in=por_tag)
+    ).annotate(busca_rank=RawSQL("0", []))
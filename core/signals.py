@@ -1,10 +1,12 @@
 # core/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.db import transaction, IntegrityError
-from .models import PerfilUsuario
+from django.utils import timezone
+from .models import PerfilUsuario, Empresa, Tag, Avaliacao, ImagemEmpresa, UploadImagem
 from core.utils.cpf import generate_unique_cpf
+from . import cache_paginas, facets, favoritos, imagens, indice_facetas, mapa, search, templates_prontos
 
 @receiver(post_save, sender=User)
 def ensure_perfil(sender, instance: User, created: bool, **kwargs):
@@ -29,3 +31,297 @@ def ensure_perfil(sender, instance: User, created: bool, **kwargs):
             break
         except IntegrityError:
             cpf = generate_unique_cpf(PerfilUsuario, "cpf_cnpj")
+
+
+# ============================================================
+# Índice de busca (core.search)
+# ============================================================
+
+@receiver(post_save, sender=Empresa)
+def indexar_empresa(sender, instance: Empresa, raw=False, using="default", **kwargs):
+    if raw:
+        return
+    search.indexar([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Empresa)
+def desindexar_empresa(sender, instance: Empresa, using="default", **kwargs):
+    search.remover([instance.pk], using=using)
+
+
+@receiver(m2m_changed, sender=Empresa.tags.through)
+def reindexar_tags_empresa(sender, instance, action, reverse, pk_set, using="default", **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if not reverse:
+        # empresa.tags.add/remove/clear
+        if action != "pre_clear":
+            search.indexar([instance.pk], using=using)
+        return
+    # tag.empresas.add/remove/clear — no clear precisamos guardar os ids antes
+    if action == "pre_clear":
+        instance._busca_empresa_ids = list(instance.empresas.values_list("id", flat=True))
+        return
+    ids = pk_set if action != "post_clear" else getattr(instance, "_busca_empresa_ids", [])
+    search.indexar(ids or [], using=using)
+
+
+def _so_mudou_o_pai(update_fields):
+    # gerenciar_tags move subtags com save(update_fields=['parent']): o nome não muda
+    return update_fields is not None and set(update_fields) == {"parent"}
+
+
+@receiver(post_save, sender=Tag)
+def reindexar_tag_renomeada(sender, instance: Tag, created, raw=False, using="default", update_fields=None, **kwargs):
+    if created or raw or _so_mudou_o_pai(update_fields):
+        return
+    search.indexar(instance.empresas.values_list("id", flat=True), using=using)
+
+
+@receiver(pre_delete, sender=Tag)
+def guardar_empresas_da_tag(sender, instance: Tag, **kwargs):
+    instance._busca_empresa_ids = list(instance.empresas.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindexar_tag_removida(sender, instance: Tag, using="default", **kwargs):
+    search.indexar(getattr(instance, "_busca_empresa_ids", []), using=using)
+
+
+# ============================================================
+# Facetas globais (core.facets)
+# ============================================================
+
+def _invalidar_facetas(**kwargs):
+    # invalida já (mesmo processo) e de novo após o commit, para que outro
+    # processo não guarde em cache o estado anterior à transação
+    facets.invalidar()
+    transaction.on_commit(facets.invalidar)
+
+
+for _model in (Tag, Empresa):
+    post_save.connect(_invalidar_facetas, sender=_model, dispatch_uid=f"facetas_save_{_model.__name__}")
+    post_delete.connect(_invalidar_facetas, sender=_model, dispatch_uid=f"facetas_delete_{_model.__name__}")
+
+
+# ============================================================
+# Índice de facetas em memória (core.indice_facetas)
+# ============================================================
+
+@receiver(post_save, sender=Empresa)
+def indice_empresa_salva(sender, instance: Empresa, raw=False, **kwargs):
+    if raw:
+        indice_facetas.invalidar()
+    else:
+        indice_facetas.atualizar_empresas([instance.pk])
+
+
+@receiver(post_delete, sender=Empresa)
+def indice_empresa_removida(sender, instance: Empresa, **kwargs):
+    indice_facetas.remover_empresas([instance.pk])
+
+
+@receiver(m2m_changed, sender=Empresa.tags.through)
+def indice_tags_empresa(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        indice_facetas.atualizar_empresas([instance.pk])
+    else:
+        # ids do clear guardados em pre_clear por reindexar_tags_empresa
+        indice_facetas.atualizar_empresas(
+            pk_set if action != "post_clear" else getattr(instance, "_busca_empresa_ids", [])
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def indice_tag(sender, instance: Tag, **kwargs):
+    # tags novas, removidas (o CASCADE leva as linhas de core_empresa_tags) ou de outro pai
+    indice_facetas.atualizar_tags()
+
+
+# ============================================================
+# Clusters do mapa (core.mapa)
+# ============================================================
+
+def _invalidar_mapa(**kwargs):
+    mapa.invalidar()
+    transaction.on_commit(mapa.invalidar)
+
+
+post_save.connect(_invalidar_mapa, sender=Empresa, dispatch_uid="mapa_save_Empresa")
+post_delete.connect(_invalidar_mapa, sender=Empresa, dispatch_uid="mapa_delete_Empresa")
+
+
+# ============================================================
+# Agregados de avaliação (Empresa.nota_media / total_avaliacoes)
+# ============================================================
+
+@receiver(post_save, sender=Avaliacao)
+@receiver(post_delete, sender=Avaliacao)
+def atualizar_agregados_avaliacao(sender, instance: Avaliacao, raw=False, origin=None, **kwargs):
+    if raw:
+        return
+    # excluindo a própria empresa (cascade): não há o que recalcular
+    if isinstance(origin, Empresa) or getattr(origin, "model", None) is Empresa:
+        return
+    Empresa.recalcular_avaliacoes(instance.empresa_id)
+
+
+# ============================================================
+# Derivados de imagem (core.imagens)
+# ============================================================
+
+@receiver(post_delete, sender=ImagemEmpresa)
+def remover_derivados_imagem(sender, instance: ImagemEmpresa, **kwargs):
+    derivados, storage = instance.derivados, instance.imagem.storage
+    transaction.on_commit(lambda: imagens.remover(derivados, storage))
+
+
+@receiver(post_delete, sender=PerfilUsuario)
+def remover_derivados_avatar(sender, instance: PerfilUsuario, **kwargs):
+    derivados, storage = instance.avatar_derivados, instance.avatar.storage
+    transaction.on_commit(lambda: imagens.remover(derivados, storage))
+
+
+@receiver(post_delete, sender=UploadImagem)
+def remover_staging_upload(sender, instance: UploadImagem, **kwargs):
+    # empresa excluída com uploads ainda na fila: o arquivo do staging não fica para trás
+    if instance.arquivo:
+        nome, storage = instance.arquivo.name, instance.arquivo.storage
+        transaction.on_commit(lambda: storage.delete(nome))
+
+
+# ============================================================
+# Empresa.updated_at (ETag / Last-Modified)
+# ============================================================
+
+@receiver(post_save, sender=ImagemEmpresa)
+@receiver(post_delete, sender=ImagemEmpresa)
+def tocar_empresa_da_imagem(sender, instance: ImagemEmpresa, raw=False, **kwargs):
+    # avaliações já tocam a empresa em Empresa.recalcular_avaliacoes
+    if not raw:
+        Empresa.tocar([instance.empresa_id])
+
+
+@receiver(m2m_changed, sender=Empresa.tags.through)
+def tocar_empresas_das_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        Empresa.tocar([instance.pk])
+    else:
+        # ids do clear guardados em pre_clear por reindexar_tags_empresa
+        Empresa.tocar(pk_set if action != "post_clear" else getattr(instance, "_busca_empresa_ids", []))
+
+
+@receiver(post_save, sender=Tag)
+def tocar_empresas_da_tag_renomeada(sender, instance: Tag, created, raw=False, update_fields=None, **kwargs):
+    if not created and not raw and not _so_mudou_o_pai(update_fields):
+        Empresa.objects.filter(tags=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Tag)
+def tocar_empresas_da_tag_removida(sender, instance: Tag, **kwargs):
+    Empresa.tocar(getattr(instance, "_busca_empresa_ids", []))
+
+
+@receiver(post_save, sender=PerfilUsuario)
+def tocar_empresas_avaliadas_pelo_perfil(sender, instance: PerfilUsuario, created=False, **kwargs):
+    # nome e avatar de quem avaliou aparecem no detalhe
+    if not created:
+        Empresa.tocar(Avaliacao.objects.filter(user_id=instance.user_id).values_list("empresa_id", flat=True))
+
+
+# ============================================================
+# Cache de páginas anônimas (core.cache_paginas)
+# ============================================================
+
+def _invalidar_paginas(funcao, *args):
+    funcao(*args)
+    transaction.on_commit(lambda: funcao(*args))
+
+
+def _slug_da_empresa(empresa_id):
+    return Empresa.objects.filter(pk=empresa_id).values_list("slug", flat=True).first()
+
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def paginas_empresa(sender, instance: Empresa, **kwargs):
+    # slug trocado: a página do slug antigo também sai do cache
+    slugs = {instance.slug, getattr(instance, "_slug_do_banco", None)}
+    _invalidar_paginas(cache_paginas.invalidar_empresas, slugs)
+
+
+@receiver(post_save, sender=ImagemEmpresa)
+@receiver(post_delete, sender=ImagemEmpresa)
+@receiver(post_save, sender=Avaliacao)
+@receiver(post_delete, sender=Avaliacao)
+def paginas_da_empresa_relacionada(sender, instance, **kwargs):
+    _invalidar_paginas(cache_paginas.invalidar_empresas, {_slug_da_empresa(instance.empresa_id)})
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def paginas_tag(sender, instance: Tag, **kwargs):
+    _invalidar_paginas(cache_paginas.invalidar_tags)
+
+
+@receiver(m2m_changed, sender=Empresa.tags.through)
+def paginas_tags_empresa(sender, instance, action, reverse, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        _invalidar_paginas(cache_paginas.invalidar_tags)
+    else:
+        _invalidar_paginas(cache_paginas.invalidar_empresas, {instance.slug})
+
+
+@receiver(post_save, sender=PerfilUsuario)
+def paginas_avaliacoes_do_perfil(sender, instance: PerfilUsuario, created=False, **kwargs):
+    # nome e avatar de quem avaliou aparecem no detalhe das empresas avaliadas
+    if created:
+        return
+    slugs = set(Avaliacao.objects.filter(user_id=instance.user_id).values_list("empresa__slug", flat=True))
+    if slugs:
+        _invalidar_paginas(cache_paginas.invalidar_empresas, slugs)
+
+
+# ============================================================
+# Conjunto de favoritos por usuário (core.favoritos)
+# ============================================================
+
+@receiver(m2m_changed, sender=PerfilUsuario.favoritos.through)
+def favoritos_alterados(sender, instance, action, reverse, pk_set, **kwargs):
+    # perfil.favoritos.add(...) / admin; core.favoritos invalida o que grava
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            favoritos.invalidar([instance.user_id])
+        return
+    if action == "pre_clear":
+        instance._favoritos_user_ids = list(instance.favoritado_por.values_list("user_id", flat=True))
+        return
+    if action in ("post_add", "post_remove"):
+        favoritos.invalidar(PerfilUsuario.objects.filter(pk__in=pk_set).values_list("user_id", flat=True))
+    elif action == "post_clear":
+        favoritos.invalidar(getattr(instance, "_favoritos_user_ids", []))
+
+
+# ============================================================
+# Menu do cabeçalho em cache (core.templates_prontos)
+# ============================================================
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def cabecalho_do_usuario(sender, instance: User, **kwargs):
+    # nome (first_name/username) e is_staff
+    templates_prontos.invalidar_cabecalho([instance.pk])
+
+
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def cabecalho_do_perfil(sender, instance: PerfilUsuario, **kwargs):
+    # nome, avatar e tema
+    templates_prontos.invalidar_cabecalho([instance.user_id])
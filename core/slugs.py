@@ -0,0 +1,143 @@
+# core/slugs.py
+"""
+Alocação de slugs únicos.
+
+Em vez de testar ``slug``, ``slug-1``, ``slug-2``... com uma consulta cada,
+os slugs que podem colidir com uma base (``base`` e ``base-*``) são lidos de
+uma vez (intervalo de prefixo no índice único) e o próximo sufixo livre é
+escolhido em memória.
+
+- ``alocar(model, texto)``: um slug, uma consulta (usado por ``Empresa.save``);
+- ``AlocadorSlugs``: lote — carrega as colisões de muitas bases em poucas
+  consultas (ou a tabela toda, quando ela já está sendo lida) e aloca
+  milhares de slugs sem voltar ao banco (importação, ``regenerate_slugs``);
+- ``preencher_faltantes(model)``: gera os slugs vazios em blocos com
+  ``bulk_update``.
+
+A unicidade definitiva é a do índice: quem grava trata o ``IntegrityError``
+de um insert concorrente realocando e tentando de novo.
+
+Só recebe a classe do model (não importa ``core.models``). As migrações
+não usam este módulo: a 0012 tem a sua cópia congelada do algoritmo.
+"""
+from __future__ import annotations
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+BASE_PADRAO = "empresa"
+FOLGA_SUFIXO = 8        # espaço reservado para "-<n>" dentro do max_length
+BASES_POR_CONSULTA = 100
+TENTATIVAS = 3
+
+
+def base_do_slug(texto, max_length) -> str:
+    base = slugify(texto or "") or BASE_PADRAO
+    return base[:max_length - FOLGA_SUFIXO].strip("-") or BASE_PADRAO
+
+
+def _filtro_colisoes(bases, campo):
+    filtro = Q()
+    for base in bases:
+        filtro |= Q(**{campo: base}) | Q(**{f"{campo}__startswith": f"{base}-"})
+    return filtro
+
+
+def proximo_livre(base, ocupados) -> str:
+    if base not in ocupados:
+        return base
+    n = 1
+    while f"{base}-{n}" in ocupados:
+        n += 1
+    return f"{base}-{n}"
+
+
+def alocar(model, texto, excluir_pk=None, campo="slug") -> str:
+    """Slug livre para ``texto`` em ``model`` (uma consulta)."""
+    base = base_do_slug(texto, model._meta.get_field(campo).max_length)
+    qs = model._default_manager.filter(_filtro_colisoes([base], campo))
+    if excluir_pk is not None:
+        qs = qs.exclude(pk=excluir_pk)
+    return proximo_livre(base, set(qs.values_list(campo, flat=True)))
+
+
+class AlocadorSlugs:
+    """Aloca slugs para um lote de registros, lendo as colisões em poucas consultas."""
+
+    def __init__(self, model, campo="slug"):
+        self.model = model
+        self.campo = campo
+        self.max_length = model._meta.get_field(campo).max_length
+        self._ocupados = set()
+        self._bases_carregadas = set()
+        self._tudo_carregado = False
+
+    def base(self, texto) -> str:
+        return base_do_slug(texto, self.max_length)
+
+    def ocupar(self, slug):
+        if slug:
+            self._ocupados.add(slug)
+
+    def marcar_tudo_carregado(self):
+        """Quem já leu todos os slugs da tabela (e chamou ``ocupar``) dispensa as consultas."""
+        self._tudo_carregado = True
+
+    def carregar(self, textos):
+        """Lê os slugs que colidem com as bases de ``textos`` (um bloco de bases por consulta)."""
+        if self._tudo_carregado:
+            return
+        faltando = sorted({self.base(t) for t in textos} - self._bases_carregadas)
+        manager = self.model._default_manager
+        for i in range(0, len(faltando), BASES_POR_CONSULTA):
+            bases = faltando[i:i + BASES_POR_CONSULTA]
+            self._ocupados.update(
+                manager.filter(_filtro_colisoes(bases, self.campo)).values_list(self.campo, flat=True)
+            )
+            self._bases_carregadas.update(bases)
+
+    def recarregar(self, textos):
+        """Esquece as bases de ``textos`` e lê de novo (depois de um conflito concorrente)."""
+        self._bases_carregadas.difference_update(self.base(t) for t in textos)
+        self._tudo_carregado = False
+        self.carregar(textos)
+
+    def alocar(self, texto) -> str:
+        base = self.base(texto)
+        if not self._tudo_carregado and base not in self._bases_carregadas:
+            self.carregar([texto])
+        slug = proximo_livre(base, self._ocupados)
+        self._ocupados.add(slug)
+        return slug
+
+
+def preencher_faltantes(model, campo="slug", origem="nome", lote=1000) -> int:
+    """
+    Gera slug para todos os registros de ``model`` sem slug, em blocos de
+    ``lote`` (uma consulta de colisões + um bulk_update por bloco). Se outro
+    processo gravar um slug igual no meio do caminho, o bloco é realocado.
+    Retorna quantos registros foram preenchidos.
+    """
+    manager = model._default_manager
+    alocador = AlocadorSlugs(model, campo)
+    vazio = Q(**{f"{campo}__isnull": True}) | Q(**{campo: ""})
+    total = 0
+    while True:
+        pendentes = list(manager.filter(vazio).order_by("pk").only("pk", origem)[:lote])
+        if not pendentes:
+            return total
+        textos = [getattr(obj, origem) for obj in pendentes]
+        alocador.carregar(textos)
+        for tentativa in range(TENTATIVAS):
+            for obj, texto in zip(pendentes, textos):
+                setattr(obj, campo, alocador.alocar(texto))
+            try:
+                with transaction.atomic():
+                    manager.bulk_update(pendentes, [campo])
+                break
+            except IntegrityError:
+                if tentativa == TENTATIVAS - 1:
+                    raise
+                alocador.recarregar(textos)
+        total += len(pendentes)
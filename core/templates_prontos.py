@@ -0,0 +1,90 @@
+# core/templates_prontos.py
+"""
+Templates prontos: carregador em cache aquecido no boot e o menu do
+cabeçalho em cache.
+
+- ``aquecer()``: compila todos os templates do projeto no carregador em
+  cache (``settings.TEMPLATES``, fora de DEBUG), para a primeira requisição
+  de cada worker não pagar a leitura e o parse. Chamado pelo ``wsgi.py``.
+- Menu do cabeçalho (``components/header.html``): o ``<header>`` fica num
+  ``{% cache %}`` com chave (autenticado, staff, tema, usuário) — anônimos
+  dividem uma cópia, cada usuário logado tem a sua (nome e avatar). O
+  painel de busca fica de fora: depende da query string e das facetas.
+  Perfil, tema ou usuário alterados apagam as cópias do usuário
+  (``invalidar_cabecalho``, via signals em ``core.signals``).
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.template import TemplateSyntaxError, engines
+
+FRAGMENTO_CABECALHO = "cabecalho"  # o nome usado no {% cache %} do header.html
+
+
+# ============================================================
+# Aquecimento
+# ============================================================
+
+def _carregadores(engine):
+    for carregador in engine.template_loaders:
+        # cached.Loader embrulha os carregadores de verdade
+        yield from getattr(carregador, "loaders", [carregador])
+
+
+def _diretorios_do_projeto(engine):
+    base = Path(settings.BASE_DIR).resolve()
+    vistos = set()
+    for carregador in _carregadores(engine):
+        for diretorio in carregador.get_dirs():
+            diretorio = Path(diretorio).resolve()
+            # só templates do projeto: os do admin e de terceiros ficam para quando forem usados
+            if diretorio in vistos or not diretorio.is_relative_to(base) or not diretorio.is_dir():
+                continue
+            vistos.add(diretorio)
+            yield diretorio
+
+
+def aquecer() -> int:
+    """Carrega (e, com o carregador em cache, guarda) os templates do projeto; retorna quantos."""
+    carregados = set()
+    for backend in engines.all():
+        engine = getattr(backend, "engine", None)
+        if engine is None:
+            continue
+        for diretorio in _diretorios_do_projeto(engine):
+            for arquivo in sorted(diretorio.rglob("*.html")):
+                nome = arquivo.relative_to(diretorio).as_posix()
+                if nome in carregados:
+                    continue
+                try:
+                    backend.get_template(nome)
+                except TemplateSyntaxError:
+                    # template quebrado aparece quando for usado, não derruba o boot
+                    continue
+                carregados.add(nome)
+    return len(carregados)
+
+
+# ============================================================
+# Menu do cabeçalho
+# ============================================================
+
+def _chaves_cabecalho(user_id):
+    from .models import PerfilUsuario
+    return [
+        make_template_fragment_key(FRAGMENTO_CABECALHO, [True, staff, tema, user_id])
+        for staff in (False, True)
+        for tema, _ in PerfilUsuario.TEMA_ESCOLHAS
+    ]
+
+
+def invalidar_cabecalho(user_ids):
+    chaves = [c for u in set(user_ids) if u for c in _chaves_cabecalho(u)]
+    if chaves:
+        cache.delete_many(chaves)
+        transaction.on_commit(lambda: cache.delete_many(chaves))
@@ -2,6 +2,7 @@ from __future__ import annotations
 import re  # ✅ necessário para extrair a URL do email
 import io
 from pathlib import Path
+import tempfile
 import time
 
 from django.test import TestCase, Client, override_settings
@@ -12,7 +13,7 @@ from django.contrib.auth.models import User
 from django import forms
 
 from core.forms import UserRegistrationForm, CustomLoginForm, EmpresaForm
-from core.models import PerfilUsuario, Empresa, Categoria
+from core.models import PerfilUsuario, Empresa
 
 # Para gerar XLSX em memória
 from openpyxl import Workbook
@@ -73,10 +74,10 @@ class PaginaLoginTest(TestCase):
 class TestesFuncionalidadesCRUD(TestCase):
     def setUp(self):
         print("\n\n🟣  SUITE: CRUD BÁSICO")
-        self.categoria = Categoria.objects.create(nome='Restaurante')
         self.user = User.objects.create_user(username='testuser', password='password123')
-        PerfilUsuario.objects.create(user=self.user, cpf_cnpj='12345678900', full_name='Test User')
-        print("⚙️  setUp -> categoria 'Restaurante' e usuário 'testuser' prontos.")
+        # o perfil é criado pelo signal ensure_perfil
+        PerfilUsuario.objects.filter(user=self.user).update(cpf_cnpj='12345678900', full_name='Test User')
+        print("⚙️  setUp -> usuário 'testuser' pronto.")
 
     def test_cadastro_de_usuario_sucesso(self):
         print("🧪 Cadastro de usuário (POST) ...", end=" ")
@@ -101,7 +102,6 @@ class TestesFuncionalidadesCRUD(TestCase):
         self.client.login(username='testuser', password='password123')
         form_data = {
             'nome': 'Pizzaria Teste',
-            'categoria': self.categoria.id,
             'descricao': 'Melhor pizza da cidade.',
             'rua': 'Rua dos Testes', 'bairro': 'Centro', 'cidade': 'Araranguá',
             'numero': '123', 'cep': '88900000',
@@ -123,13 +123,13 @@ class TestesFuncionalidadesCRUD(TestCase):
         print("🧪 Edição de empresa (POST) ...", end=" ")
         self.client.login(username='testuser', password='password123')
         empresa = Empresa.objects.create(
-            user=self.user, nome='Nome Antigo', categoria=self.categoria,
+            user=self.user, nome='Nome Antigo',
             descricao='Desc antiga', rua='Rua Antiga', bairro='Bairro Antigo',
             cidade='Cidade Antiga', numero='1', cep='12345678',
             telefone='11111111111', email='antigo@email.com'
         )
         form_data_atualizado = {
-            'nome': 'Nome Novo Editado', 'categoria': self.categoria.id,
+            'nome': 'Nome Novo Editado',
             'descricao': 'Descrição nova e atualizada.', 'rua': 'Rua Nova',
             'bairro': 'Bairro Novo', 'cidade': 'Cidade Nova', 'numero': '2',
             'cep': '87654321', 'telefone': '22222222222', 'email': 'novo@email.com'
@@ -147,21 +147,38 @@ class TestesFuncionalidadesCRUD(TestCase):
 @override_settings(**TEST_OVERRIDES)
 class BaseSetup(TestCase):
     def setUp(self):
+        from django.core.cache import cache
+        from core import indice_facetas
+        cache.clear()
+        # como num processo já aquecido: daqui em diante os signals só atualizam o índice
+        indice_facetas.todas()
         self.client = Client()
         # Usuário 1
         self.user = User.objects.create_user(
             username="teste", email="teste@example.com", password="Senha@123"
         )
-        PerfilUsuario.objects.create(user=self.user, cpf_cnpj="12345678900", full_name="Teste Um")
+        # o perfil é criado pelo signal ensure_perfil
+        PerfilUsuario.objects.filter(user=self.user).update(cpf_cnpj="12345678900", full_name="Teste Um")
 
         # Usuário 2
         self.user2 = User.objects.create_user(
             username="outro", email="outro@example.com", password="Senha@123"
         )
-        PerfilUsuario.objects.create(user=self.user2, cpf_cnpj="98765432100", full_name="Teste Dois")
+        PerfilUsuario.objects.filter(user=self.user2).update(cpf_cnpj="98765432100", full_name="Teste Dois")
 
-        # Categoria
-        self.cat = Categoria.objects.create(nome="Pousada")
+    def criar_empresa(self, nome, **extra):
+        extra.setdefault("cidade", "Araranguá")
+        return Empresa.objects.create(user=self.user, nome=nome, **extra)
+
+    # centro de Araranguá; dlat/dlng em graus
+    CENTRO = (-28.9356, -49.4918)
+
+    def criar_em(self, nome, dlat, dlng=0.0):
+        from decimal import Decimal
+        lat, lng = self.CENTRO
+        return self.criar_empresa(
+            nome, latitude=Decimal(f"{lat + dlat:.7f}"), longitude=Decimal(f"{lng + dlng:.7f}")
+        )
 
 
 # ========= Registro & Login =========
@@ -243,7 +260,7 @@ class AuthTests(BaseSetup):
 class EmpresaFormTests(BaseSetup):
     def test_numero_digits_only(self):
         form = EmpresaForm(data={
-            "nome": "E1", "categoria": self.cat.id, "descricao": "",
+            "nome": "E1", "descricao": "",
             "rua": "R", "bairro": "B", "cidade": "C", "numero": "12A",
             "cep": "88900000", "telefone": "48999999999", "email": "e@e.com",
             "latitude": "-28.9", "longitude": "-49.48"
@@ -253,7 +270,7 @@ class EmpresaFormTests(BaseSetup):
 
     def test_telefone_len_and_clean(self):
         form = EmpresaForm(data={
-            "nome": "E1", "categoria": self.cat.id, "descricao": "",
+            "nome": "E1", "descricao": "",
             "rua": "R", "bairro": "B", "cidade": "C", "numero": "12",
             "cep": "88900000", "telefone": "(48) 99999-9999", "email": "e@e.com",
             "latitude": "-28.9", "longitude": "-49.48"
@@ -264,7 +281,7 @@ class EmpresaFormTests(BaseSetup):
 
     def test_sem_telefone_email_logic(self):
         form = EmpresaForm(data={
-            "nome": "E1", "categoria": self.cat.id, "descricao": "",
+            "nome": "E1", "descricao": "",
             "rua": "R", "bairro": "B", "cidade": "C", "numero": "12",
             "cep": "88900000", "telefone": "", "sem_telefone": "on",
             "email": "e@e.com", "latitude": "-28.9", "longitude": "-49.48"
@@ -273,7 +290,7 @@ class EmpresaFormTests(BaseSetup):
         self.assertEqual(form.cleaned_data["telefone"], "")
 
         form = EmpresaForm(data={
-            "nome": "E2", "categoria": self.cat.id, "descricao": "",
+            "nome": "E2", "descricao": "",
             "rua": "R", "bairro": "B", "cidade": "C", "numero": "12",
             "cep": "88900000", "telefone": "48999999999", "email": "",
             "sem_email": "on", "latitude": "-28.9", "longitude": "-49.48"
@@ -282,7 +299,7 @@ class EmpresaFormTests(BaseSetup):
         self.assertEqual(form.cleaned_data["email"], "")
 
         form = EmpresaForm(data={
-            "nome": "E3", "categoria": self.cat.id, "descricao": "",
+            "nome": "E3", "descricao": "",
             "rua": "R", "bairro": "B", "cidade": "C", "numero": "12",
             "cep": "88900000", "telefone": "", "email": "",
             "latitude": "-28.9", "longitude": "-49.48"
@@ -293,7 +310,7 @@ class EmpresaFormTests(BaseSetup):
 
     def test_social_urls(self):
         form = EmpresaForm(data={
-            "nome": "E1", "categoria": self.cat.id, "descricao": "",
+            "nome": "E1", "descricao": "",
             "rua": "R", "bairro": "B", "cidade": "C", "numero": "12",
             "cep": "88900000", "telefone": "48999999999", "email": "e@e.com",
             "facebook": "https://x.com/abc", "instagram": "https://instagram.com/ok",
@@ -303,7 +320,7 @@ class EmpresaFormTests(BaseSetup):
         self.assertIn("facebook", form.errors)
 
         form = EmpresaForm(data={
-            "nome": "E1", "categoria": self.cat.id, "descricao": "",
+            "nome": "E1", "descricao": "",
             "rua": "R", "bairro": "B", "cidade": "C", "numero": "12",
             "cep": "88900000", "telefone": "48999999999", "email": "e@e.com",
             "facebook": "https://facebook.com/ok", "instagram": "https://site.com/abc",
@@ -328,7 +345,6 @@ class EmpresaViewsTests(BaseSetup):
         url = reverse("cadastrar_empresa")
         resp = self.client.post(url, {
             "nome": "Hotel Azul",
-            "categoria": self.cat.id,
             "descricao": "desc",
             "rua": "Av",
             "bairro": "Centro",
@@ -349,7 +365,6 @@ class EmpresaViewsTests(BaseSetup):
         url = reverse("cadastrar_empresa")
         resp = self.client.post(url, {
             "nome": "",
-            "categoria": self.cat.id,
             "rua": "Av", "bairro": "B", "cidade": "C", "numero": "1",
             "cep": "88900000", "telefone": "48999999999", "email": "e@e.com",
             "latitude": "-28.9", "longitude": "-49.48"
@@ -360,7 +375,7 @@ class EmpresaViewsTests(BaseSetup):
     def test_edit_empresa_only_owner(self):
         self.login(1)
         e = Empresa.objects.create(
-            user=self.user, nome="X", categoria=self.cat,
+            user=self.user, nome="X",
             rua="R", bairro="B", cidade="C", numero="1", cep="88900000",
             telefone="48999999999", email="e@e.com",
             latitude="-28.9", longitude="-49.48"
@@ -380,7 +395,6 @@ class EmpresaViewsTests(BaseSetup):
         url = reverse("cadastrar_empresa")
         data = {
             "nome": "ComArquivo",
-            "categoria": self.cat.id,
             "rua": "R", "bairro": "B", "cidade": "C", "numero": "1",
             "cep": "88900000", "telefone": "48999999999", "email": "e@e.com",
             "latitude": "-28.9", "longitude": "-49.48",
@@ -396,7 +410,7 @@ class EmpresaViewsTests(BaseSetup):
         self.login(1)
         for i in range(7):
             Empresa.objects.create(
-                user=self.user, nome=f"E{i}", categoria=self.cat,
+                user=self.user, nome=f"E{i}",
                 rua="R", bairro="B", cidade="C", numero="1", cep="88900000",
                 telefone="48999999999", email="e@e.com",
                 latitude="-28.9", longitude="-49.48"
@@ -413,7 +427,13 @@ class EmpresaViewsTests(BaseSetup):
 
 # ========= Importação XLSX =========
 
-@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", **TEST_OVERRIDES)
+IMPORTACAO_TESTES = dict(
+    IMPORTACAO_EXECUTOR="sincrono",
+    IMPORTACAO_ROOT=str(Path(tempfile.gettempdir()) / "arutourism-testes-importacao"),
+)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", **TEST_OVERRIDES, **IMPORTACAO_TESTES)
 class ImportacaoTests(BaseSetup):
     def test_importar_xlsx_ok(self):
         self.client.login(username="teste", password="Senha@123")
@@ -437,10 +457,11 @@ class ImportacaoTests(BaseSetup):
             content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
         resp = self.client.post(url, {"arquivo": up})
-        self.assertEqual(resp.status_code, 200, resp.content)
-        j = resp.json()
-        self.assertTrue(j.get("ok"))
-        self.assertEqual(j.get("importados"), 1)
+        self.assertEqual(resp.status_code, 202, resp.content)
+        j = self.client.get(resp.json()["status_url"]).json()
+        self.assertTrue(j.get("ok"), j)
+        self.assertTrue(j["finalizado"])
+        self.assertEqual((j["criados"], j["atualizados"], j["erros"]), (1, 0, 0), j)
         self.assertTrue(Empresa.objects.filter(nome="Pousada Teste").exists())
 
 
@@ -540,4 +561,1454 @@ class EmpresaForm(forms.ModelForm):
         # tamanho opcional:
         # if f.size > 5 * 1024 * 1024:
         #     raise forms.ValidationError("Imagem muito grande (máx 5MB).")
-        return f
\ No newline at end of file
+        return f
+
+# ========= Catálogo (busca, listagem, performance) =========
+
+@override_settings(**TEST_OVERRIDES)
+class BuscaTextualTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        from core.models import Tag
+        self.tag = Tag.objects.create(nome="Frutos do Mar Típicos")
+        self.pousada = self.criar_empresa("Pousada Beira Mar", descricao="Café colonial", bairro="Morro dos Conventos")
+        self.restaurante = self.criar_empresa("Restaurante Sabor", descricao="Comida típica")
+        self.restaurante.tags.add(self.tag)
+
+    def buscar(self, termo):
+        resp = self.client.get(reverse("listar_empresas"), {"q": termo})
+        self.assertEqual(resp.status_code, 200)
+        return [e.nome for e in resp.context["page_obj"]]
+
+    def test_busca_sem_acento_e_por_prefixo(self):
+        self.assertEqual(self.buscar("cafe"), ["Pousada Beira Mar"])
+        self.assertEqual(self.buscar("conven"), ["Pousada Beira Mar"])
+        self.assertEqual(self.buscar("ARARANGUA"), ["Restaurante Sabor", "Pousada Beira Mar"])
+
+    def test_busca_por_tag_acompanha_alteracoes(self):
+        self.assertEqual(self.buscar("tipicos"), ["Restaurante Sabor"])
+        self.tag.nome = "Culinária"
+        self.tag.save()
+        self.assertEqual(self.buscar("tipicos"), [])
+        self.assertEqual(self.buscar("culinaria"), ["Restaurante Sabor"])
+        self.restaurante.tags.clear()
+        self.assertEqual(self.buscar("culinaria"), [])
+
+    def test_busca_ordena_por_relevancia_e_remove_excluidas(self):
+        self.criar_empresa("Bar do Mar", descricao="Petiscos")
+        self.criar_empresa("Mercado Central", descricao="Frutos do mar")
+        self.assertEqual(self.buscar("mar")[0], "Bar do Mar")
+        self.pousada.delete()
+        self.assertNotIn("Pousada Beira Mar", self.buscar("mar"))
+
+
+@override_settings(**TEST_OVERRIDES)
+class FacetasCacheTests(BaseSetup):
+    def test_facetas_em_cache_e_invalidadas_por_signal(self):
+        from core.models import Tag
+        self.criar_empresa("Pousada A", cidade="Araranguá")
+        url = reverse("filtros_empresas")
+
+        resp = self.client.get(url)
+        self.assertIn("Araranguá", resp.json()["cidades"])
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        self.criar_empresa("Pousada B", cidade="Balneário Arroio do Silva")
+        Tag.objects.create(nome="Mirante")
+        with self.assertNumQueries(2):
+            dados = self.client.get(url).json()
+        self.assertIn("Balneário Arroio do Silva", dados["cidades"])
+        self.assertIn("Mirante", [t["nome"] for t in dados["tags"]])
+
+    def test_paginas_sem_filtros_nao_consultam_facetas(self):
+        from core.context_processors import search_filters
+        with self.assertNumQueries(0):
+            ctx = search_filters(None)
+        with self.assertNumQueries(2):
+            self.assertTrue(len(ctx["GLOBAL_TAGS"]) >= 0)
+            list(ctx["GLOBAL_CITIES"])
+
+
+@override_settings(**TEST_OVERRIDES)
+class CardsSemNMaisUmTests(BaseSetup):
+    def popular(self, n):
+        from core.models import Tag, ImagemEmpresa
+        tags = [Tag.objects.get_or_create(nome=f"Tag {i}")[0] for i in range(3)]
+        for i in range(n):
+            e = self.criar_empresa(f"Empresa {Empresa.objects.count()}")
+            e.tags.set(tags)
+            ImagemEmpresa.objects.create(empresa=e, imagem=f"empresas/galeria/{e.pk}-a.jpg")
+            ImagemEmpresa.objects.create(empresa=e, imagem=f"empresas/galeria/{e.pk}-capa.jpg", principal=True)
+
+    def contar_queries_pagina(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("listar_empresas"), HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp.json()["html"]
+
+    def test_pagina_de_12_cards_tem_numero_fixo_de_queries(self):
+        self.popular(12)
+        n12, html = self.contar_queries_pagina()
+        self.assertEqual(html.count("empresa-card"), 12)
+        self.assertIn("-capa.jpg", html)
+        self.assertNotIn("-a.jpg", html)
+        self.assertIn("Tag 0", html)
+
+        self.popular(36)
+        n48, html = self.contar_queries_pagina()
+        self.assertEqual(html.count("empresa-card"), 12)
+        self.assertEqual(n12, n48)
+        # Max(updated_at) da ETag + página + prefetch de tags + prefetch de capas
+        # (o JSON não faz COUNT)
+        self.assertEqual(n48, 4)
+
+
+@override_settings(**TEST_OVERRIDES)
+class AgregadosAvaliacaoTests(BaseSetup):
+    def test_agregados_acompanham_criacao_e_remocao(self):
+        from core.models import Avaliacao
+        empresa = self.criar_empresa("Pousada Nota")
+        outro = User.objects.create_user(username="visitante", password="Senha@123")
+        a1 = Avaliacao.objects.create(empresa=empresa, user=self.user, nota=5)
+        Avaliacao.objects.create(empresa=empresa, user=outro, nota=2)
+
+        empresa.refresh_from_db()
+        self.assertEqual(empresa.total_avaliacoes, 2)
+        self.assertEqual(str(empresa.nota_media), "3.50")
+        self.assertEqual((empresa.avaliacoes_5, empresa.avaliacoes_2), (1, 1))
+
+        a1.delete()
+        empresa.refresh_from_db()
+        self.assertEqual(empresa.total_avaliacoes, 1)
+        self.assertEqual(str(empresa.nota_media), "2.00")
+        self.assertEqual(empresa.avaliacoes_5, 0)
+
+        empresa.delete()
+        self.assertFalse(Avaliacao.objects.exists())
+
+    def test_comando_recalcula_em_lote(self):
+        from django.core.management import call_command
+        from core.models import Avaliacao
+        empresa = self.criar_empresa("Pousada Lote")
+        Avaliacao.objects.create(empresa=empresa, user=self.user, nota=4)
+        Empresa.objects.filter(pk=empresa.pk).update(total_avaliacoes=0, nota_media=0, avaliacoes_4=0)
+
+        call_command("recalcular_avaliacoes", stdout=io.StringIO())
+        empresa.refresh_from_db()
+        self.assertEqual((empresa.total_avaliacoes, empresa.avaliacoes_4), (1, 1))
+        self.assertEqual(str(empresa.nota_media), "4.00")
+
+        resp = self.client.get(reverse("empresa_detalhe", args=[empresa.slug]))
+        self.assertContains(resp, "(1 avaliação)")
+
+
+@override_settings(**TEST_OVERRIDES)
+class PaginacaoCursorTests(BaseSetup):
+    def ler_tudo(self, url, params=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        nomes, cursor = [], None
+        while True:
+            dados = dict(params or {}, ajax="1")
+            if cursor:
+                dados["cursor"] = cursor
+            with CaptureQueriesContext(connection) as ctx:
+                j = self.client.get(url, dados).json()
+            self.assertFalse(any("COUNT(" in q["sql"].upper() for q in ctx.captured_queries))
+            nomes += re.findall(r'aria-label="Ver detalhes de ([^"]+)"', j["html"])
+            cursor = j["next_cursor"]
+            self.assertEqual(j["has_next"], cursor is not None)
+            if not cursor:
+                return nomes
+
+    def test_listagem_percorre_tudo_sem_count(self):
+        criadas = [self.criar_empresa(f"Ponto {i:02d}").nome for i in range(30)]
+        nomes = self.ler_tudo(reverse("listar_empresas"))
+        self.assertEqual(nomes, list(reversed(criadas)))
+
+        # primeiro render HTML mantém paginação numerada e já entrega o cursor
+        resp = self.client.get(reverse("listar_empresas"))
+        self.assertEqual(resp.context["page_obj"].paginator.count, 30)
+        self.assertContains(resp, 'data-next-cursor="%s"' % resp.context["next_cursor"])
+
+    def test_busca_e_suas_empresas_com_cursor(self):
+        for i in range(15):
+            self.criar_empresa(f"Pousada {i:02d}")
+        self.criar_empresa("Restaurante Fora")
+        self.assertEqual(len(self.ler_tudo(reverse("listar_empresas"), {"q": "pousada"})), 15)
+
+        self.client.login(username="teste", password="Senha@123")
+        nomes = self.ler_tudo(reverse("suas_empresas"))
+        self.assertEqual(len(nomes), 16)
+        self.assertEqual(len(set(nomes)), 16)
+
+    def test_cursor_invalido_volta_ao_inicio(self):
+        self.criar_empresa("Única")
+        j = self.client.get(reverse("listar_empresas"), {"ajax": "1", "cursor": "%%%lixo"}).json()
+        self.assertIn("Única", j["html"])
+        self.assertIsNone(j["next_cursor"])
+
+    def test_cursor_adulterado_volta_ao_inicio(self):
+        from core import pagination
+        for i in range(3):
+            self.criar_empresa(f"Pousada {i}")
+        self.client.login(username="teste", password="Senha@123")
+        adulterados = [
+            {"o": "abc"}, {"o": -5}, {"o": 10 ** 30}, {"o": True},
+            {"k": ["abc"]}, {"k": [1.5]}, {"k": [10 ** 30]}, {"k": [{"dt": "ruim"}]},
+            {"k": [{"dt": "2024-01-01T00:00:00"}, "x"]}, {"k": [None, None]}, {"k": [[1]]},
+        ]
+        for dados in adulterados:
+            cursor = pagination._codificar(dados)
+            for url, params in ((reverse("listar_empresas"), {"q": "pousada"}),
+                                (reverse("suas_empresas"), {})):
+                resp = self.client.get(url, dict(params, ajax="1", cursor=cursor),
+                                       HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+                self.assertEqual(resp.status_code, 200, (url, dados))
+                self.assertEqual(len(re.findall(r'aria-label="Ver detalhes de', resp.json()["html"])), 3, (url, dados))
+
+
+@override_settings(**TEST_OVERRIDES, **IMPORTACAO_TESTES)
+class ImportacaoEmLoteTests(BaseSetup):
+    def enviar_csv(self, linhas):
+        buf = io.StringIO()
+        import csv
+        w = csv.writer(buf)
+        w.writerow(["NOME", "TELEFONE", "CNPJ", "CIDADE", "CATEGORIA", "DESCRIÇÃO"])
+        w.writerows(linhas)
+        up = SimpleUploadedFile("empresas.csv", buf.getvalue().encode("utf-8"), content_type="text/csv")
+        self.client.login(username="teste", password="Senha@123")
+        resp = self.client.post(reverse("importar_empresas_arquivo"), {"arquivo": up})
+        self.assertEqual(resp.status_code, 202, resp.content)
+        # a resposta do upload só traz o job; o resultado vem do endpoint de status
+        return self.client.get(resp.json()["status_url"]).json()
+
+    def test_cria_atualiza_e_reporta_erros_por_linha(self):
+        existente = self.criar_empresa("Pousada Antiga", telefone="48999990000")
+        j = self.enviar_csv([
+            ["Pousada Nova", "(48) 98888-0000", "", "Araranguá", "Pousadas, Praia", "Vista para o mar"],
+            ["Pousada Antiga Renovada", "48 99999-0000", "", "Araranguá", "", ""],
+            ["", "48977770000", "", "Araranguá", "", ""],
+            ["Pousada Nova", "48988880000", "", "Araranguá", "Pousadas", "Vista para o mar"],
+        ])
+        self.assertEqual((j["criados"], j["atualizados"], j["erros"]), (1, 1, 1), j)
+        self.assertIn("Linha 4", j["mensagens"][0])
+
+        existente.refresh_from_db()
+        self.assertEqual(existente.nome, "Pousada Antiga Renovada")
+        nova = Empresa.objects.get(nome="Pousada Nova")
+        self.assertEqual(nova.slug, "pousada-nova")
+        self.assertEqual(sorted(t.nome for t in nova.tags.all()), ["Pousadas"])
+
+        # o índice de busca acompanha mesmo sem signals do bulk_create
+        resp = self.client.get(reverse("listar_empresas"), {"q": "vista mar"})
+        self.assertEqual([e.nome for e in resp.context["page_obj"]], ["Pousada Nova"])
+
+    def test_consultas_nao_crescem_com_o_numero_de_linhas(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.importacao import ImportadorEmpresas
+        from core.importacao import _parse_row_padrao
+
+        def linhas(n, inicio=0):
+            for i in range(inicio, inicio + n):
+                yield i + 2, {"nome": f"Ponto {i}", "telefone": f"4890000{i:04d}", "categoria": f"Tag {i % 7}"}
+
+        with CaptureQueriesContext(connection) as ctx:
+            imp = ImportadorEmpresas(self.user, lote=1000).processar(linhas(300), _parse_row_padrao)
+        self.assertEqual(imp.criados, 300)
+        self.assertLess(len(ctx.captured_queries), 30)
+
+        with CaptureQueriesContext(connection) as ctx2:
+            imp = ImportadorEmpresas(self.user, lote=1000).processar(linhas(900), _parse_row_padrao)
+        self.assertEqual((imp.criados, imp.sem_alteracao), (600, 300))
+        # o SQLite quebra o bulk_create em lotes pelo limite de variáveis;
+        # o importante é ficar muito abaixo de uma consulta por linha
+        self.assertLess(len(ctx2.captured_queries), 60)
+        self.assertEqual(Empresa.objects.filter(slug__startswith="ponto-").count(), 900)
+
+
+@override_settings(**TEST_OVERRIDES, **IMPORTACAO_TESTES)
+class FilaImportacaoTests(BaseSetup):
+    def enviar(self, conteudo, nome="empresas.csv"):
+        up = SimpleUploadedFile(nome, conteudo, content_type="text/csv")
+        self.client.login(username="teste", password="Senha@123")
+        resp = self.client.post(reverse("importar_empresas_arquivo"), {"arquivo": up})
+        self.assertEqual(resp.status_code, 202, resp.content)
+        return resp.json()
+
+    @override_settings(IMPORTACAO_EXECUTOR="worker")
+    def test_upload_retorna_na_hora_e_worker_processa(self):
+        from django.core.management import call_command
+        from core.models import ImportacaoJob
+
+        j = self.enviar("NOME,CIDADE\nCafé da Praça,Araranguá\nBar do Porto,Araranguá\n".encode("utf-8"))
+        self.assertEqual((j["status"], j["finalizado"]), ("pendente", False))
+        self.assertFalse(Empresa.objects.exists())
+
+        call_command("run_import_worker", "--uma-vez", stdout=io.StringIO())
+
+        st = self.client.get(j["status_url"]).json()
+        self.assertEqual((st["status"], st["criados"], st["linhas_processadas"]), ("concluido", 2, 2))
+        self.assertEqual(Empresa.objects.count(), 2)
+        # a planilha é descartada depois de processada
+        self.assertFalse(ImportacaoJob.objects.get(pk=j["id"]).arquivo)
+
+        # job de outro usuário não é visível
+        self.client.login(username="outro", password="Senha@123")
+        resp = self.client.get(j["status_url"])
+        self.assertEqual(resp.status_code, 404)
+        self.assertNotIn(b"criados", resp.content)
+
+    def test_arquivo_vazio_falha_o_job(self):
+        j = self.enviar(b"")
+        self.assertEqual((j["status"], j["ok"], j["error"]), ("falhou", False, "Arquivo vazio."))
+
+    def test_job_reivindicado_uma_vez_so(self):
+        from core import fila_importacao
+        from core.models import ImportacaoJob
+
+        job = ImportacaoJob.objects.create(user=self.user, nome_arquivo="x.csv")
+        self.assertTrue(fila_importacao.reivindicar(job.pk))
+        self.assertFalse(fila_importacao.reivindicar(job.pk))
+        self.assertIsNone(fila_importacao.reivindicar_proximo())
+
+
+    @override_settings(IMPORTACAO_EXECUTOR="thread", IMPORTACAO_TRAVADO_MINUTOS=30)
+    def test_modo_thread_retoma_jobs_de_processo_reiniciado(self):
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from core import fila_importacao
+        from core.models import ImportacaoJob
+
+        antigo = timezone.now() - timedelta(minutes=45)
+        travado = ImportacaoJob.objects.create(user=self.user, nome_arquivo="a.csv",
+                                               status=ImportacaoJob.PROCESSANDO, iniciado_em=antigo)
+        recente = ImportacaoJob.objects.create(user=self.user, nome_arquivo="b.csv",
+                                               status=ImportacaoJob.PROCESSANDO, iniciado_em=timezone.now())
+        self.assertTrue(fila_importacao.parado(travado))
+        self.assertFalse(fila_importacao.parado(recente))
+
+        outro = ImportacaoJob.objects.create(user=self.user, nome_arquivo="c.csv")
+        ImportacaoJob.objects.filter(pk=outro.pk).update(criado_em=antigo)
+        outro.refresh_from_db()
+
+        pool = mock.Mock()
+        self.addCleanup(fila_importacao._enviados.clear)
+        with mock.patch.object(fila_importacao, "_pool", return_value=pool):
+            # a consulta de status de um job parado retoma só esse job, uma vez por processo
+            self.client.login(username="teste", password="Senha@123")
+            for _ in range(3):
+                self.client.get(reverse("status_importacao", args=[travado.pk]))
+        pool.submit.assert_called_once_with(fila_importacao._processar_em_thread, travado.pk)
+        travado.refresh_from_db()
+        recente.refresh_from_db()
+        self.assertEqual((travado.status, recente.status), ("pendente", "processando"))
+        self.assertFalse(fila_importacao.parado(travado))  # já está no pool deste processo
+        self.assertTrue(fila_importacao.parado(outro))
+
+        # no boot, os pendentes que ainda não estão no pool
+        with mock.patch.object(fila_importacao, "_pool", return_value=pool):
+            self.assertEqual(fila_importacao.retomar(), 1)
+        pool.submit.assert_called_with(fila_importacao._processar_em_thread, outro.pk)
+
+        with self.settings(IMPORTACAO_EXECUTOR="worker"):
+            self.assertEqual(fila_importacao.retomar(), 0)
+
+
+class LeituraPlanilhaTests(TestCase):
+    def ler(self, conteudo, nome="empresas.csv"):
+        from core.importacao import ler_linhas
+        return list(ler_linhas(io.BytesIO(conteudo), nome))
+
+    def test_csv_latin1_e_utf8_com_bom(self):
+        texto = "NOME,CIDADE\nCafé São João,Araranguá\n"
+        esperado = [(1, ["NOME", "CIDADE"]), (2, ["Café São João", "Araranguá"])]
+        self.assertEqual(self.ler(texto.encode("cp1252")), esperado)
+        self.assertEqual(self.ler(texto.encode("utf-8-sig")), esperado)
+
+    def test_csv_lido_sob_demanda(self):
+        from core.importacao import ler_linhas
+        bruto = ("NOME,CIDADE\n" + "Loja Exemplo,Araranguá\n" * 100_000).encode("utf-8")
+        arquivo = io.BytesIO(bruto)
+        linhas = ler_linhas(arquivo, "grande.csv")
+        primeiras = [next(linhas) for _ in range(3)]
+        self.assertEqual(primeiras[2], (3, ["Loja Exemplo", "Araranguá"]))
+        self.assertLess(arquivo.tell(), len(bruto) // 10)
+
+    def test_xlsx_pula_linhas_vazias_mantendo_numeracao(self):
+        conteudo = make_xlsx_bytes(["NOME", "CEP"], [["Pousada Sol", 88900000], [None, None], ["Bar Lua", None]])
+        self.assertEqual(
+            self.ler(conteudo, "empresas.xlsx"),
+            [(1, ["NOME", "CEP"]), (2, ["Pousada Sol", "88900000"]), (4, ["Bar Lua", ""])],
+        )
+
+
+class EsquemaImportacaoTests(TestCase):
+    def test_modelo_para_download_e_reconhecido(self):
+        from core.esquema_importacao import CABECALHO_MODELO, FORMATO_PADRAO, detectar_formato, mapear_cabecalho
+        mapa = mapear_cabecalho(CABECALHO_MODELO)
+        self.assertEqual(mapa[0], "cnpj")
+        self.assertEqual(mapa[1], "categoria")
+        self.assertEqual(mapa[15], "horario_semana")
+        self.assertEqual(detectar_formato(mapa), FORMATO_PADRAO)
+
+    def test_casamento_sem_acento_e_aproximado(self):
+        from core.esquema_importacao import mapear_cabecalho
+        self.assertEqual(
+            mapear_cabecalho(["Razao Social", "MUNICÍPIO", "Telefones", "Descricão"]),
+            {0: "nome", 1: "cidade", 2: "telefone", 3: "descricao"},
+        )
+        # números diferentes não casam por aproximação; coluna repetida não sobrescreve
+        self.assertEqual(
+            mapear_cabecalho(["Phone 1 - Value", "Phone 4 - Value", "Telefone", "Fone"]),
+            {0: "google_telefone_1", 2: "telefone"},
+        )
+
+    def test_formato_google_detectado_pelos_cabecalhos(self):
+        from core.esquema_importacao import FORMATO_GOOGLE, detectar_formato, mapear_cabecalho
+        poucas_colunas = ["Name", "Organization Name", "Phone 1 - Value", "Notes"]
+        self.assertEqual(detectar_formato(mapear_cabecalho(poucas_colunas)), FORMATO_GOOGLE)
+
+
+@override_settings(**TEST_OVERRIDES)
+class ProximidadeTests(BaseSetup):
+    def test_geohash_acompanha_a_coordenada(self):
+        from core import geo
+        emp = self.criar_em("Farol", 0.0)
+        self.assertEqual(emp.geohash, geo.codificar(*self.CENTRO))
+        self.assertEqual(geo.codificar(57.64911, 10.40744, 11), "u4pruydqqvj")  # vetor de referência
+
+        emp.latitude = None
+        emp.save(update_fields=["latitude"])
+        emp.refresh_from_db()
+        self.assertEqual(emp.geohash, "")
+
+    def test_filtro_por_prefixo_nao_depende_da_collation(self):
+        from django.db import connection
+        from core import geo
+        perto, longe = self.criar_em("Perto", 0.0), self.criar_em("Longe", 1.0)
+        prefixo = perto.geohash[:5]
+        achadas = Empresa.objects.filter(geo.filtro_celulas({prefixo, "zzzzz"}))
+        self.assertEqual(list(achadas.values_list("nome", flat=True)), ["Perto"])
+        self.assertFalse(longe.geohash.startswith(prefixo))
+
+        # SQLite (BINARY): intervalo que usa o índice; PostgreSQL: LIKE 'p%', sem "~" na collation
+        sql, _ = achadas.query.get_compiler(connection=connection).as_sql()
+        self.assertNotIn("LIKE", sql.upper())
+        try:
+            from django.db.backends.postgresql.base import DatabaseWrapper
+        except ImportError:
+            return
+        postgres = DatabaseWrapper({**connection.settings_dict, "NAME": "sem-conexao"}, "postgres")
+        sql, params = achadas.query.get_compiler(connection=postgres).as_sql()
+        self.assertIn("LIKE", sql.upper())
+        self.assertIn(prefixo + "%", params)
+        self.assertFalse([p for p in params if str(p).endswith("~")])
+
+    def test_celulas_cobrem_todo_o_raio(self):
+        import random
+        from core import geo
+        rnd = random.Random(7)
+        for lat, lng, raio in [(-28.9356, -49.4918, 3), (0.0001, -0.0001, 12), (45.0, 179.99, 25)]:
+            celulas = geo.celulas_do_raio(lat, lng, raio)
+            self.assertLessEqual(len(celulas), geo.MAX_CELULAS)
+            for _ in range(300):
+                la = lat + rnd.uniform(-1, 1) * raio / 111.0
+                ln = lng + rnd.uniform(-1, 1) * raio / 80.0
+                ln = (ln + 180) % 360 - 180
+                if geo.haversine_km(lat, lng, la, ln) <= raio:
+                    h = geo.codificar(la, ln)
+                    self.assertTrue(any(h.startswith(c) for c in celulas), (lat, lng, la, ln))
+
+    def test_api_ordena_por_distancia_dentro_do_raio(self):
+        self.criar_em("Longe", 0.30)      # ~33 km
+        self.criar_em("Médio", -0.05)     # ~5,6 km
+        self.criar_em("Perto", 0.0, 0.01)  # ~1 km
+        self.criar_empresa("Sem coordenada")
+
+        lat, lng = self.CENTRO
+        j = self.client.get(reverse("empresas_proximas"), {"lat": lat, "lng": lng, "raio": 10}).json()
+        self.assertEqual([r["nome"] for r in j["resultados"]], ["Perto", "Médio"])
+        self.assertAlmostEqual(j["resultados"][0]["distancia_km"], 0.97, delta=0.05)
+
+        self.assertEqual(self.client.get(reverse("empresas_proximas"), {"lat": "x"}).status_code, 400)
+
+    def test_listagem_perto_de_mim(self):
+        for i in range(15):
+            self.criar_em(f"Ponto {i:02d}", 0.001 * (15 - i))
+        self.criar_em("Fora do raio", 0.5)
+        lat, lng = self.CENTRO
+        params = {"lat": lat, "lng": lng, "raio": 5}
+
+        resp = self.client.get(reverse("listar_empresas"), params)
+        nomes = [e.nome for e in resp.context["page_obj"]]
+        self.assertEqual(nomes[:3], ["Ponto 14", "Ponto 13", "Ponto 12"])
+        self.assertEqual(resp.context["page_obj"].paginator.count, 15)
+        self.assertContains(resp, "perto de você")
+
+        j = self.client.get(reverse("listar_empresas"), {**params, "ajax": "1", "cursor": resp.context["next_cursor"]}).json()
+        self.assertEqual(re.findall(r'aria-label="Ver detalhes de ([^"]+)"', j["html"]), ["Ponto 02", "Ponto 01", "Ponto 00"])
+        self.assertIsNone(j["next_cursor"])
+
+
+@override_settings(**TEST_OVERRIDES)
+class MapaClustersTests(BaseSetup):
+    def pontos(self, zoom, bbox):
+        resp = self.client.get(reverse("mapa_pontos"), {"zoom": zoom, "bbox": ",".join(map(str, bbox))})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()["features"]
+
+    def test_agrupa_por_zoom_e_recorta_pelo_bbox(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        for i in range(20):
+            self.criar_em(f"Centro {i}", 0.0001 * i, 0.0001 * i)
+        self.criar_em("Distante", 1.0)
+        cidade = (-50.5, -30.5, -48.5, -27.5)
+
+        features = self.pontos(8, cidade)
+        clusters = sorted(f["properties"].get("quantidade", 1) for f in features)
+        self.assertEqual(clusters, [1, 20])
+        solto = next(f for f in features if not f["properties"]["cluster"])
+        self.assertEqual(solto["properties"]["nome"], "Distante")
+
+        # com o índice em cache, pan/zoom não consulta o banco
+        with CaptureQueriesContext(connection) as ctx:
+            self.pontos(8, cidade)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        lat, lng = self.CENTRO
+        perto = (lng - 0.00045, lat - 0.00045, lng + 0.00045, lat + 0.00045)
+        features = self.pontos(18, perto)
+        self.assertEqual(len(features), 5)
+        self.assertTrue(all(not f["properties"]["cluster"] for f in features))
+        self.assertTrue(features[0]["properties"]["url"].startswith("/empresa/centro-"))
+
+    def test_zoom_alto_com_bbox_grande_volta_a_agrupar(self):
+        from unittest import mock
+        from core import mapa
+        for i in range(5):
+            self.criar_em(f"Centro {i}", 0.0001 * i, 0.0001 * i)
+        self.criar_em("Distante", 1.0)
+
+        # bbox da cidade inteira não cabe numa tela no zoom 18: agrupa como no zoom que cabe
+        features = self.pontos(18, (-50.5, -30.5, -48.5, -27.5))
+        self.assertEqual(sorted(f["properties"].get("quantidade", 1) for f in features), [1, 5])
+
+        # bbox pequeno, mas com mais pontos soltos que o limite: agrupa também
+        lat, lng = self.CENTRO
+        perto = (lng - 0.001, lat - 0.001, lng + 0.001, lat + 0.001)
+        self.assertEqual(len(self.pontos(18, perto)), 5)
+        with mock.patch.object(mapa, "MAX_PONTOS_SOLTOS", 3):
+            features = self.pontos(18, perto)
+        self.assertLess(len(features), 5)
+        self.assertEqual(sum(f["properties"].get("quantidade", 1) for f in features), 5)
+
+    def test_salvar_empresa_invalida_o_indice(self):
+        cidade = (-50.5, -30.5, -48.5, -27.5)
+        self.assertEqual(self.pontos(12, cidade), [])
+        self.criar_em("Novo Ponto", 0.0)
+        self.assertEqual([f["properties"]["nome"] for f in self.pontos(12, cidade)], ["Novo Ponto"])
+
+    def test_parametros_invalidos_e_pagina(self):
+        self.assertEqual(self.client.get(reverse("mapa_pontos"), {"zoom": "x", "bbox": "1,2"}).status_code, 400)
+        self.assertContains(self.client.get(reverse("mapa")), 'id="mapa-cidade"')
+
+
+MIDIA_TESTES = dict(MEDIA_ROOT=Path(tempfile.gettempdir()) / "arutourism-testes-midia")
+
+
+@override_settings(**TEST_OVERRIDES, **MIDIA_TESTES)
+class DerivadosImagemTests(BaseSetup):
+    def foto(self, largura, altura, nome="foto.jpg"):
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", (largura, altura), (200, 80, 40)).save(buf, "JPEG")
+        return SimpleUploadedFile(nome, buf.getvalue(), content_type="image/jpeg")
+
+    def test_upload_gera_rendicoes_sem_ampliar(self):
+        from django.core.files.storage import default_storage
+        from core.models import ImagemEmpresa
+        empresa = self.criar_empresa("Pousada Foto")
+        img = ImagemEmpresa.objects.create(empresa=empresa, imagem=self.foto(1500, 1000))
+        img.refresh_from_db()
+
+        self.assertEqual((img.largura, img.altura), (1500, 1000))
+        # "full" (1920) ficaria maior que o original: vira 1500 e não duplica com o original
+        self.assertEqual({n: d["w"] for n, d in img.derivados.items()},
+                         {"thumb": 160, "card": 480, "hero": 1280, "full": 1500})
+        self.assertEqual(img.derivados["card"]["h"], 320)
+        self.assertTrue(default_storage.exists(img.derivados["card"]["webp"]))
+        self.assertIn(" 480w", img.srcset_webp)
+        self.assertTrue(img.url_card.endswith("_card.jpg"))
+
+        resp = self.client.get(reverse("listar_empresas"))
+        self.assertContains(resp, 'type="image/webp"')
+        self.assertContains(resp, img.url_card)
+
+        nome = img.derivados["thumb"]["jpeg"]
+        with self.captureOnCommitCallbacks(execute=True):
+            img.delete()
+        self.assertFalse(default_storage.exists(nome))
+
+    def test_arquivo_ilegivel_cai_no_original(self):
+        from core.models import ImagemEmpresa
+        empresa = self.criar_empresa("Pousada Sem Foto")
+        img = ImagemEmpresa.objects.create(empresa=empresa, imagem=make_image_file())
+        self.assertEqual(img.derivados, {})
+        self.assertIsNone(img.largura)
+        self.assertEqual(img.url_card, img.imagem.url)
+        self.assertEqual(img.srcset_jpeg, "")
+
+    def test_avatar_pequeno(self):
+        perfil = self.user.perfil
+        perfil.avatar = self.foto(600, 600, "avatar.png")
+        perfil.save()
+        perfil.refresh_from_db()
+        self.assertEqual(perfil.avatar_derivados["thumb"]["w"], 96)
+        self.assertTrue(perfil.avatar_pequeno_url.endswith("_thumb.jpg"))
+
+
+IMAGENS_TESTES = dict(
+    IMAGENS_EXECUTOR="sincrono",
+    IMAGENS_STAGING_ROOT=Path(tempfile.gettempdir()) / "arutourism-testes-staging",
+)
+
+
+@override_settings(**TEST_OVERRIDES, **MIDIA_TESTES, **IMAGENS_TESTES)
+class UploadGaleriaTests(BaseSetup):
+    def foto(self, largura, altura, nome="foto.jpg", orientacao=None):
+        from PIL import Image
+        img = Image.new("RGB", (largura, altura), (30, 120, 200))
+        exif = Image.Exif()
+        exif[0x010F] = "Celular Exemplo"  # Make
+        if orientacao:
+            exif[0x0112] = orientacao
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", exif=exif.tobytes())
+        return SimpleUploadedFile(nome, buf.getvalue(), content_type="image/jpeg")
+
+    def editar(self, empresa, arquivos, **extra):
+        self.client.login(username="teste", password="Senha@123")
+        dados = {
+            "nome": empresa.nome, "cidade": empresa.cidade, "rua": "Rua A", "bairro": "Centro",
+            "numero": "10", "cep": "88900000", "sem_telefone": "on", "sem_email": "on",
+            "latitude": "-28.9356", "longitude": "-49.4918", "novas_imagens": arquivos,
+        }
+        return self.client.post(reverse("editar_empresa", args=[empresa.slug]), dados, **extra)
+
+    def test_normaliza_orientacao_metadados_e_tamanho(self):
+        from PIL import Image
+        from core.models import ImagemEmpresa, UploadImagem
+        empresa = self.criar_empresa("Galeria Nova")
+        # orientação 6 = girar 90°: 400x300 no arquivo vira 300x400 de pé
+        with self.settings(IMAGEM_MAX_LADO=200):
+            resp = self.editar(empresa, [self.foto(400, 300, orientacao=6), self.foto(100, 80, "b.jpg")],
+                               HTTP_ACCEPT="application/json")
+        self.assertEqual(resp.status_code, 200, resp.content)
+        dados = resp.json()
+        self.assertEqual(len(dados["uploads"]), 2)
+
+        self.assertEqual(UploadImagem.objects.filter(status=UploadImagem.CONCLUIDO).count(), 2)
+        self.assertFalse(UploadImagem.objects.exclude(arquivo="").exists())  # staging limpo
+        imagem = ImagemEmpresa.objects.get(pk=UploadImagem.objects.first().imagem_id)
+        with imagem.imagem.open("rb") as f:
+            salva = Image.open(f)
+            salva.load()
+        self.assertEqual(salva.size, (150, 200))
+        self.assertEqual(dict(salva.getexif()), {})
+        self.assertTrue(imagem.derivados)
+
+        status = self.client.get(dados["status_url"], {"ids": ",".join(map(str, dados["uploads"]))}).json()
+        self.assertTrue(status["finalizado"])
+        self.assertEqual(status["uploads"][0]["imagem"]["url"], imagem.url_card)
+
+    def test_capa_do_cadastro_passa_pela_fila(self):
+        from core.models import UploadImagem
+        self.client.login(username="teste", password="Senha@123")
+        dados = {
+            "nome": "Pousada Capa", "cidade": "Araranguá", "rua": "Rua A", "bairro": "Centro",
+            "numero": "10", "cep": "88900000", "sem_telefone": "on", "sem_email": "on",
+            "latitude": "-28.9356", "longitude": "-49.4918",
+            "imagem": self.foto(100, 80), "imagem_inicial": self.foto(100, 80, "capa.jpg"),
+        }
+        with self.settings(IMAGENS_EXECUTOR="thread"), self.captureOnCommitCallbacks():
+            resp = self.client.post(reverse("cadastrar_empresa"), dados)
+        self.assertEqual(resp.status_code, 200, resp.content)
+        empresa = Empresa.objects.get(nome="Pousada Capa")
+        self.assertFalse(empresa.imagens.exists())  # nada processado na requisição
+        upload = UploadImagem.objects.get(empresa=empresa)
+        self.assertTrue(upload.principal)
+
+        from core import fila_imagens
+        fila_imagens.processar(upload.pk)
+        imagem = empresa.imagens.get()
+        self.assertTrue(imagem.principal)
+        self.assertTrue(imagem.derivados)
+
+    def test_excluir_empresa_com_upload_na_fila_limpa_o_staging(self):
+        from core import fila_imagens
+        from core.models import UploadImagem
+        empresa = self.criar_empresa("Galeria Apagada")
+        with self.settings(IMAGENS_EXECUTOR="thread"), self.captureOnCommitCallbacks():
+            upload, = fila_imagens.receber(empresa, self.user, [self.foto(120, 90)])
+        arquivo = upload.arquivo
+        self.assertTrue(arquivo.storage.exists(arquivo.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            empresa.delete()
+        self.assertFalse(UploadImagem.objects.exists())
+        self.assertFalse(arquivo.storage.exists(arquivo.name))
+        fila_imagens.processar(upload.pk)  # o job agendado antes da exclusão não quebra
+
+    def test_recusa_imagem_grande_demais(self):
+        from core.models import ImagemEmpresa, UploadImagem
+        empresa = self.criar_empresa("Galeria Bomba")
+        with self.settings(IMAGEM_MAX_PIXELS=10_000):
+            resp = self.editar(empresa, [self.foto(200, 100)])
+        self.assertRedirects(resp, reverse("editar_empresa", args=[empresa.slug]) + "#image-gallery-container",
+                             fetch_redirect_response=False)
+        upload = UploadImagem.objects.get()
+        self.assertEqual(upload.status, UploadImagem.FALHOU)
+        self.assertIn("grande demais", upload.erro)
+        self.assertFalse(ImagemEmpresa.objects.exists())
+
+    def test_requisicao_nao_espera_o_processamento(self):
+        from core.models import ImagemEmpresa, UploadImagem
+        empresa = self.criar_empresa("Galeria Fila")
+        # no modo thread o processamento só é agendado para depois do commit
+        with self.settings(IMAGENS_EXECUTOR="thread"), self.captureOnCommitCallbacks():
+            self.editar(empresa, [self.foto(120, 90)])
+        upload = UploadImagem.objects.get()
+        self.assertEqual(upload.status, UploadImagem.PENDENTE)
+        self.assertTrue(upload.arquivo)
+        self.assertFalse(ImagemEmpresa.objects.exists())
+        self.assertContains(self.client.get(reverse("editar_empresa", args=[empresa.slug])),
+                            f'data-upload-id="{upload.pk}"')
+
+        from core import fila_imagens
+        fila_imagens.processar(upload.pk)
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, UploadImagem.CONCLUIDO)
+
+        # dono de outra empresa não vê os uploads
+        self.client.login(username="outro", password="Senha@123")
+        resp = self.client.get(reverse("status_imagens_empresa", args=[empresa.slug]))
+        self.assertEqual(resp.status_code, 404)
+
+
+@override_settings(**TEST_OVERRIDES)
+class AlocacaoSlugTests(BaseSetup):
+    def test_sufixo_com_uma_consulta_e_update_sem_consulta(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        for _ in range(5):
+            self.criar_empresa("Pousada")
+        self.assertEqual(
+            sorted(Empresa.objects.values_list("slug", flat=True)),
+            ["pousada", "pousada-1", "pousada-2", "pousada-3", "pousada-4"],
+        )
+
+        empresa = Empresa.objects.get(slug="pousada-2")
+        empresa.descricao = "Atualizada"
+        with CaptureQueriesContext(connection) as ctx:
+            empresa.save()
+        # nenhuma consulta de colisão (só o UPDATE e a reindexação da busca)
+        self.assertFalse([q for q in ctx.captured_queries if '"slug"' in q["sql"].partition("WHERE")[2]])
+        self.assertEqual(empresa.slug, "pousada-2")
+
+        nova = Empresa(user=self.user, nome="Pousada", cidade="Araranguá")
+        with CaptureQueriesContext(connection) as ctx:
+            nova.save()
+        self.assertEqual(nova.slug, "pousada-5")
+        self.assertEqual(len([q for q in ctx.captured_queries if "core_empresa" in q["sql"] and "LIKE" in q["sql"]]), 1)
+
+    def test_insert_concorrente_realoca(self):
+        from unittest import mock
+        from core import slugs
+        self.criar_empresa("Bar do Porto")
+        # simula outro processo que gravou "bar-do-porto" entre a consulta e o insert
+        with mock.patch.object(slugs, "alocar", side_effect=["bar-do-porto", "bar-do-porto-1"]):
+            empresa = self.criar_empresa("Bar do Porto")
+        self.assertEqual(empresa.slug, "bar-do-porto-1")
+
+    def test_preencher_faltantes_em_lote(self):
+        from django.core.management import call_command
+        from core import slugs
+        self.criar_empresa("Restaurante")
+        for i in range(30):
+            e = self.criar_empresa("Restaurante" if i % 2 else f"Café {i % 3}")
+            Empresa.objects.filter(pk=e.pk).update(slug=None)
+
+        alocador = slugs.AlocadorSlugs(Empresa)
+        with self.assertNumQueries(1):
+            alocador.carregar(["Restaurante", "Café 0", "Café 1", "Café 2"])
+        with self.assertNumQueries(0):
+            self.assertEqual(alocador.alocar("Restaurante"), "restaurante-1")
+
+        out = io.StringIO()
+        call_command("regenerate_slugs", lote=7, stdout=out)
+        self.assertIn("30 slugs", out.getvalue())
+        valores = list(Empresa.objects.values_list("slug", flat=True))
+        self.assertEqual(len(valores), len(set(valores)))
+        self.assertNotIn(None, valores)
+        self.assertIn("restaurante-15", valores)
+
+
+class CacheCompartilhadoTests(TestCase):
+    def test_avisa_no_boot_quando_o_cache_e_locmem_fora_de_debug(self):
+        from core.apps import _avisar_cache_local
+        with self.settings(DEBUG=False, TESTING=False), self.assertLogs("core.apps", "WARNING") as logs:
+            _avisar_cache_local()
+        self.assertIn("CACHE_URL", logs.output[0])
+
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://x"}}
+        with self.settings(DEBUG=False, TESTING=False, CACHES=redis), self.assertNoLogs("core.apps", "WARNING"):
+            _avisar_cache_local()
+
+
+
+@override_settings(CACHE_PAGINAS=True, **TEST_OVERRIDES)
+class CachePaginasTests(BaseSetup):
+    def test_home_e_listagem_servidas_do_cache_ate_mudar_o_catalogo(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.criar_empresa("Pousada Cacheada")
+        self.assertEqual(self.client.get(reverse("home"))["X-Cache"], "MISS")
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("home"))
+        self.assertEqual(resp["X-Cache"], "HIT")
+        self.assertContains(resp, "Pousada Cacheada")
+        self.assertFalse([q for q in ctx.captured_queries if "core_empresa" in q["sql"]])
+
+        # query string normalizada: ordem e parâmetros vazios/rastreamento não importam
+        url = reverse("listar_empresas")
+        self.client.get(url, {"cidade": "Araranguá", "q": ""})
+        resp = self.client.get(url + "?utm_source=qr&cidade=Ararangu%C3%A1")
+        self.assertEqual(resp["X-Cache"], "HIT")
+        # o JSON do "carregar mais" não reaproveita o HTML
+        self.assertEqual(self.client.get(url, {"cidade": "Araranguá", "ajax": "1"})["X-Cache"], "MISS")
+
+        self.criar_empresa("Hotel Novo")
+        resp = self.client.get(reverse("home"))
+        self.assertEqual(resp["X-Cache"], "MISS")
+        self.assertContains(resp, "Hotel Novo")
+
+    def test_detalhe_invalidado_so_pela_propria_empresa(self):
+        from core.models import Avaliacao, Tag
+        a = self.criar_empresa("Bar A")
+        b = self.criar_empresa("Bar B")
+        url_a = reverse("empresa_detalhe", args=[a.slug])
+        url_b = reverse("empresa_detalhe", args=[b.slug])
+        self.client.get(url_a)
+        self.client.get(url_b)
+
+        outro = User.objects.create_user(username="turista", password="Senha@123")
+        Avaliacao.objects.create(empresa=a, user=outro, nota=5, comentario="Ótimo chope")
+        self.assertContains(self.client.get(url_a), "Ótimo chope")
+        self.assertEqual(self.client.get(url_b)["X-Cache"], "HIT")
+
+        tag = Tag.objects.create(nome="Boteco")
+        b.tags.add(tag)
+        self.assertEqual(self.client.get(url_b)["X-Cache"], "MISS")
+        tag.nome = "Boteco Raiz"
+        tag.save()
+        self.assertContains(self.client.get(url_b), "Boteco Raiz")
+
+    def test_usuario_logado_e_mensagens_nao_usam_o_cache(self):
+        self.client.get(reverse("home"))
+        self.client.login(username="teste", password="Senha@123")
+        resp = self.client.get(reverse("home"))
+        self.assertFalse(resp.has_header("X-Cache"))
+
+    def test_estatisticas_para_monitoramento(self):
+        from core import cache_paginas
+        cache_paginas.zerar_estatisticas()
+        self.client.get(reverse("home"))
+        self.client.get(reverse("home"))
+        self.client.get(reverse("home"))
+        self.assertEqual(cache_paginas.estatisticas()["home"],
+                         {"hits": 2, "misses": 1, "taxa_acerto": 0.6667})
+
+        self.assertNotEqual(self.client.get(reverse("cache_paginas_status")).status_code, 200)
+        User.objects.create_user(username="admin", password="Senha@123", is_staff=True)
+        self.client.login(username="admin", password="Senha@123")
+        dados = self.client.get(reverse("cache_paginas_status")).json()
+        self.assertEqual(dados["paginas"]["home"]["hits"], 2)
+
+    def test_cada_visitante_recebe_o_proprio_token_csrf(self):
+        self.client.get(reverse("home"))
+        outro = Client()
+        resp = outro.get(reverse("home"))
+        self.assertEqual(resp["X-Cache"], "HIT")
+        self.assertNotIn(b"__csrf_token_da_pagina__", resp.content)
+        self.assertIn("csrftoken", resp.cookies)
+        from django.middleware.csrf import _unmask_cipher_token
+        token = re.search(rb'name="csrf-token" content="([A-Za-z0-9]{64})"', resp.content).group(1).decode()
+        self.assertEqual(_unmask_cipher_token(token), resp.cookies["csrftoken"].value)
+
+
+class RequisicaoCondicionalTests(BaseSetup):
+    def revalidar(self, url, resp, **extra):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"], **extra)
+
+    def test_detalhe_responde_304_ate_a_empresa_mudar(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.models import Avaliacao, Tag
+        emp = self.criar_empresa("Pousada Condicional")
+        url = reverse("empresa_detalhe", args=[emp.slug])
+        resp = self.client.get(url)
+        self.assertTrue(resp.has_header("Last-Modified"))
+
+        with CaptureQueriesContext(connection) as ctx:
+            r304 = self.revalidar(url, resp)
+        self.assertEqual(r304.status_code, 304)
+        self.assertEqual(len([q for q in ctx.captured_queries if "core_empresa" in q["sql"]]), 1)
+
+        turista = User.objects.create_user(username="turista", password="Senha@123")
+        Avaliacao.objects.create(empresa=emp, user=turista, nota=4, comentario="Bom café")
+        resp2 = self.revalidar(url, resp)
+        self.assertContains(resp2, "Bom café")
+        self.assertNotEqual(resp2["ETag"], resp["ETag"])
+
+        tag = Tag.objects.create(nome="Café colonial")
+        emp.tags.add(tag)
+        resp3 = self.revalidar(url, resp2)
+        self.assertEqual(resp3.status_code, 200)
+        tag.nome = "Café da colônia"
+        tag.save()
+        self.assertContains(self.revalidar(url, resp3), "Café da colônia")
+
+    def test_detalhe_de_usuario_logado_nao_tem_etag(self):
+        emp = self.criar_empresa("Bar Privado")
+        self.client.login(username="teste", password="Senha@123")
+        resp = self.client.get(reverse("empresa_detalhe", args=[emp.slug]))
+        self.assertFalse(resp.has_header("ETag"))
+
+    def test_json_da_listagem_e_filtros(self):
+        from core.models import Tag
+        self.criar_empresa("Restaurante A")
+        url = reverse("listar_empresas")
+        resp = self.client.get(url, {"ajax": "1"})
+        self.assertEqual(self.revalidar(url + "?ajax=1", resp).status_code, 304)
+        # outra página/filtro é outra representação
+        self.assertEqual(self.revalidar(url + "?ajax=1&cidade=Outra", resp).status_code, 200)
+        b = self.criar_empresa("Restaurante B")
+        resp = self.revalidar(url + "?ajax=1", resp)
+        self.assertEqual(resp.status_code, 200)
+        b.delete()
+        self.assertEqual(self.revalidar(url + "?ajax=1", resp).status_code, 200)
+
+        url = reverse("filtros_empresas")
+        resp = self.client.get(url)
+        self.assertEqual(self.revalidar(url, resp).status_code, 304)
+        Tag.objects.create(nome="Vegano")
+        self.assertEqual(self.revalidar(url, resp).status_code, 200)
+
+
+class ApiCatalogoTests(BaseSetup):
+    def test_listagem_com_campos_esparsos_e_cursor(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.models import Tag
+        tag = Tag.objects.create(nome="Praia de teste")
+        for i in range(5):
+            e = self.criar_empresa(f"Quiosque {i}", cidade="Arroio do Silva")
+            if i % 2 == 0:
+                e.tags.add(tag)
+        self.criar_empresa("Pousada Fora", cidade="Araranguá").tags.add(tag)
+
+        url = reverse("api_empresas")
+        params = {"cidade": "Arroio do Silva", "tag": tag.pk, "fields": "nome,tags", "limite": 2}
+        with CaptureQueriesContext(connection) as ctx:
+            dados = self.client.get(url, params).json()
+        # página + tags; sem COUNT e sem a consulta das capas, que não foram pedidas
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(dados["resultados"], [
+            {"nome": "Quiosque 4", "tags": [{"id": tag.pk, "nome": "Praia de teste"}]},
+            {"nome": "Quiosque 2", "tags": [{"id": tag.pk, "nome": "Praia de teste"}]},
+        ])
+        dados = self.client.get(url, dict(params, cursor=dados["next_cursor"])).json()
+        self.assertEqual([r["nome"] for r in dados["resultados"]], ["Quiosque 0"])
+        self.assertFalse(dados["has_next"])
+
+        resp = self.client.get(url, {"fields": "nome,senha"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("senha", resp.json()["error"])
+
+    def test_busca_e_perto_de_mim(self):
+        self.criar_em("Longe", 0.30)
+        self.criar_em("Perto", 0.0, 0.01)
+        url = reverse("api_empresas")
+        dados = self.client.get(url, {"lat": self.CENTRO[0], "lng": self.CENTRO[1], "raio": 10,
+                                      "fields": "slug"}).json()
+        self.assertEqual([r["slug"] for r in dados["resultados"]], ["perto"])
+        self.assertLess(dados["resultados"][0]["distancia_km"], 2)
+
+        dados = self.client.get(url, {"q": "longe", "fields": "nome,url"}).json()
+        self.assertEqual(dados["resultados"], [{"nome": "Longe", "url": reverse("empresa_detalhe", args=["longe"])}])
+
+    def test_detalhe_e_tags(self):
+        from core import api
+        from core.models import ImagemEmpresa, Tag
+        emp = self.criar_empresa("Museu", latitude="-28.9356000", longitude="-49.4918000")
+        ImagemEmpresa.objects.create(empresa=emp, imagem="empresas/galeria/antiga.jpg")
+        ImagemEmpresa.objects.create(empresa=emp, imagem="empresas/galeria/capa.jpg", principal=True)
+        Tag.objects.create(nome="Cultura de teste")
+
+        dados = self.client.get(reverse("api_empresa", args=[emp.slug])).json()
+        self.assertEqual(set(dados), set(api.CAMPOS))
+        self.assertEqual(dados["latitude"], -28.9356)
+        self.assertTrue(dados["capa"]["url"].endswith("capa.jpg"))
+
+        dados = self.client.get(reverse("api_empresa", args=[emp.slug]), {"fields": "id"}).json()
+        self.assertEqual(dados, {"id": emp.pk})
+        self.assertEqual(self.client.get(reverse("api_empresa", args=["nao-existe"])).status_code, 404)
+
+        nomes = [t["nome"] for t in self.client.get(reverse("api_tags")).json()["resultados"]]
+        self.assertIn("Cultura de teste", nomes)
+
+
+class HierarquiaTagsTests(BaseSetup):
+    def fechamento(self):
+        from core.models import TagAncestral
+        return set(TagAncestral.objects.values_list("ancestral_id", "descendente_id", "profundidade"))
+
+    def test_filtro_pela_mae_inclui_subtags_e_fechamento_acompanha(self):
+        from core import arvore_tags
+        from core.models import Tag, TagAncestral
+        hosp = Tag.objects.create(nome="Hospedagem teste")
+        pousada = Tag.objects.create(nome="Pousada teste", parent=hosp)
+        praia = Tag.objects.create(nome="Pousada de praia teste", parent=pousada)
+        self.criar_empresa("Pousada do Mar").tags.add(praia)
+        self.criar_empresa("Hotel Centro").tags.add(hosp)
+        self.criar_empresa("Museu")
+
+        def filtrar(tag):
+            dados = self.client.get(reverse("api_empresas"), {"tag": tag.pk, "fields": "nome"}).json()
+            return sorted(r["nome"] for r in dados["resultados"])
+
+        self.assertEqual(filtrar(hosp), ["Hotel Centro", "Pousada do Mar"])
+        self.assertEqual(filtrar(pousada), ["Pousada do Mar"])
+        self.assertIn((hosp.pk, praia.pk, 2), self.fechamento())
+
+        # reparentar leva a subárvore junto
+        pousada.parent = None
+        pousada.save()
+        self.assertEqual(filtrar(hosp), ["Hotel Centro"])
+        self.assertNotIn((hosp.pk, praia.pk, 2), self.fechamento())
+        antes = self.fechamento()
+        arvore_tags.reconstruir(Tag, TagAncestral)
+        self.assertEqual(self.fechamento(), antes)
+
+        hosp.parent = praia
+        hosp.save()
+        with self.assertRaises(arvore_tags.CicloNaHierarquia):
+            pousada.parent = hosp
+            pousada.save()
+
+        praia.delete()  # CASCADE leva a hospedagem (filha) e as linhas do fechamento
+        self.assertFalse(TagAncestral.objects.filter(descendente_id__in=[hosp.pk, praia.pk]).exists())
+
+    def test_gerenciar_tags_monta_a_arvore_numa_consulta(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.models import Tag
+        mae = Tag.objects.create(nome="Gastronomia teste")
+        filha = Tag.objects.create(nome="Cafeteria teste")
+        neta = Tag.objects.create(nome="Café colonial teste", parent=filha)
+        User.objects.create_user(username="admin", password="Senha@123", is_staff=True)
+        self.client.login(username="admin", password="Senha@123")
+
+        resp = self.client.post(reverse("gerenciar_tags"), {
+            "action": "update_children", "tag_id": mae.pk, "children": [filha.pk, mae.pk],
+        })
+        self.assertEqual(resp.status_code, 302)
+        filha.refresh_from_db()
+        mae.refresh_from_db()
+        self.assertEqual(filha.parent_id, mae.pk)
+        self.assertIsNone(mae.parent_id)  # a própria tag é ignorada
+        self.assertIn((mae.pk, neta.pk, 2), self.fechamento())
+
+        self.client.get(reverse("gerenciar_tags"))  # aquece as facetas do cabeçalho
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("gerenciar_tags"))
+        self.assertEqual(len([q for q in ctx.captured_queries if 'FROM "core_tag"' in q["sql"]]), 1)
+        html = resp.content.decode()
+        self.assertLess(html.index("Gastronomia teste"), html.index("Cafeteria teste"))
+        self.assertLess(html.index("Cafeteria teste"), html.index("Café colonial teste"))
+
+        nomes = [t["nome"] for t in self.client.get(reverse("api_tags")).json()["resultados"]]
+        self.assertEqual(nomes.index("Cafeteria teste"), nomes.index("Gastronomia teste") + 1)
+
+
+class IndiceFacetasTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        from core.models import Tag
+        self.praia = Tag.objects.create(nome="Praia teste")
+        self.hosp = Tag.objects.create(nome="Hospedagem teste")
+        self.pousada = Tag.objects.create(nome="Pousada teste", parent=self.hosp)
+        self.a = self.criar_empresa("Pousada Beira-Mar", cidade="Arroio do Silva")
+        self.a.tags.add(self.praia, self.pousada)
+        self.b = self.criar_empresa("Hotel Centro")
+        self.b.tags.add(self.hosp)
+        self.c = self.criar_empresa("Quiosque", cidade="ARROIO DO SILVA")
+        self.c.tags.add(self.praia)
+
+    def ids(self, bits):
+        from core import indice_facetas
+        return set(indice_facetas.ids(bits))
+
+    def test_e_ou_subtags_e_contagens(self):
+        from core import indice_facetas
+        praia, hosp = self.praia.pk, self.hosp.pk
+        self.assertEqual(self.ids(indice_facetas.filtrar([praia, hosp])), {self.a.pk, self.b.pk, self.c.pk})
+        self.assertEqual(self.ids(indice_facetas.filtrar([praia, hosp], modo="e")), {self.a.pk})
+        self.assertEqual(self.ids(indice_facetas.filtrar([hosp], "arroio do silva")), {self.a.pk})
+        self.assertIsNone(indice_facetas.filtrar([], ""))
+
+        contagens = indice_facetas.contagens(indice_facetas.filtrar([praia]))
+        self.assertEqual(contagens["tags"][hosp], 1)
+        self.assertEqual(contagens["cidades"]["arroio do silva"], 2)
+
+        dados = self.client.get(reverse("filtros_empresas"), {"tag": praia}).json()
+        self.assertEqual(dados["contagens"]["total"], 2)
+        self.assertEqual(dados["contagens"]["cidades"]["Arroio do Silva"], 2)
+        self.assertEqual(dados["contagens"]["tags"][str(self.pousada.pk)], 1)
+
+        resp = self.client.get(reverse("listar_empresas"), {"tag": [praia, hosp], "modo_tags": "e"})
+        self.assertContains(resp, "Pousada Beira-Mar")
+        self.assertNotContains(resp, "Quiosque")
+
+    def test_pagina_vem_do_indice_sem_join_de_tags(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            dados = self.client.get(reverse("listar_empresas"), {"tag": self.praia.pk, "ajax": "1"}).json()
+        self.assertEqual(re.findall(r'aria-label="Ver detalhes de ([^"]+)"', dados["html"]),
+                         ["Quiosque", "Pousada Beira-Mar"])
+        self.assertFalse([q for q in ctx.captured_queries if "DISTINCT" in q["sql"].upper()])
+
+    def test_cursor_enorme_ou_quebrado_nao_estoura(self):
+        from core import indice_facetas, pagination
+        todas = indice_facetas.todas()
+        self.assertEqual(indice_facetas.ids(todas, abaixo=10 ** 12), indice_facetas.ids(todas))
+        for chave in (10 ** 10, 10 ** 11, 1.5, "abc", True):
+            cursor = pagination._codificar({"k": [chave]})
+            for url in (reverse("listar_empresas"), reverse("api_empresas")):
+                resp = self.client.get(url, {"ajax": "1", "cursor": cursor})
+                self.assertEqual(resp.status_code, 200, (url, chave))
+
+    def test_busca_com_tag_filtra_em_sql_sem_lista_de_ids(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse("listar_empresas")
+        with CaptureQueriesContext(connection) as ctx:
+            dados = self.client.get(url, {"q": "pousada", "tag": [self.praia.pk, self.hosp.pk],
+                                          "modo_tags": "e", "ajax": "1"}).json()
+        self.assertEqual(re.findall(r'aria-label="Ver detalhes de ([^"]+)"', dados["html"]), ["Pousada Beira-Mar"])
+        self.assertTrue(any("core_tagancestral" in q["sql"] for q in ctx.captured_queries))
+
+        dados = self.client.get(url, {"q": "quiosque", "tag": self.hosp.pk, "ajax": "1"}).json()
+        self.assertNotIn("Quiosque", dados["html"])
+        dados = self.client.get(url, {"q": "quiosque", "cidade": "arroio do silva", "ajax": "1"}).json()
+        self.assertIn("Quiosque", dados["html"])
+
+    def test_signals_atualizam_o_indice_sem_remontar(self):
+        from core import indice_facetas
+        versao = indice_facetas._indice.versao
+        self.c.cidade = "Araranguá"
+        self.c.save()
+        self.b.tags.remove(self.hosp)
+        self.praia.empresas.add(self.b)
+        self.a.delete()
+        self.assertEqual(self.ids(indice_facetas.filtrar([self.praia.pk])), {self.b.pk, self.c.pk})
+        self.assertEqual(self.ids(indice_facetas.filtrar([], "Araranguá")), {self.b.pk, self.c.pk})
+        self.assertEqual(indice_facetas.filtrar([self.hosp.pk]), 0)
+        self.assertEqual(indice_facetas._indice.versao, versao)
+
+        # depois do commit a versão compartilhada avança (outros processos remontam)
+        # e este processo a adota sem remontar
+        with self.captureOnCommitCallbacks(execute=True):
+            self.criar_empresa("Nova").tags.add(self.praia)
+        self.assertNotEqual(indice_facetas._indice.versao, versao)
+        self.assertEqual(indice_facetas._indice.versao, indice_facetas.versao())
+        self.assertEqual(indice_facetas.contar(indice_facetas.filtrar([self.praia.pk])), 3)
+
+
+class FavoritosTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        self.a = self.criar_empresa("Padaria Favorita")
+        self.b = self.criar_empresa("Mercado")
+        self.client.login(username="teste", password="Senha@123")
+
+    def test_alternar_e_endpoints_idempotentes(self):
+        url = reverse("toggle_favorito", args=[self.a.slug])
+        self.assertTrue(self.client.post(url).json()["is_favorito"])
+        self.assertFalse(self.client.post(url).json()["is_favorito"])
+
+        adicionar = reverse("adicionar_favorito", args=[self.b.slug])
+        for _ in range(2):
+            self.assertTrue(self.client.post(adicionar).json()["is_favorito"])
+        self.assertEqual(list(self.user.perfil.favoritos.values_list("id", flat=True)), [self.b.pk])
+
+        remover = reverse("remover_favorito", args=[self.b.slug])
+        for _ in range(2):
+            self.assertFalse(self.client.post(remover).json()["is_favorito"])
+        self.assertFalse(self.user.perfil.favoritos.exists())
+        self.assertEqual(self.client.post(reverse("adicionar_favorito", args=["nao-existe"])).status_code, 404)
+        self.assertFalse(self.user.perfil.favoritos.exists())
+
+    def test_custo_do_toggle_nao_depende_da_lista(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        for i in range(20):
+            self.user.perfil.favoritos.add(self.criar_empresa(f"Outra {i}"))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("toggle_favorito", args=[self.a.slug]))
+        # nenhuma leitura da lista de favoritos
+        self.assertFalse([q for q in ctx.captured_queries
+                          if "perfilusuario_favoritos" in q["sql"] and q["sql"].lstrip().upper().startswith("SELECT")])
+
+    def test_conjunto_em_cache_compartilhado_e_invalidado(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.client.post(reverse("toggle_favorito", args=[self.a.slug]))
+        self.client.get(reverse("listar_empresas"))
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("listar_empresas"))
+        self.assertFalse([q for q in ctx.captured_queries if "perfilusuario_favoritos" in q["sql"]])
+        self.assertContains(resp, 'aria-label="Remover dos favoritos"', count=1)
+
+        # detalhe mostra o coração mesmo sem avaliação do usuário
+        resp = self.client.get(reverse("empresa_detalhe", args=[self.a.slug]))
+        self.assertTrue(resp.context["is_favorito"])
+
+        # mudança por fora das views (admin) também invalida
+        self.user.perfil.favoritos.remove(self.a)
+        self.b.favoritado_por.add(self.user.perfil)
+        dados = self.client.get(reverse("listar_empresas"), {"ajax": "1"}).json()
+        self.assertEqual(dados["html"].count('aria-label="Remover dos favoritos"'), 1)
+        self.assertFalse(self.client.get(reverse("empresa_detalhe", args=[self.a.slug])).context["is_favorito"])
+
+
+class MedicaoRequisicaoTests(BaseSetup):
+    def test_linha_de_log_com_rota_consultas_e_request_id(self):
+        self.criar_empresa("Sorveteria")
+        with self.assertLogs("core.medicao", "INFO") as logs:
+            resp = self.client.get(reverse("listar_empresas"), HTTP_X_REQUEST_ID="abc-123")
+        self.assertEqual(resp["X-Request-ID"], "abc-123")
+        linha = logs.records[-1].getMessage()
+        self.assertIn("id=abc-123 metodo=GET rota=listar_empresas status=200", linha)
+        consultas = int(re.search(r"consultas=(\d+)", linha).group(1))
+        self.assertGreater(consultas, 0)
+        for campo in ("db_ms", "templates_ms", "view_ms", "total_ms"):
+            self.assertRegex(linha, rf"{campo}=\d+\.\d")
+
+        # id inválido do cliente é trocado por um gerado
+        resp = self.client.get(reverse("listar_empresas"), HTTP_X_REQUEST_ID="x" * 200)
+        self.assertRegex(resp["X-Request-ID"], r"^[0-9a-f]{32}$")
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_so_para_staff(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("home")))
+        self.client.login(username="teste", password="Senha@123")
+        self.assertNotIn("Server-Timing", self.client.get(reverse("home")))
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        timing = self.client.get(reverse("home"))["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ consultas", tpl;dur=[\d.]+, view;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_para_todos_com_a_configuracao(self):
+        self.assertIn("Server-Timing", self.client.get(reverse("home")))
+
+
+class BenchCommandTests(BaseSetup):
+    def test_catalogo_sintetico_e_relatorio_json(self):
+        import json
+        from django.core.management import call_command
+        from core.models import Avaliacao, TagAncestral
+        saida = io.StringIO()
+        call_command(
+            "bench", banco_atual=True, empresas=30, tags=12, usuarios=10, avaliacoes=60, favoritos=20,
+            imagens=30, repeticoes=2, cenario=["listar_empresas_tag", "empresa_detalhe", "toggle_favorito"],
+            stdout=saida, stderr=io.StringIO(),
+        )
+        dados = json.loads(saida.getvalue())
+        self.assertEqual(dados["catalogo"]["criados"]["empresas"], 30)
+        self.assertEqual(set(dados["cenarios"]), {"listar_empresas_tag", "empresa_detalhe", "toggle_favorito"})
+        for cenario in dados["cenarios"].values():
+            self.assertEqual(cenario["status"], [200])
+            self.assertGreater(cenario["consultas"], 0)
+            self.assertLessEqual(cenario["p50_ms"], cenario["p95_ms"])
+
+        # o que os signals manteriam foi refeito no fim
+        self.assertEqual(Avaliacao.objects.count(), 60)
+        self.assertEqual(sum(Empresa.objects.values_list("total_avaliacoes", flat=True)), 60)
+        self.assertTrue(TagAncestral.objects.filter(profundidade=1).exists())
+        resp = self.client.get(reverse("listar_empresas"), {"q": "pousada"})
+        self.assertEqual(resp.status_code, 200)
+
+
+@override_settings(DEBUG=True)
+class SeedCatalogTests(BaseSetup):
+    def test_seed_em_lote_sem_signals_e_com_dados_validos(self):
+        from django.core.management import call_command
+        from core import indice_facetas
+        from core.models import Avaliacao, Tag, TagAncestral
+        from core.utils.cpf import is_valid_cnpj, is_valid_cpf
+        call_command("seed_catalog", "--empresas=40", "--users=15", "--reviews=300", "--tags=20", "--favoritos=30",
+                     stdout=io.StringIO())
+
+        sinteticos = User.objects.filter(username__startswith="sintetico")
+        self.assertEqual(sinteticos.count(), 15)
+        self.assertEqual(PerfilUsuario.objects.filter(user__in=sinteticos).count(), 15)
+        self.assertTrue(all(is_valid_cpf(c) for c in PerfilUsuario.objects.filter(user__in=sinteticos)
+                            .values_list("cpf_cnpj", flat=True)))
+        empresas = Empresa.objects.all()
+        self.assertEqual(empresas.count(), 40)
+        self.assertTrue(all(is_valid_cnpj(c) for c in empresas.values_list("cnpj", flat=True)))
+        self.assertFalse(empresas.filter(geohash="").exists())
+
+        # agregados gravados junto com as empresas batem com as avaliações
+        self.assertEqual(Avaliacao.objects.count(), 300)
+        for empresa in empresas.filter(total_avaliacoes__gt=0)[:10]:
+            notas = list(Avaliacao.objects.filter(empresa=empresa).values_list("nota", flat=True))
+            self.assertEqual(empresa.total_avaliacoes, len(notas))
+            self.assertEqual(empresa.avaliacoes_5, notas.count(5))
+
+        # hierarquia com fechamento e índice de facetas enxergando o lote
+        self.assertTrue(Tag.objects.filter(parent__parent__isnull=False).exists())
+        self.assertEqual(TagAncestral.objects.filter(profundidade=0).count(), Tag.objects.count())
+        self.assertEqual(indice_facetas.contar(indice_facetas.todas()), 40)
+
+    @override_settings(DEBUG=False)
+    def test_recusa_sem_debug(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            call_command("seed_catalog", empresas=1, stdout=io.StringIO())
+
+
+class PaginasProntasTests(BaseSetup):
+    def setUp(self):
+        from core import paginas_prontas
+        super().setUp()
+        paginas_prontas.esquecer()
+
+    def test_404_com_status_correto_e_comprimido(self):
+        resp = self.client.get("/nao-existe/")
+        self.assertEqual(resp.status_code, 404)
+        self.assertIn(b"<html", resp.content.lower())
+        self.assertEqual(resp["Content-Length"], str(len(resp.content)))
+
+        resp = self.client.get("/nao-existe/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+
+    def test_404_curto_para_json_e_arquivos(self):
+        resp = self.client.get("/api/nao-existe/")
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.json(), {"erro": "Não encontrado."})
+        resp = self.client.get("/nao-existe/", HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp["Content-Type"], "application/json")
+
+        for url in ("/static/nao-existe.css", "/media/x/nao-existe.jpg", "/qualquer/logo.png"):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 404, url)
+            self.assertEqual(resp.content, b"Not found")
+
+    def test_500_pronto(self):
+        from django.test import RequestFactory
+        from core import views
+        resp = views.server_error(RequestFactory().get("/qualquer/"))
+        self.assertEqual(resp.status_code, 500)
+        self.assertIn(b"<html", resp.content.lower())
+        resp = views.server_error(RequestFactory().get("/api/x/"))
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(resp["Content-Type"], "application/json")
+
+    def test_sobre_anonimo_pronto_com_etag(self):
+        from core.models import Tag
+        url = reverse("sobre")
+        primeira = self.client.get(url)
+        self.assertEqual(primeira.status_code, 200)
+        etag = primeira["ETag"]
+
+        with self.assertNumQueries(0):
+            segunda = self.client.get(url)
+        self.assertEqual(segunda.content, primeira.content)
+        self.assertEqual(segunda["ETag"], etag)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # o cabeçalho lista as tags: tag nova, facetas e página em nova versão
+        Tag.objects.create(nome="Mirante teste")
+        terceira = self.client.get(url)
+        self.assertIn(b"Mirante teste", terceira.content)
+        self.assertNotEqual(terceira["ETag"], etag)
+
+    def test_logado_renderiza_na_hora(self):
+        self.client.login(username="teste", password="Senha@123")
+        resp = self.client.get(reverse("sobre"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("ETag", resp)
+        self.assertContains(resp, ">Teste</span>")
+
+
+class CabecalhoEmCacheTests(BaseSetup):
+    def _chave(self, tema="light", staff=False):
+        from django.core.cache.utils import make_template_fragment_key
+        from core import templates_prontos
+        return make_template_fragment_key(templates_prontos.FRAGMENTO_CABECALHO,
+                                          [True, staff, tema, self.user.pk])
+
+    def test_menu_em_cache_e_invalidado_pelo_perfil(self):
+        from django.core.cache import cache
+        self.client.login(username="teste", password="Senha@123")
+        self.client.get(reverse("sobre"))
+        self.assertIsNotNone(cache.get(self._chave()))
+
+        perfil = self.user.perfil
+        perfil.full_name = "Renomeado Teste"
+        perfil.save()
+        self.assertIsNone(cache.get(self._chave()))
+        resp = self.client.get(reverse("sobre"))
+        self.assertContains(resp, "Renomeado")
+
+    def test_tema_e_staff_mudam_a_chave(self):
+        from django.core.cache import cache
+        import json
+        self.client.login(username="teste", password="Senha@123")
+        self.client.get(reverse("sobre"))
+        self.client.post(reverse("salvar_tema"), json.dumps({"theme": "dark"}), content_type="application/json")
+        self.assertIsNone(cache.get(self._chave()))
+        resp = self.client.get(reverse("sobre"))
+        self.assertContains(resp, "dark-mode")
+        self.assertIsNotNone(cache.get(self._chave("dark")))
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIsNone(cache.get(self._chave("dark")))
+        self.client.get(reverse("sobre"))
+        self.assertIsNotNone(cache.get(self._chave("dark", staff=True)))
+
+    def test_anonimos_dividem_o_menu_sem_o_painel_de_busca(self):
+        resp = self.client.get(reverse("sobre"))
+        self.assertContains(resp, "Acessar sua conta")
+        resp = self.client.get(reverse("listar_empresas"), {"q": "farol"})
+        self.assertContains(resp, 'value="farol"')
+
+    def test_aquecer_carrega_templates_do_projeto(self):
+        from core import templates_prontos
+        self.assertGreater(templates_prontos.aquecer(), 5)
@@ -27,16 +27,26 @@ urlpatterns = [
     path('empresas/', views.listar_empresas, name='listar_empresas'),
     path('empresa/<slug:slug>/', views.empresa_detalhe, name='empresa_detalhe'),
     path('empresa/<slug:slug>/editar/', views.editar_empresa, name='editar_empresa'),
+    path('empresa/<slug:slug>/imagens/status/', views.status_imagens_empresa, name='status_imagens_empresa'),
     path('cadastrar_empresa/', views.cadastrar_empresa, name='cadastrar_empresa'),
     path('suas_empresas/', views.suas_empresas, name='suas_empresas'),
 
     # Busca/filtros (compat)
     path('empresas/buscar/', views.buscar_empresas, name='buscar_empresas'),
     path('empresas/filtros/', views.filtros_empresas, name='filtros_empresas'),
+    path('empresas/proximas/', views.empresas_proximas, name='empresas_proximas'),
+    path('mapa/', views.mapa_view, name='mapa'),
+    path('mapa/pontos/', views.mapa_pontos, name='mapa_pontos'),
+
+    # API de leitura (core.api)
+    path('api/v1/empresas/', views.api_empresas, name='api_empresas'),
+    path('api/v1/empresas/<slug:slug>/', views.api_empresa, name='api_empresa'),
+    path('api/v1/tags/', views.api_tags, name='api_tags'),
 
     # Importação em lote + modelo (NOVOS nomes)
     path("empresas/modelo/", views.download_template_empresas, name="download_template_empresas"),
     path("empresas/importar/", views.importar_empresas_arquivo, name="importar_empresas_arquivo"),
+    path("empresas/importar/<int:job_id>/", views.status_importacao, name="status_importacao"),
 
      # Perfil
     path('perfil/', views.perfil, name='perfil'),
@@ -53,8 +63,11 @@ urlpatterns = [
     path('empresa/<slug:slug>/avaliar/', views.adicionar_avaliacao, name='adicionar_avaliacao'),
     path('avaliacao/deletar/<int:avaliacao_id>/', views.deletar_avaliacao, name='deletar_avaliacao'),
     path('empresa/<slug:slug>/favoritar/', views.toggle_favorito, name='toggle_favorito'),
+    path('empresa/<slug:slug>/favoritos/adicionar/', views.adicionar_favorito, name='adicionar_favorito'),
+    path('empresa/<slug:slug>/favoritos/remover/', views.remover_favorito, name='remover_favorito'),
     path('meus-favoritos/', views.listar_favoritos, name='listar_favoritos'),
     path('ferramentas/gerador-qrcode/', views.gerador_qrcode_view, name='gerador_qrcode'),
+    path('ferramentas/cache-paginas/', views.cache_paginas_status, name='cache_paginas_status'),
 
     path('perfil/salvar-tema/', views.salvar_tema_preferido, name='salvar_tema'),
     path('empresa/<slug:slug>/deletar/', views.deletar_empresa, name='deletar_empresa'),
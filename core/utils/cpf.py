@@ -19,6 +19,34 @@ def is_valid_cpf(cpf: str) -> bool:
     d2 = _dv(nums + [d1], 11)
     return cpf[-2:] == f"{d1}{d2}"
 
+def completar_cpf(nove: str) -> str:
+    """Os 9 primeiros dígitos + os dois verificadores (CPF válido, se não for repetido)."""
+    nums = [int(c) for c in nove]
+    def _dv(digs, start):
+        s = sum(n * w for n, w in zip(digs, range(start, 1, -1)))
+        r = s % 11
+        return 0 if r < 2 else 11 - r
+    d1 = _dv(nums, 10)
+    d2 = _dv(nums + [d1], 11)
+    return nove + str(d1) + str(d2)
+
+def completar_cnpj(doze: str) -> str:
+    """Os 12 primeiros dígitos + os dois verificadores (CNPJ válido)."""
+    nums = [int(c) for c in doze]
+    def _dv(digs):
+        pesos = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2][-len(digs):]
+        r = sum(n * w for n, w in zip(digs, pesos)) % 11
+        return 0 if r < 2 else 11 - r
+    d1 = _dv(nums)
+    d2 = _dv(nums + [d1])
+    return doze + str(d1) + str(d2)
+
+def is_valid_cnpj(cnpj: str) -> bool:
+    cnpj = only_digits(cnpj)
+    if len(cnpj) != 14 or cnpj == cnpj[0] * 14:
+        return False
+    return completar_cnpj(cnpj[:12]) == cnpj
+
 def generate_cpf() -> str:
     """Gera CPF válido (11 dígitos). Evita sequências repetidas."""
     for _ in range(50):
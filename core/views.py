@@ -1,13 +1,14 @@
 from __future__ import annotations
 import unicodedata
 
-import csv
-import io
+import hashlib
 import re
-from io import BytesIO, StringIO
+from io import BytesIO
 from urllib.parse import urlparse, parse_qs
 from .forms import ProfileForm, CpfUpdateForm, StartResetByCpfForm, CustomLoginForm, EmpresaForm, UserRegistrationForm, TagForm
-from .models import PerfilUsuario, Empresa, ImagemEmpresa
+from .models import PerfilUsuario, Empresa, ImagemEmpresa, ImportacaoJob, TagAncestral, UploadImagem
+from . import api, arvore_tags, cache_paginas, facets, favoritos, fila_imagens, fila_importacao, geo, indice_facetas, mapa, pagination, paginas_prontas, search
+from .esquema_importacao import CABECALHO_MODELO, digitos
 from django.contrib.auth import authenticate
 from .models import Tag
 from django.contrib.admin.views.decorators import staff_member_required
@@ -21,6 +22,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from django.views.decorators.http import require_http_methods
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login as auth_login, logout
 from django.contrib.auth.decorators import login_required
@@ -28,15 +30,15 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
 from django.core.paginator import Paginator
 from django.db import transaction, IntegrityError
-from django.db.models import Q, Avg, Count, Prefetch
+from django.db.models import Q, Max, Prefetch
 from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.utils.decorators import method_decorator
-from django.views.decorators.http import require_GET, require_POST
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition, require_GET, require_POST
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
-import csv, io
 
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm, PasswordResetForm
@@ -48,95 +50,6 @@ from .models import PerfilUsuario, Empresa, Tag
 
 from core.models import Tag, Empresa
 
-# ============================================================
-
-# nomes aceitos (mantém os seus sinônimos)
-COLUMN_ALIASES = {
-    # --- Modelo Padrão (Mantido para compatibilidade) ---
-    "nome": ["nome", "razão social", "razao social"],
-    "categoria": ["ramo atividade", "ramo de atividade", "categoria", "ramo"],
-    "bairro": ["bairro"], "rua": ["endereço", "endereco", "logouro", "endereço completo"],
-    "numero": ["número", "numero", "nº"], "cidade": ["cidade", "municipio", "município"],
-    "cep": ["cep", "c.e.p."], "telefone": ["telefone", "fone", "whatsapp"],
-    "contato": ["contato direto", "contato"], "descricao": ["descrição", "descricao", "observacao", "obs"],
-    # ... outros do modelo padrão
-
-    # --- MAPEAMENTO COMPLETO PARA GOOGLE CONTACTS ---
-    # Nomes
-    "google_nome_contato": ["Name"],
-    "google_tag": ["First Name"], 
-    "google_nome_do_meio": ["Middle Name"],
-    "google_sobrenome": ["Last Name"],
-    "google_apelido": ["Nickname"],
-    "google_file_as": ["File As"],
-    
-    # Organização
-    "google_nome_empresa": ["Organization Name"],
-    "google_cargo": ["Organization Title"],
-    "google_departamento": ["Organization Department"],
-    
-    # Contatos
-    "google_email_1": ["E-mail 1 - Value"],
-    "google_email_2": ["E-mail 2 - Value"],
-    "google_telefone_1": ["Phone 1 - Value"],
-    "google_telefone_2": ["Phone 2 - Value"],
-    "google_telefone_3": ["Phone 3 - Value"],
-    
-    # Endereços
-    "google_endereco_formatado": ["Address 1 - Formatted"],
-    "google_rua": ["Address 1 - Street"],
-    "google_cidade": ["Address 1 - City"],
-    "google_estado": ["Address 1 - Region"],
-    "google_cep": ["Address 1 - Postal Code"],
-    "google_pais": ["Address 1 - Country"],
-    
-    # Websites
-    "google_website_1": ["Website 1 - Value"],
-    "google_website_2": ["Website 2 - Value"],
-    
-    # Outros
-    "google_aniversario": ["Birthday"],
-    "google_notas": ["Notes"],
-    
-    "google_custom_1_label": ["Custom Field 1 - Label"], 
-    "google_custom_1_value": ["Custom Field 1 - Value"], 
-    "google_custom_2_label": ["Custom Field 2 - Label"],
-    "google_custom_2_value": ["Custom Field 2 - Value"],
-    "google_custom_3_label": ["Custom Field 3 - Label"],
-    "google_custom_3_value": ["Custom Field 3 - Value"],
-}
-
-TEMPLATE_HEADERS = [
-    ("CNPJ",                          False, "cnpj"),
-    ("CATEGORIA (RAMO ATIVIDADE)",    False, "categoria"),
-    ("NOME",                          False, "nome"),
-    ("BAIRRO",                        False, "bairro"),
-    ("ENDEREÇO COMPLETO",             False, "endereco"),
-    ("TELEFONE",                      False, "telefone"),
-    ("CONTATO DIRETO",                False, "contato"),
-    ("DIGITAL (site/redes)",          False, "digital"),
-    ("CADASTUR",                      False, "cadastrur"),
-    ("MAPS (link)",                   False, "maps"),
-    ("APP",                           False, "app"),
-    ("DESCRIÇÃO",                     False, "descricao"),
-    ("NÚMERO",                        False, "numero"),
-    ("CEP",                           False, "cep"),
-    ("CIDADE",                        False, "cidade"),
-]
-
-LOREM_DEFAULT = (
-    "Descrição ainda não informada. Este estabelecimento está em processo de "
-    "complementação de dados. Se você é o responsável, atualize as informações."
-)
-
-DEFAULT_DESC = (
-    "Descrição ainda não informada. Este estabelecimento está em processo de "
-    "complementação de dados. Se você é o responsável, atualize as informações."
-)
-
-EXPECTED_CANONS = [c for (_label, _req, c) in TEMPLATE_HEADERS]
-HUMAN_LABEL_BY_CANON = {c: label for (label, _req, c) in TEMPLATE_HEADERS}
-
 # ============================================================
 # Helpers
 # ============================================================
@@ -144,10 +57,8 @@ HUMAN_LABEL_BY_CANON = {c: label for (label, _req, c) in TEMPLATE_HEADERS}
 def get_base_empresas_queryset():
     return Empresa.objects.select_related('user__perfil').prefetch_related(
         'tags',
-        'imagens' 
-    ).annotate(
-        avg_nota=Avg('avaliacoes__nota'),
-        count_avaliacoes=Count('avaliacoes')
+        # só a capa de cada empresa (janela por empresa_id, sem N+1 no card)
+        Prefetch('imagens', queryset=ImagemEmpresa.objects.capas(), to_attr='imagem_principal_list'),
     )
     
 def _clip(model_cls, field_name, value):
@@ -170,30 +81,6 @@ def _maxlen(model_cls, field_name):
     except Exception:
         return None
     
-def _parse_row_padrao(data):
-    """Extrai e normaliza dados de uma linha do modelo padrão."""
-    parsed = {
-        'nome': data.get('nome'),
-        'cnpj': _digits(data.get('cnpj')),
-        'telefone': _digits(data.get('telefone')),
-        'rua': data.get('rua'),
-        'cidade': data.get('cidade'),
-        'cep': _digits(data.get('cep')),
-        'descricao': data.get('descricao') or DEFAULT_DESC,
-        'horario_semana': data.get('horario_semana'),
-        'horario_sabado': data.get('horario_sabado'),
-        'horario_domingo': data.get('horario_domingo'),
-        'horario_observacoes': data.get('horario_observacoes'),
-        'tags': [name.strip() for name in data.get('categoria', '').split(',') if name.strip()],
-    }
-    return {k: v for k, v in parsed.items() if v or k == 'nome'}
-
-def _norm_text(s: str | None) -> str:
-    return re.sub(r"[\W_]+", " ", (s or "")).strip().lower()
-
-def _digits(s: str | None) -> str:
-    return re.sub(r"\D", "", s or "")
-
 def _extract_latlng_from_maps(url):
     try:
         if not url: return None, None
@@ -208,128 +95,6 @@ def _extract_latlng_from_maps(url):
         pass
     return None, None
 
-def _alias_match(key_norm: str, alias: str) -> bool:
-    """Casa de forma flexível: tokens do alias presentes no cabeçalho."""
-    a = _norm_text(alias).split()
-    k = key_norm.split()
-    return all(t in k for t in a) or key_norm == _norm_text(alias)
-
-def _build_header_map(raw_headers):
-    mapping = {}
-    for idx, raw in enumerate(raw_headers or []):
-        key = _norm_text(raw)
-        for canon, alts in COLUMN_ALIASES.items():
-            if key in (_norm_text(a) for a in alts):
-                mapping[idx] = canon
-                break
-    return mapping
-
-def _read_rows_from_upload(file_obj, filename):
-    name = (filename or "").lower()
-    if name.endswith(".csv"):
-        data = file_obj.read().decode("utf-8", errors="ignore")
-        reader = csv.reader(StringIO(data))
-        rows = list(reader)
-    else:
-        from openpyxl import load_workbook
-        wb = load_workbook(file_obj, data_only=True)
-        ws = wb.active
-        rows = []
-        for row in ws.iter_rows(values_only=True):
-            rows.append([(c if c is not None else "") for c in row])
-    if not rows: 
-        return [], []
-    headers = [str(c).strip() for c in rows[0]]
-    body    = [[str(c).strip() for c in r] for r in rows[1:]]
-    return headers, body
-
-def _norm_text(s): 
-    return re.sub(r"[\W_]+"," ",(s or "")).strip().lower()
-
-    # XLSX
-    from openpyxl import load_workbook
-    wb = load_workbook(file_obj, data_only=True)
-    ws = wb.active
-    rows = []
-    for row in ws.iter_rows(values_only=True):
-        rows.append([(c if c is not None else "") for c in row])
-    if not rows:
-        return [], []
-    headers = [str(c).strip() for c in rows[0]]
-    body = [[str(c).strip() for c in r] for r in rows[1:]]
-    return headers, body
-
-def _digits(s: str | None) -> str:
-    return re.sub(r"\D", "", s or "")
-
-def _squeeze(s: str | None) -> str:
-    """trim + colapsa espaços"""
-    return re.sub(r"\s+", " ", (s or "").strip())
-
-def _norm_label(s: str | None) -> str:
-    """normaliza rótulo de coluna: lowercase, remove '(...)', colapsa espaços"""
-    s = (s or "")
-    s = re.sub(r"\([^)]*\)", "", s)
-    s = s.replace(":", " ").replace("/", " ")
-    s = _squeeze(s).lower()
-    return s
-
-def _norm_space_lower(s: str | None) -> str:
-    return re.sub(r"[\W_]+", " ", (s or "")).strip().lower()
-
-def _to_float(val, default=None):
-    try:
-        if val is None or str(val).strip() == "":
-            return default
-        return float(str(val).replace(",", "."))
-    except Exception:
-        return default
-
-def _match_header_map(headers: list[str]) -> dict[int, str]:
-    result = {}
-    for idx, raw in enumerate(headers):
-        k = _norm_space_lower(raw)
-        for canon, alts in COLUMN_ALIASES.items():
-            if k in [_norm_space_lower(a) for a in alts]:
-                result[idx] = canon
-                break
-    return result
-
-def _get_reader(file_obj, filename: str):
-    ext = (filename or "").lower()
-    if ext.endswith(".csv"):
-        data = file_obj.read().decode("utf-8", errors="ignore")
-        reader = csv.reader(StringIO(data))
-        rows = [[(c or "").strip() for c in r] for r in reader]
-        return rows
-
-    from openpyxl import load_workbook
-    wb = load_workbook(file_obj, data_only=True)
-    ws = wb.active
-    rows = []
-    for row in ws.iter_rows(values_only=True):
-        rows.append([("" if c is None else str(c)).strip() for c in row])
-    return rows
-
-
-def _only_digits(s: str) -> str:
-    import re
-    return re.sub(r"\D", "", s or "")
-
-def _to_float(val, default=None):
-    try:
-        if val is None or str(val).strip() == "":
-            return default
-        return float(str(val).replace(",", "."))
-    except Exception:
-        return default
-
-def _strip_parens(s: str | None) -> str:
-    """Remove QUALQUER sufixo entre parênteses no cabeçalho."""
-    if not s:
-        return ""
-    return re.sub(r"\s*\(.*?\)\s*$", "", str(s)).strip()
-
 def _has_field(model_class, field_name: str) -> bool:
     return any(getattr(f, "name", None) == field_name for f in model_class._meta.get_fields())
 
@@ -342,9 +107,91 @@ def _first_url_in_text(s):
     m = re.search(r'(https?://\S+)', s)
     return m.group(1) if m else None
 
+def _cursor_da_requisicao(request, por_pagina):
+    """?cursor=... (novo) ou ?page=N (links antigos) convertido em cursor de deslocamento."""
+    cursor = request.GET.get('cursor')
+    if cursor:
+        return cursor
+    try:
+        page = int(request.GET.get('page') or 1)
+    except ValueError:
+        page = 1
+    return pagination.cursor_deslocamento((page - 1) * por_pagina) if page > 1 else None
+
+def _cards_json(request, pagina, extra_context=None):
+    """Resposta do 'carregar mais': HTML dos cards + cursor da próxima página (sem COUNT)."""
+    html = render_to_string(
+        'core/partials/empresas_cards.html',
+        {'page_obj': pagina, **(extra_context or {})},
+        request=request,
+    )
+    return JsonResponse({'html': html, 'has_next': pagina.has_next(), 'next_cursor': pagina.next_cursor})
+
+def _hidratar_proximos(empresas, proximos):
+    """Troca os Proximo(id, distância) de uma página pelas empresas, na mesma ordem."""
+    por_id = empresas.in_bulk([p.id for p in proximos])
+    objetos = []
+    for p in proximos:
+        emp = por_id.get(p.id)
+        if emp is not None:
+            emp.distancia_km = p.distancia_km
+            objetos.append(emp)
+    return objetos
+
 def _wants_json(request):
+    # ?ajax=1 é o que o "carregar mais" (fetch sem cabeçalhos) envia
     return "application/json" in request.META.get("HTTP_ACCEPT", "") or \
-           request.headers.get('x-requested-with') == 'XMLHttpRequest'
+           request.headers.get('x-requested-with') == 'XMLHttpRequest' or \
+           request.GET.get('ajax') == '1'
+
+# ============================================================
+# GET condicional (ETag / Last-Modified a partir de Empresa.updated_at)
+# ============================================================
+# Só para anônimos: logados veem favoritos, tema e avatar próprios na página.
+# A ETag inclui o segredo CSRF porque o token dele vai embutido no HTML.
+
+def _etag(*partes):
+    return hashlib.md5("|".join(map(str, partes)).encode()).hexdigest()
+
+def _segredo_csrf(request):
+    # get_token cria o segredo na primeira visita; é o mesmo que a página vai usar
+    get_token(request)
+    return request.META['CSRF_COOKIE']
+
+def _versao_empresa(request, slug):
+    """(id, updated_at) da empresa; uma consulta, memorizada na requisição."""
+    if not hasattr(request, '_versao_empresa'):
+        request._versao_empresa = Empresa.objects.filter(slug=slug).values_list('pk', 'updated_at').first()
+    return request._versao_empresa
+
+def _etag_empresa(request, slug):
+    versao = cache_paginas.anonimo_sem_mensagens(request) and _versao_empresa(request, slug)
+    if not versao:
+        return None
+    return _etag('empresa', versao[0], versao[1].isoformat(), _segredo_csrf(request))
+
+def _modificada_empresa(request, slug):
+    versao = cache_paginas.anonimo_sem_mensagens(request) and _versao_empresa(request, slug)
+    return versao[1] if versao else None
+
+def _versao_listagem(request):
+    """Max(updated_at) do catálogo; uma consulta, resolvida pelo índice de updated_at."""
+    if not hasattr(request, '_versao_listagem'):
+        request._versao_listagem = Empresa.objects.aggregate(ultima=Max('updated_at'))['ultima']
+    return request._versao_listagem
+
+def _condicional_listagem(request):
+    # só o JSON do "carregar mais"; o HTML da listagem fica no cache de páginas
+    return _wants_json(request) and cache_paginas.anonimo_sem_mensagens(request)
+
+def _etag_listagem(request):
+    if not _condicional_listagem(request):
+        return None
+    # remoções não mexem no Max(updated_at); a versão do catálogo cobre esse caso
+    return _etag('listagem', request.get_full_path(), _versao_listagem(request), cache_paginas.catalogo.versao())
+
+def _modificada_listagem(request):
+    return _versao_listagem(request) if _condicional_listagem(request) else None
 
 def _ident_kind(ident: str) -> str:
     ident = (ident or "").strip()
@@ -355,121 +202,30 @@ def _ident_kind(ident: str) -> str:
         return "cpf"
     return "username"
 
-def _parse_row_google(data):
-    """
-    Extrai e normaliza dados de uma linha do Google Contacts, capturando todos os campos
-    não mapeados e adicionando-os à descrição.
-    """
-    parsed = {}
-    extra_descricao_parts = []
-    
-    # Lista de chaves que já têm um tratamento especial e não devem ser repetidas na descrição.
-    handled_keys = {
-        'google_nome_empresa', 'google_file_as', 'google_nome_contato', 'google_tag',
-        'google_email_1', 'google_email_2', 'google_telefones', 'google_telefone_1', 
-        'google_telefone_2', 'google_telefone_3', 'google_website_1', 'google_website_2',
-        'google_endereco_formatado', 'google_rua', 'google_cidade', 'google_cep', 'google_notas',
-        'google_custom_1_label', 'google_custom_1_value', 'google_custom_2_label', 
-        'google_custom_2_value', 'google_custom_3_label', 'google_custom_3_value',
-    }
-
-    # --- 1. MAPEAMENTO DE CAMPOS PRINCIPAIS ---
-    
-    # Nome da Empresa (com fallbacks)
-    parsed['nome'] = data.get('google_nome_empresa') or data.get('google_file_as') or data.get('google_nome_contato')
-    
-    # Tag (Primeiro Nome)
-    if data.get('google_tag'):
-        parsed['tags'] = [data.get('google_tag')]
-
-    # E-mail (pega o primeiro encontrado)
-    parsed['email'] = data.get('google_email_1') or data.get('google_email_2')
-
-    # Telefones (pega o primeiro para o campo principal, os outros vão para a descrição)
-    all_phones = [data.get('google_telefone_1', ''), data.get('google_telefone_2', ''), data.get('google_telefone_3', '')]
-    valid_phones = [phone for phone in all_phones if phone]
-    if valid_phones:
-        parsed['telefone'] = _digits(valid_phones[0])
-        if len(valid_phones) > 1:
-            extra_descricao_parts.append(f"Telefones Adicionais: {', '.join(valid_phones[1:])}")
-
-    # Endereço
-    parsed['rua'] = data.get('google_rua')
-    parsed['cidade'] = data.get('google_cidade')
-    parsed['cep'] = _digits(data.get('google_cep'))
-
-    # Websites (lógica para Instagram/Facebook)
-    website_url = data.get('google_website_1', '')
-    if 'instagram.com' in website_url: parsed['instagram'] = website_url
-    elif 'facebook.com' in website_url: parsed['facebook'] = website_url
-    elif website_url: parsed['site'] = website_url
-
-    # Campos Customizados (CNPJ e CADASTUR)
-    for i in range(1, 4):
-        label = data.get(f'google_custom_{i}_label', '').lower().strip()
-        value = data.get(f'google_custom_{i}_value', '').strip()
-        if label in ['cpf', 'cnpj', 'cpf ou cnpj']:
-            parsed['cnpj'] = _digits(value)
-        elif label == 'cadastur':
-            parsed['cadastrur'] = "Sim" if value.lower() in ['sim', 's'] else "Não"
-
-    # --- 2. CAPTURA DE TODOS OS CAMPOS NÃO MAPEADOS ---
-    
-    unmapped_data = []
-    for key, value in data.items():
-        if key not in handled_keys and value and 'label' not in key:
-            # Transforma a chave (ex: 'google_sobrenome') em um rótulo legível (ex: 'Sobrenome')
-            label_legivel = key.replace('google_', '').replace('_', ' ').title()
-            unmapped_data.append(f"{label_legivel}: {value}")
-    
-    # --- 3. MONTAGEM DA DESCRIÇÃO FINAL ---
-    
-    # Começa com o campo "Notas" do Google
-    descricao_final = data.get('google_notas', '')
-    
-    # Adiciona o endereço formatado, se existir
-    if data.get('google_endereco_formatado'):
-        descricao_final += f"\n\nEndereço Completo: {data.get('google_endereco_formatado')}"
-
-    # Adiciona a lista de telefones extras (se houver)
-    if any("Telefones Adicionais" in part for part in extra_descricao_parts):
-        descricao_final += "\n" + "\n".join(part for part in extra_descricao_parts if "Telefones Adicionais" in part)
-        
-    # Adiciona todos os outros campos não mapeados
-    if unmapped_data:
-        descricao_final += "\n\n--- Outras Informações ---\n"
-        descricao_final += "\n".join(unmapped_data)
-        
-    parsed['descricao'] = descricao_final or DEFAULT_DESC
-    
-    return parsed
-
 # ============================================================
 # Páginas básicas / Auth
 # ============================================================
 
+@cache_paginas.pagina_anonima(lambda: [cache_paginas.catalogo])
 def home(request):
     empresas_list = get_base_empresas_queryset().order_by('-data_cadastro')[:8]
     total_empresas = Empresa.objects.count()
 
-    favorito_ids = []
-    if request.user.is_authenticated:
-        favorito_ids = request.user.perfil.favoritos.values_list('id', flat=True)
-
     return render(request, 'home.html', {
         'page_obj': empresas_list,
         'total_empresas': total_empresas,
-        'favorito_ids': list(favorito_ids)
+        'favorito_ids': favoritos.ids(request.user),
     })
  
+# conteúdo fixo: anônimos recebem a versão pré-renderizada (core.paginas_prontas)
 def sobre(request):
-    return render(request, 'core/sobre.html')
+    return paginas_prontas.pagina_fixa(request, 'core/sobre.html')
 
 def termo_de_servico(request):
-    return render(request, 'core/termo_de_servico.html')
+    return paginas_prontas.pagina_fixa(request, 'core/termo_de_servico.html')
 
 def politica_de_privacidade(request):
-    return render(request, 'core/politica_de_privacidade.html')
+    return paginas_prontas.pagina_fixa(request, 'core/politica_de_privacidade.html')
 
 def register(request):
     if request.user.is_authenticated:
@@ -574,13 +330,11 @@ def cadastrar_empresa(request):
             empresa.save()
             form.save_m2m() 
 
+            # a capa também passa pela fila (core.fila_imagens): normalização e
+            # derivados rodam fora da requisição
             imagem_file = request.FILES.get('imagem_inicial')
             if imagem_file:
-                ImagemEmpresa.objects.create(
-                    empresa=empresa,
-                    imagem=imagem_file,
-                    principal=True
-                )
+                fila_imagens.receber(empresa, request.user, [imagem_file], principal=True)
 
             action = 'reset' if 'save_and_add' in request.POST else 'redirect'
             return JsonResponse({
@@ -620,18 +374,29 @@ def editar_empresa(request, slug):
         if form.is_valid():
             form.save()
 
-            novas_imagens = request.FILES.getlist('novas_imagens')
-            for file in novas_imagens:
-                ImagemEmpresa.objects.create(empresa=empresa, imagem=file)
+            # só grava no staging local; o processamento e o envio ao storage
+            # de mídia rodam fora da requisição (core.fila_imagens)
+            uploads = fila_imagens.receber(empresa, request.user, form.cleaned_data.get('novas_imagens') or [])
 
             principal_id = request.POST.get('imagem_principal')
             if principal_id:
                 empresa.imagens.update(principal=False)
                 ImagemEmpresa.objects.filter(id=principal_id, empresa=empresa).update(principal=True)
+                cache_paginas.invalidar_empresas([empresa.slug])  # update() não dispara signals
 
+            status_url = reverse('status_imagens_empresa', args=[empresa.slug])
             if wants_json:
-                return JsonResponse({'ok': True, 'redirect_url': reverse('suas_empresas')})
+                return JsonResponse({
+                    'ok': True,
+                    'redirect_url': reverse('suas_empresas'),
+                    'uploads': [u.pk for u in uploads],
+                    'status_url': status_url,
+                })
             messages.success(request, f"A empresa “{empresa.nome}” foi atualizada com sucesso!")
+            if uploads:
+                # volta para a galeria, que acompanha o processamento das novas imagens
+                messages.info(request, f"{len(uploads)} imagem(ns) em processamento; elas aparecem na galeria em instantes.")
+                return redirect(reverse('editar_empresa', args=[empresa.slug]) + '#image-gallery-container')
             return redirect('suas_empresas')
 
         if wants_json:
@@ -641,8 +406,33 @@ def editar_empresa(request, slug):
     return render(request, 'core/editar_empresa.html', {
         'form': form,
         'empresa': empresa,
+        'uploads_pendentes': empresa.uploads_imagem.filter(
+            status__in=(UploadImagem.PENDENTE, UploadImagem.PROCESSANDO)
+        ),
     }, status=(400 if request.method == 'POST' else 200))
 
+
+@login_required
+@require_GET
+def status_imagens_empresa(request, slug):
+    """Situação dos uploads da galeria (?ids=1,2,3; sem ids: os ainda na fila)."""
+    empresa = get_object_or_404(Empresa, slug=slug)
+    if empresa.user_id != request.user.id and not request.user.is_superuser:
+        raise Http404("Você não tem permissão para editar esta empresa.")
+
+    uploads = empresa.uploads_imagem.select_related('imagem')
+    ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip().isdigit()]
+    if ids:
+        uploads = uploads.filter(pk__in=ids[:50])
+    else:
+        uploads = uploads.filter(status__in=(UploadImagem.PENDENTE, UploadImagem.PROCESSANDO))
+    itens = [u.status_dict() for u in uploads]
+    return JsonResponse({
+        'ok': True,
+        'finalizado': all(i['finalizado'] for i in itens),
+        'uploads': itens,
+    })
+
 @login_required
 @require_POST
 def deletar_imagem_empresa(request, imagem_id):
@@ -666,37 +456,37 @@ def deletar_imagem_empresa(request, imagem_id):
 
 @login_required(login_url='/login/')
 def suas_empresas(request):
-    empresas_list = get_base_empresas_queryset().filter(user=request.user).order_by('-data_cadastro')
-    paginator = Paginator(empresas_list, 8)
-    page_obj = paginator.get_page(request.GET.get('page') or 1)
+    ordenacao = ('-data_cadastro', '-id')
+    empresas_list = get_base_empresas_queryset().filter(user=request.user).order_by(*ordenacao)
 
     if _wants_json(request):
-        html = render_to_string('core/partials/empresas_cards.html', {'page_obj': page_obj}, request=request)
-        return JsonResponse({'html': html, 'has_next': page_obj.has_next(),
-                             'next_page_number': page_obj.next_page_number() if page_obj.has_next() else None})
-    
-    return render(request, 'core/suas_empresas.html', {'page_obj': page_obj})
+        pagina = pagination.paginar_por_cursor(empresas_list, ordenacao, _cursor_da_requisicao(request, 8), 8)
+        return _cards_json(request, pagina)
 
+    paginator = Paginator(empresas_list, 8)
+    page_obj = paginator.get_page(request.GET.get('page') or 1)
+    return render(request, 'core/suas_empresas.html', {
+        'page_obj': page_obj,
+        'next_cursor': pagination.cursor_para_pagina(page_obj, ordenacao),
+    })
 
+
+@condition(etag_func=_etag_empresa, last_modified_func=_modificada_empresa)
+@cache_paginas.pagina_anonima(lambda slug: [cache_paginas.tags, cache_paginas.empresa(slug)])
 def empresa_detalhe(request, slug):
     empresa = get_object_or_404(
-        Empresa.objects.annotate(
-            avg_nota=Avg('avaliacoes__nota'),
-            count_avaliacoes=Count('avaliacoes__id', distinct=True)
-        ).prefetch_related('imagens', 'avaliacoes__user__perfil'), 
+        Empresa.objects.prefetch_related('imagens', 'avaliacoes__user__perfil'),
         slug=slug
     )
 
     avaliacao_form = AvaliacaoForm()
     user_ja_avaliou = False
-    is_favorito = False
+    is_favorito = empresa.id in favoritos.ids(request.user)
 
     if request.user.is_authenticated:
         if Avaliacao.objects.filter(empresa=empresa, user=request.user).exists():
             user_ja_avaliou = True
 
-            is_favorito = request.user.perfil.favoritos.filter(slug=slug).exists()
-
     context = {
         'empresa': empresa,
         'avaliacao_form': avaliacao_form,
@@ -706,68 +496,226 @@ def empresa_detalhe(request, slug):
     return render(request, 'core/empresa_detalhe.html', context)
 
 
-def listar_empresas(request):
-    # --- 1. Filtros e Paginação (Tudo como antes) ---
-    empresas = get_base_empresas_queryset()
-
+def _filtros_listagem(request):
+    """
+    (q, tag_ids, cidade, modo, bits) da listagem (e da API). ``bits`` é o
+    bitset de tag/cidade do core.indice_facetas (None sem esses filtros):
+    ?modo_tags=e exige todas as tags; cada tag inclui as subtags dela.
+    """
     q = (request.GET.get('q') or '').strip()
     tag_ids = request.GET.getlist('tag')
     cidade = (request.GET.get('cidade') or '').strip()
-    
-    if q:
-        empresas = empresas.filter(
-            Q(nome__icontains=q) |
-            Q(descricao__icontains=q) |
-            Q(bairro__icontains=q) |
-            Q(cidade__icontains=q) |
-            Q(tags__nome__icontains=q)
-        ).distinct()
+    modo = indice_facetas.MODO_E if request.GET.get('modo_tags') == indice_facetas.MODO_E else indice_facetas.MODO_OU
+    return q, tag_ids, cidade, modo, indice_facetas.filtrar(tag_ids, cidade, modo)
 
+def _restringir(empresas, tag_ids, cidade, modo):
+    """
+    Filtro de tag/cidade em SQL para a busca e o "perto de mim" (mesma regra
+    do core.indice_facetas). Subconsultas em vez de ``id__in`` com os ids do
+    bitset: uma tag ampla viraria um parâmetro por empresa.
+    """
+    tag_ids = [int(t) for t in tag_ids if str(t).strip().isdigit()]
     if tag_ids:
-        empresas = empresas.filter(tags__id__in=tag_ids).distinct()
-    
+        # a tag ou qualquer subtag dela (fechamento em TagAncestral, ver core.arvore_tags)
+        grupos = [[t] for t in tag_ids] if modo == indice_facetas.MODO_E else [tag_ids]
+        for grupo in grupos:
+            subtags = TagAncestral.objects.filter(ancestral_id__in=grupo).values('descendente_id')
+            empresas = empresas.filter(
+                id__in=Empresa.tags.through.objects.filter(tag_id__in=subtags).values('empresa_id')
+            )
     if cidade:
         empresas = empresas.filter(cidade__iexact=cidade)
+    return empresas
 
-    empresas = empresas.order_by('-id')
+def _carregar_empresas(ids):
+    """Empresas (com tags e capa) de ``ids``, na mesma ordem."""
+    por_id = get_base_empresas_queryset().in_bulk(ids)
+    return [por_id[i] for i in ids if i in por_id]
 
-    paginator = Paginator(empresas, 12)
-    page_obj = paginator.get_page(request.GET.get('page') or 1)
+@condition(etag_func=_etag_listagem, last_modified_func=_modificada_listagem)
+@cache_paginas.pagina_anonima(lambda: [cache_paginas.catalogo], variacao=_wants_json)
+def listar_empresas(request):
+    # --- 1. Filtros e Paginação ---
+    q, tag_ids, cidade, modo, bits = _filtros_listagem(request)
+    ponto = geo.ponto_da_requisicao(request.GET)
+
+    # só tag/cidade: ids e total saem do índice de facetas, na ordem da chave
+    # (-id), e o SQL busca só a página. Com busca a ordem é por relevância e com
+    # "perto de mim" pela distância: o cursor guarda só o deslocamento
+    ordenacao = ('-id',)
+    por_chave = not q and not ponto
+    if por_chave:
+        bits = indice_facetas.todas() if bits is None else bits
+    else:
+        empresas = _restringir(get_base_empresas_queryset(), tag_ids, cidade, modo)
+        if q:
+            # índice textual (core.search): sem acento, por prefixo e ordenado por relevância
+            empresas = search.filtrar(empresas, q).order_by('busca_rank', '-id')
+        if ponto:
+            # perto de mim (?lat=&lng=&raio=): candidatos pelo geohash, ordem pela distância
+            candidatos, empresas = empresas, geo.proximos(empresas, *ponto)
 
     if _wants_json(request):
-        html = render_to_string(
-            'core/partials/empresas_cards.html', 
-            {'page_obj': page_obj, 'request': request}
-        )
-        return JsonResponse({
-            'html': html,
-            'has_next': page_obj.has_next(),
-            'next_page_number': page_obj.next_page_number() if page_obj.has_next() else None
-        })
+        cursor = _cursor_da_requisicao(request, 12)
+        if por_chave:
+            pagina = indice_facetas.pagina(bits, cursor, 12)
+            pagina.object_list = _carregar_empresas(pagina.object_list)
+        else:
+            pagina = pagination.paginar_por_cursor(empresas, ordenacao, cursor, 12, ordenado_por_chave=False)
+            if ponto:
+                pagina.object_list = _hidratar_proximos(candidatos, pagina.object_list)
+        return _cards_json(request, pagina, {'favorito_ids': favoritos.ids(request.user)})
+
+    if por_chave:
+        empresas = indice_facetas.ListaDoBitset(bits, _carregar_empresas)
+    paginator = Paginator(empresas, 12)
+    page_obj = paginator.get_page(request.GET.get('page') or 1)
+    if ponto:
+        page_obj.object_list = _hidratar_proximos(candidatos, page_obj.object_list)
 
     tag_labels = []
     if tag_ids:
         selected_tags = Tag.objects.filter(id__in=tag_ids)
         tag_labels = [tag.nome for tag in selected_tags]
 
-    filtros_aplicados = { 'q': q, 'tag': tag_ids, 'cidade': cidade }
-    filtros_legiveis = { 'q': q or None, 'tag': ", ".join(tag_labels) or None, 'cidade': cidade or None }
-
-    favorito_ids = []
-    if request.user.is_authenticated:
-        perfil = PerfilUsuario.objects.filter(user=request.user).first()
-        if perfil:
-            favorito_ids = list(perfil.favoritos.values_list('id', flat=True))
+    filtros_aplicados = { 'q': q, 'tag': tag_ids, 'modo_tags': modo, 'cidade': cidade, 'perto': bool(ponto) }
+    separador = " + " if modo == indice_facetas.MODO_E else ", "
+    filtros_legiveis = {
+        'q': q or None, 'tag': separador.join(tag_labels) or None, 'cidade': cidade or None,
+        'perto': f"até {ponto[2]:g} km" if ponto else None,
+    }
 
     context = {
         'page_obj': page_obj,
+        'next_cursor': pagination.cursor_para_pagina(page_obj, ordenacao, ordenado_por_chave=por_chave),
         'filtros_aplicados': filtros_aplicados,
         'filtros_legiveis': filtros_legiveis,
-        'favorito_ids': favorito_ids, # Passando os favoritos para o template
+        'favorito_ids': favoritos.ids(request.user),
     }
     
     return render(request, 'core/listar_empresas.html', context)
 
+@require_GET
+def empresas_proximas(request):
+    """API "perto de mim": ?lat=&lng=&raio=(km, padrão 5)&limite=(padrão 20)."""
+    ponto = geo.ponto_da_requisicao(request.GET)
+    if not ponto:
+        return JsonResponse({"error": "Informe lat e lng válidos."}, status=400)
+    try:
+        limite = min(max(int(request.GET.get('limite') or 20), 1), 100)
+    except ValueError:
+        limite = 20
+
+    proximos = geo.proximos(Empresa.objects.all(), *ponto)[:limite]
+    campos = ('id', 'nome', 'slug', 'cidade', 'bairro', 'latitude', 'longitude')
+    por_id = {e['id']: e for e in Empresa.objects.filter(id__in=[p.id for p in proximos]).values(*campos)}
+
+    resultados = []
+    for p in proximos:
+        e = por_id.get(p.id)
+        if e is None:
+            continue
+        resultados.append({
+            **e,
+            'latitude': float(e['latitude']),
+            'longitude': float(e['longitude']),
+            'distancia_km': round(p.distancia_km, 3),
+            'url': reverse('empresa_detalhe', args=[e['slug']]),
+        })
+    lat, lng, raio = ponto
+    return JsonResponse({'lat': lat, 'lng': lng, 'raio_km': raio, 'resultados': resultados})
+
+def mapa_view(request):
+    return render(request, 'core/mapa.html')
+
+@require_GET
+def mapa_pontos(request):
+    """GeoJSON do mapa: ?zoom=&bbox=oeste,sul,leste,norte, já agrupado em clusters (core.mapa)."""
+    parametros = mapa.parametros(request.GET)
+    if not parametros:
+        return JsonResponse({"error": "Informe zoom e bbox=oeste,sul,leste,norte."}, status=400)
+    zoom, bbox = parametros
+    return JsonResponse({"type": "FeatureCollection", "features": mapa.features(zoom, bbox)})
+
+# ============================================================
+# API de leitura (/api/v1) — core.api
+# ============================================================
+
+def _erro_api(mensagem, status):
+    return JsonResponse({'error': mensagem}, status=status)
+
+@require_GET
+def api_empresas(request):
+    """
+    Listagem com os mesmos filtros de ``listar_empresas`` (q, tag, cidade,
+    lat/lng/raio) + ?fields=, ?limite= (padrão 20, máx. 100) e ?cursor=.
+    """
+    try:
+        campos = api.campos_pedidos(request.GET, api.CAMPOS_LISTA)
+    except api.CampoInvalido as e:
+        return _erro_api(str(e), 400)
+    limite = api.limite_pedido(request.GET)
+    cursor = request.GET.get('cursor')
+
+    q, tag_ids, cidade, modo, bits = _filtros_listagem(request)
+    ordenacao = ('-id',)
+    empresas = _restringir(Empresa.objects.all(), tag_ids, cidade, modo)
+    if q:
+        empresas = search.filtrar(empresas, q).order_by('busca_rank', '-id')
+
+    ponto = geo.ponto_da_requisicao(request.GET)
+    if ponto:
+        # página de Proximo(id, distância); as linhas vêm depois, só dos ids da página
+        pagina = pagination.paginar_por_cursor(
+            geo.proximos(empresas, *ponto), ordenacao, cursor, limite, ordenado_por_chave=False
+        )
+        distancias = {p.id: p.distancia_km for p in pagina}
+        por_id = {
+            linha['id']: linha
+            for linha in Empresa.objects.filter(id__in=distancias).values(*api.colunas(campos))
+        }
+        linhas = [por_id[p.id] for p in pagina if p.id in por_id]
+        resultados = api.serializar(linhas, campos)
+        for item, linha in zip(resultados, linhas):
+            item['distancia_km'] = round(distancias[linha['id']], 3)
+    elif q:
+        pagina = pagination.paginar_por_cursor(
+            empresas.values(*api.colunas(campos)), ordenacao, cursor, limite, ordenado_por_chave=False
+        )
+        resultados = api.serializar(pagina.object_list, campos)
+    else:
+        # ids da página direto do índice de facetas; o SQL lê só essas linhas
+        pagina = indice_facetas.pagina(indice_facetas.todas() if bits is None else bits, cursor, limite)
+        por_id = {
+            linha['id']: linha
+            for linha in Empresa.objects.filter(id__in=pagina.object_list).values(*api.colunas(campos))
+        }
+        resultados = api.serializar([por_id[i] for i in pagina if i in por_id], campos)
+
+    return JsonResponse({
+        'resultados': resultados,
+        'has_next': pagina.has_next(),
+        'next_cursor': pagina.next_cursor,
+    })
+
+@require_GET
+def api_empresa(request, slug):
+    """Uma empresa (?fields=; sem ele, todos os campos)."""
+    try:
+        campos = api.campos_pedidos(request.GET, api.CAMPOS_DETALHE)
+    except api.CampoInvalido as e:
+        return _erro_api(str(e), 400)
+    linhas = Empresa.objects.filter(slug=slug).values(*api.colunas(campos))[:1]
+    resultado = api.serializar(linhas, campos)
+    if not resultado:
+        return _erro_api('Empresa não encontrada.', 404)
+    return JsonResponse(resultado[0])
+
+@require_GET
+@condition(etag_func=lambda request: _etag('facetas', facets.versao()))
+def api_tags(request):
+    return JsonResponse({'resultados': facets.tags()})
+
 def buscar_empresas(request):
     """Rota legada: redireciona para a listagem com os mesmos GETs."""
     return listar_empresas(request)
@@ -804,16 +752,21 @@ def deletar_empresa(request, slug):
     # Redireciona para a lista de empresas do usuário após a exclusão
     return redirect('suas_empresas')
 
+def _contagens_facetas(bits):
+    """Total de ``bits`` (None = catálogo todo) e quantas dessas empresas cada tag e cidade tem."""
+    contagens = indice_facetas.contagens(bits)
+    return {
+        'total': indice_facetas.contar(indice_facetas.todas() if bits is None else bits),
+        'tags': contagens['tags'],
+        'cidades': {c: contagens['cidades'].get(indice_facetas.chave_cidade(c), 0) for c in facets.cidades()},
+    }
+
 @require_GET
+@condition(etag_func=lambda request: _etag('facetas', facets.versao(), indice_facetas.versao(), request.get_full_path()))
 def filtros_empresas(request):
-    """Retorna tags e cidades em JSON."""
-    tags = list(Tag.objects.order_by('nome').values('id', 'nome'))
-    
-    cidades = list(
-        Empresa.objects.exclude(cidade__isnull=True).exclude(cidade__exact='')
-        .order_by('cidade').values_list('cidade', flat=True).distinct()
-    )
-    return JsonResponse({'tags': tags, 'cidades': list(cidades)})
+    """Tags e cidades em JSON + contagens (com ?tag=&cidade=&modo_tags=: quantas restam em cada uma)."""
+    bits = _filtros_listagem(request)[-1]
+    return JsonResponse({'tags': facets.tags(), 'cidades': facets.cidades(), 'contagens': _contagens_facetas(bits)})
 
 @require_GET
 def download_template_empresas(request):
@@ -821,27 +774,7 @@ def download_template_empresas(request):
     ws = wb.active
     ws.title = "Empresas"
 
-    headers = [
-        "CNPJ",
-        "CATEGORIA",
-        "NOME",
-        "BAIRRO",
-        "ENDEREÇO COMPLETO",
-        "TELEFONE",
-        "CONTATO DIRETO",
-        "DIGITAL (site/redes)",
-        "CADASTUR",
-        "MAPS (link)",
-        "APP",
-        "DESCRIÇÃO",
-        "NÚMERO",
-        "CEP",
-        "CIDADE",
-        "HORÁRIO SEMANA (seg-sex)",
-        "HORÁRIO SÁBADO",
-        "HORÁRIO DOMINGO",
-        "OBSERVAÇÕES HORÁRIO",
-    ]
+    headers = list(CABECALHO_MODELO)
     ws.append(headers)
 
     exemplo = [
@@ -880,88 +813,32 @@ def download_template_empresas(request):
 
 @login_required
 @require_POST
-@transaction.atomic # O decorator principal que gerencia a transação inteira
 def importar_empresas_arquivo(request):
-    criados, atualizados, sem_alteracao, erros = 0, 0, 0, 0
-    msgs = []
-    
-    try:
-        up = request.FILES.get("arquivo")
-        if not up: return JsonResponse({"ok": False, "error": "Envie um arquivo."}, status=400)
-        
-        headers_raw, rows = _read_rows_from_upload(up, up.name)
-        if not rows: return JsonResponse({"ok": False, "error": "Arquivo vazio."}, status=400)
-
-        is_google_format = len(headers_raw) > 30
-        header_map = _build_header_map(headers_raw)
-        
-        for line_no, r in enumerate(rows, start=2):
-            # Envolve cada linha em seu próprio bloco try/except para isolar erros
-            try:
-                with transaction.atomic(): # Cria uma sub-transação para cada linha
-                    data = {}
-                    for idx, canon in header_map.items():
-                        if idx < len(r): data[canon] = (r[idx] or "").strip()
-
-                    if is_google_format:
-                        dados_empresa = _parse_row_google(data)
-                    else:
-                        dados_empresa = _parse_row_padrao(data)
-                    
-                    nome = dados_empresa.get('nome')
-                    if not nome: raise ValueError("O campo 'nome' é obrigatório.")
-
-                    telefone = dados_empresa.get('telefone', '')
-                    cnpj = dados_empresa.get('cnpj', '')
-                    tag_names = dados_empresa.pop('tags', [])
-
-                    empresa_existente = None
-                    if telefone: empresa_existente = Empresa.objects.filter(telefone=telefone).first()
-                    # Garante que só procuramos por CNPJ se ele não for vazio
-                    if not empresa_existente and cnpj: empresa_existente = Empresa.objects.filter(cnpj=cnpj).first()
-                    if not empresa_existente and nome: empresa_existente = Empresa.objects.filter(nome__iexact=nome).first()
-                    
-                    model_fields = [f.name for f in Empresa._meta.get_fields()]
-                    dados_para_salvar = {k: v for k, v in dados_empresa.items() if k in model_fields}
-
-                    if empresa_existente:
-                        emp = empresa_existente
-                        alterado = False
-                        for campo, valor in dados_para_salvar.items():
-                            if getattr(emp, campo) != valor:
-                                setattr(emp, campo, valor)
-                                alterado = True
-                        
-                        if alterado:
-                            emp.save()
-                            atualizados += 1
-                    else:
-                        dados_para_salvar['user'] = request.user
-                        dados_para_salvar.setdefault('descricao', DEFAULT_DESC)
-                        emp = Empresa.objects.create(**dados_para_salvar)
-                        criados += 1
-
-                    if tag_names:
-                        tags_obj = [Tag.objects.get_or_create(nome=name.strip())[0] for name in tag_names if name.strip()]
-                        if tags_obj: emp.tags.set(tags_obj)
-            
-            except IntegrityError as e:
-                # Captura especificamente o erro de CNPJ duplicado
-                erros += 1
-                msg = f"Linha {line_no}: Erro de integridade. Provavelmente um CNPJ duplicado não identificado. Detalhe: {e}"
-                msgs.append(msg)
-            except Exception as e:
-                # Captura todos os outros erros da linha
-                erros += 1
-                msg = f"Linha {line_no}: Erro ao processar: {e}"
-                msgs.append(msg)
+    """Grava a planilha e enfileira a importação; o progresso sai de status_importacao."""
+    up = request.FILES.get("arquivo")
+    if not up: return JsonResponse({"ok": False, "error": "Envie um arquivo."}, status=400)
 
-        return JsonResponse({ "ok": True, "criados": criados, "atualizados": atualizados, "sem_alteracao": sem_alteracao, "erros": erros, "mensagens": msgs })
-        
+    try:
+        job = fila_importacao.criar_job(request.user, up)
     except Exception as e:
-        logger.error(f"Erro catastrófico na importação: {e}", exc_info=True)
+        logger.error(f"Erro ao enfileirar importação: {e}", exc_info=True)
         return JsonResponse({"ok": False, "error": f"Erro inesperado: {e}"}, status=500)
-    
+
+    job.refresh_from_db()  # no modo síncrono já terminou
+    status_url = reverse('status_importacao', args=[job.pk])
+    return JsonResponse({**job.progresso_dict(), "status_url": status_url}, status=202)
+
+
+@login_required
+@require_GET
+def status_importacao(request, job_id):
+    filtro = {} if request.user.is_staff else {"user": request.user}
+    job = get_object_or_404(ImportacaoJob, pk=job_id, **filtro)
+    if fila_importacao.parado(job):
+        # processo web reiniciou com o job no meio (modo thread): retoma só este job
+        fila_importacao.retomar(job)
+    return JsonResponse({**job.progresso_dict(), "status_url": request.path})
+
 
 @login_required
 def perfil(request):
@@ -1085,7 +962,7 @@ def perfil_alterar_cpf(request):
             }, status=400)
 
         novo_cpf = form.cleaned_data["cpf_cnpj"]
-        if _only_digits(perfil.cpf_cnpj) == novo_cpf:
+        if digitos(perfil.cpf_cnpj) == novo_cpf:
             messages.info(request, "O CPF informado é igual ao atual.")
             return redirect('perfil')
 
@@ -1101,15 +978,21 @@ def perfil_alterar_cpf(request):
 
 
 def page_not_found(request, exception):
-    return render(request, 'core/404.html', status=500)
+    return paginas_prontas.nao_encontrada(request)
 
 def server_error(request):
-    return render(request, 'core/500.html', status=500)
+    return paginas_prontas.erro_interno(request)
 
 def senha_redefinida_redirect(request):
     messages.success(request, "Senha redefinida com sucesso! Faça login para continuar.")
     return redirect('login')
 
+@staff_member_required
+@require_GET
+def cache_paginas_status(request):
+    """Acertos/faltas do cache de páginas anônimas, por página (monitoramento)."""
+    return JsonResponse({'ativo': settings.CACHE_PAGINAS, 'paginas': cache_paginas.estatisticas()})
+
 @login_required
 @staff_member_required
 def gerenciar_tags(request):
@@ -1145,24 +1028,41 @@ def gerenciar_tags(request):
         
         elif action == 'update_children' and tag_id:
             parent_tag = get_object_or_404(Tag, id=tag_id)
-            child_ids = request.POST.getlist('children')
-
-            child_tags = Tag.objects.filter(id__in=child_ids)
-            parent_tag.children.set(child_tags)
-            parent_tag.children.exclude(id__in=child_ids).update(parent=None)
-
+            child_ids = {int(i) for i in request.POST.getlist('children') if i.isdigit()}
+
+            # um save() por tag movida: mantém o fechamento (TagAncestral) e barra ciclos
+            ciclos = []
+            for child in Tag.objects.filter(Q(id__in=child_ids) | Q(parent=parent_tag)):
+                novo_pai = parent_tag.pk if child.pk in child_ids else None
+                if child.parent_id == novo_pai:
+                    continue
+                child.parent_id = novo_pai
+                try:
+                    child.save(update_fields=['parent'])
+                except arvore_tags.CicloNaHierarquia:
+                    ciclos.append(child.nome)
+
+            if ciclos:
+                messages.warning(request, "Ignoradas (são a própria tag ou categorias acima dela): " + ", ".join(ciclos))
             messages.success(request, f"Subcategorias de '{parent_tag.nome}' atualizadas com sucesso.")
 
         return redirect('gerenciar_tags')
 
-    all_tags = Tag.objects.all().order_by('nome')
-    parent_tags = all_tags.filter(parent__isnull=True).prefetch_related('children')
+    # a árvore inteira numa consulta; cada raiz leva a subárvore em pré-ordem
+    nos = arvore_tags.arvore(Tag.objects.values('id', 'nome', 'parent_id'))
+    parent_tags = []
+    for no in nos:
+        if no['profundidade'] == 0:
+            no['subarvore'] = []
+            parent_tags.append(no)
+        else:
+            parent_tags[-1]['subarvore'].append(no)
     
     form = TagForm()
     
     context = {
         'parent_tags': parent_tags,
-        'all_tags': all_tags,
+        'all_tags': sorted(nos, key=lambda no: no['nome'].lower()),
         'form': form,
     }
     return render(request, 'core/gerenciar_tags.html', context)
@@ -1200,49 +1100,60 @@ def deletar_avaliacao(request, avaliacao_id):
     messages.success(request, "Sua avaliação foi removida com sucesso.")
     return JsonResponse({'status': 'success'})
 
+def _id_da_empresa(slug):
+    empresa_id = Empresa.objects.filter(slug=slug).values_list('id', flat=True).first()
+    if empresa_id is None:
+        raise Http404("Empresa não encontrada.")
+    return empresa_id
+
 @login_required
 @require_POST
 def toggle_favorito(request, slug):
-    empresa = get_object_or_404(Empresa, slug=slug)
-    perfil, created = PerfilUsuario.objects.get_or_create(user=request.user)
-    
-    is_favorito = False
-    if empresa in perfil.favoritos.all():
-        perfil.favoritos.remove(empresa)
-        is_favorito = False
-    else:
-        perfil.favoritos.add(empresa)
-        is_favorito = True
-
+    is_favorito = favoritos.alternar(request.user, _id_da_empresa(slug))
     return JsonResponse({'status': 'ok', 'is_favorito': is_favorito})
 
+# adicionar/remover explícitos: repetir a requisição não inverte o estado
+@login_required
+@require_POST
+def adicionar_favorito(request, slug):
+    favoritos.adicionar(request.user, _id_da_empresa(slug))
+    return JsonResponse({'status': 'ok', 'is_favorito': True})
+
+@login_required
+@require_POST
+def remover_favorito(request, slug):
+    favoritos.remover(request.user, _id_da_empresa(slug))
+    return JsonResponse({'status': 'ok', 'is_favorito': False})
+
 
 @login_required
 def listar_favoritos(request):
     perfil = request.user.perfil
     
+    ordenacao = ('-data_cadastro', '-id')
     empresas_favoritas = get_base_empresas_queryset().filter(
         id__in=perfil.favoritos.values_list('id', flat=True)
-    ).order_by('-data_cadastro')
+    ).order_by(*ordenacao)
+
+    if _wants_json(request):
+        pagina = pagination.paginar_por_cursor(empresas_favoritas, ordenacao, _cursor_da_requisicao(request, 12), 12)
+        return _cards_json(request, pagina)
 
     paginator = Paginator(empresas_favoritas, 12)
     page_obj = paginator.get_page(request.GET.get('page') or 1)
 
     return render(request, 'core/listar_favoritos.html', {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'next_cursor': pagination.cursor_para_pagina(page_obj, ordenacao),
     })
 
 @login_required
 def gerador_qrcode_view(request):
-    all_tags = list(Tag.objects.order_by('nome').values('id', 'nome'))
-    all_cidades = list(
-        Empresa.objects.exclude(cidade__isnull=True).exclude(cidade__exact='')
-        .order_by('cidade').values_list('cidade', flat=True).distinct()
-    )
-    
+    # quantas empresas cada opção traz, para não gerar QR de listagem vazia
+    contagens = _contagens_facetas(None)
     context = {
-        'all_tags': all_tags,
-        'all_cidades': all_cidades,
+        'all_tags': [dict(tag, total=contagens['tags'].get(tag['id'], 0)) for tag in facets.tags()],
+        'all_cidades': [{'nome': c, 'total': n} for c, n in contagens['cidades'].items()],
     }
     return render(request, 'core/gerador_qrcode.html', context)
 
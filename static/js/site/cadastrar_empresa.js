@@ -189,16 +189,22 @@ document.addEventListener('DOMContentLoaded', function () {
             return;
         }
 
-        if (loading) loading.style.display = 'none';
-
         let data = {};
         try {
             data = await response.json();
+            // a importação roda em segundo plano: acompanha o job até terminar
+            if (response.ok && data.status_url && !data.finalizado) {
+                data = await acompanharImportacao(data.status_url);
+            }
         } catch (err) {
+            if (loading) loading.style.display = 'none';
             showImportReport(['Ocorreu um erro inesperado ao processar a resposta do servidor.'], 'Erro Crítico', 'alert-danger');
             return;
         }
 
+        if (loading) loading.style.display = 'none';
+        setImportProgress('');
+
         if (response.ok && data.ok) {
             // SUCESSO: Monta a mensagem do relatório
             let reportTitle = 'Importação Concluída!';
@@ -233,6 +239,30 @@ document.addEventListener('DOMContentLoaded', function () {
     // FUNÇÕES AUXILIARES (HELPERS)
     // ======================================
 
+    // --- Progresso da importação em segundo plano ---
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+    function setImportProgress(text) {
+        const el = loading?.querySelector('[data-import-progress]');
+        if (el) el.textContent = text;
+    }
+
+    async function acompanharImportacao(statusUrl) {
+        while (true) {
+            await sleep(1500);
+            const resp = await fetch(statusUrl, { headers: { 'Accept': 'application/json' } });
+            if (!resp.ok) throw new Error('Falha ao consultar o andamento da importação.');
+            const job = await resp.json();
+            if (job.finalizado) return job;
+            if (job.status === 'pendente') {
+                setImportProgress('Na fila, aguardando processamento…');
+            } else {
+                const total = job.total_linhas ? ` de ${job.total_linhas}` : '';
+                setImportProgress(`${job.linhas_processadas}${total} linhas processadas…`);
+            }
+        }
+    }
+
     let escListener = null;
     function showOverlay(innerHtml) { /* ... (sem alterações) ... */ }
     function hideOverlay() { /* ... (sem alterações) ... */ }
@@ -54,6 +54,46 @@ document.addEventListener('DOMContentLoaded', function () {
         });
     }
 
+    // --- ACOMPANHA AS IMAGENS NOVAS QUE AINDA ESTÃO SENDO PROCESSADAS ---
+    function acompanharUploads() {
+        if (!galleryContainer) return;
+        const pendentes = galleryContainer.querySelectorAll('[data-upload-id]');
+        if (!pendentes.length) return;
+
+        const ids = Array.from(pendentes, el => el.dataset.uploadId).join(',');
+        const url = `${galleryContainer.dataset.statusUrl}?ids=${ids}`;
+
+        fetch(url, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(data => {
+                (data.uploads || []).forEach(upload => {
+                    if (!upload.finalizado) return;
+                    const card = galleryContainer.querySelector(`[data-upload-id="${upload.id}"]`);
+                    if (!card) return;
+                    if (upload.imagem) {
+                        // recarregando a página a imagem já vem com os controles de principal/deletar
+                        const img = document.createElement('img');
+                        img.src = upload.imagem.url;
+                        img.className = 'card-img-top';
+                        img.style.cssText = 'aspect-ratio: 4/3; object-fit: cover;';
+                        img.alt = 'Imagem da galeria';
+                        card.querySelector('.card-img-top').replaceWith(img);
+                        card.removeAttribute('data-upload-id');
+                    } else {
+                        const status = card.querySelector('[data-upload-status]');
+                        if (status) status.textContent = `${upload.nome}: ${upload.erro || 'falhou'}`;
+                        const spinner = card.querySelector('.spinner-border');
+                        if (spinner) spinner.remove();
+                        card.removeAttribute('data-upload-id');
+                    }
+                });
+                if (!data.finalizado) setTimeout(acompanharUploads, 1500);
+            })
+            .catch(() => setTimeout(acompanharUploads, 5000));
+    }
+
+    acompanharUploads();
+
     // --- LÓGICA PARA DELETAR A EMPRESA INTEIRA COM CONFIRMAÇÃO ---
     const deleteEmpresaForm = document.getElementById('delete-empresa-form');
     if (deleteEmpresaForm) {
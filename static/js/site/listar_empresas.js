@@ -24,11 +24,33 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    // --- "Perto de mim": pede a localização e recarrega a listagem ordenada por distância ---
+    const pertoBtn = document.getElementById('btn-perto-de-mim');
+    if (pertoBtn && 'geolocation' in navigator) {
+        pertoBtn.addEventListener('click', function () {
+            pertoBtn.disabled = true;
+            navigator.geolocation.getCurrentPosition(function (pos) {
+                const params = new URLSearchParams(window.location.search);
+                params.delete('page');
+                params.delete('cursor');
+                params.set('lat', pos.coords.latitude.toFixed(6));
+                params.set('lng', pos.coords.longitude.toFixed(6));
+                params.set('raio', pertoBtn.dataset.raio || '5');
+                window.location.search = params.toString();
+            }, function () {
+                pertoBtn.disabled = false;
+                alert('Não foi possível obter sua localização.');
+            }, { enableHighAccuracy: false, timeout: 10000, maximumAge: 300000 });
+        });
+    } else if (pertoBtn) {
+        pertoBtn.classList.add('d-none');
+    }
+
     const loadMoreBtn = document.getElementById('load-more-btn');
     if (!loadMoreBtn) return;
 
     const url = loadMoreBtn.dataset.url;
-    let nextPage = loadMoreBtn.dataset.nextPage;
+    let nextCursor = loadMoreBtn.dataset.nextCursor;
 
     const spinner = loadMoreBtn.querySelector('.spinner-border');
     const statusEl = document.getElementById('load-status');
@@ -48,17 +70,17 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     loadMoreBtn.addEventListener('click', async function () {
-        if (!nextPage || !url) return;
+        if (!nextCursor || !url) return;
         setLoading(true);
 
         try {
             const fetchUrl = new URL(url, window.location.origin);
-            fetchUrl.searchParams.set('page', nextPage);
+            fetchUrl.searchParams.set('cursor', nextCursor);
             fetchUrl.searchParams.set('ajax', '1');
 
             const currentParams = new URLSearchParams(window.location.search);
             currentParams.forEach((value, key) => {
-                if (key !== 'page' && key !== 'ajax') {
+                if (key !== 'page' && key !== 'cursor' && key !== 'ajax') {
                     fetchUrl.searchParams.set(key, value);
                 }
             });
@@ -76,10 +98,10 @@ document.addEventListener('DOMContentLoaded', function () {
             }
 
             if (data.has_next) {
-                nextPage = data.next_page_number;
+                nextCursor = data.next_cursor;
                 loadMoreBtn.querySelector('span:last-child').textContent = 'Carregar mais';
             } else {
-                nextPage = null;
+                nextCursor = null;
                 loadMoreBtn.classList.add('disabled');
                 loadMoreBtn.setAttribute('aria-disabled', 'true');
                 loadMoreBtn.querySelector('span:last-child').textContent = 'Não há mais resultados';
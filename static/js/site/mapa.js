@@ -0,0 +1,73 @@
+// Em static/js/site/mapa.js
+// Mapa da cidade: o servidor devolve os pontos já agrupados por zoom/bbox
+
+document.addEventListener('DOMContentLoaded', function () {
+    const el = document.getElementById('mapa-cidade');
+    if (!el || !window.L) return;
+
+    const map = L.map(el).setView(
+        [parseFloat(el.dataset.lat), parseFloat(el.dataset.lng)],
+        parseInt(el.dataset.zoom, 10) || 13
+    );
+    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+        attribution: '© OpenStreetMap',
+        maxZoom: 19
+    }).addTo(map);
+
+    const camada = L.layerGroup().addTo(map);
+    let controller = null;
+    let timer = null;
+
+    function escapeHtml(s) {
+        const div = document.createElement('div');
+        div.textContent = s;
+        return div.innerHTML;
+    }
+
+    function iconeCluster(quantidade) {
+        const tamanho = quantidade < 10 ? 34 : quantidade < 100 ? 42 : 52;
+        return L.divIcon({
+            html: `<div class="mapa-cluster" style="width:${tamanho}px;height:${tamanho}px">${quantidade}</div>`,
+            className: '',
+            iconSize: [tamanho, tamanho]
+        });
+    }
+
+    function desenhar(geojson) {
+        camada.clearLayers();
+        geojson.features.forEach(function (f) {
+            const [lng, lat] = f.geometry.coordinates;
+            const p = f.properties;
+            if (p.cluster) {
+                L.marker([lat, lng], { icon: iconeCluster(p.quantidade), title: `${p.quantidade} pontos` })
+                    .on('click', () => map.setView([lat, lng], Math.min(map.getZoom() + 2, map.getMaxZoom())))
+                    .addTo(camada);
+            } else {
+                L.marker([lat, lng], { title: p.nome })
+                    .bindPopup(`<a href="${p.url}">${escapeHtml(p.nome)}</a>`)
+                    .addTo(camada);
+            }
+        });
+    }
+
+    async function carregar() {
+        if (controller) controller.abort();
+        controller = new AbortController();
+        const url = new URL(el.dataset.url, window.location.origin);
+        url.searchParams.set('zoom', map.getZoom());
+        url.searchParams.set('bbox', map.getBounds().toBBoxString());
+        try {
+            const resp = await fetch(url, { signal: controller.signal, headers: { 'Accept': 'application/json' } });
+            if (!resp.ok) throw new Error('Falha ao carregar os pontos do mapa.');
+            desenhar(await resp.json());
+        } catch (err) {
+            if (err.name !== 'AbortError') console.error(err);
+        }
+    }
+
+    map.on('moveend', function () {
+        clearTimeout(timer);
+        timer = setTimeout(carregar, 150);
+    });
+    carregar();
+});
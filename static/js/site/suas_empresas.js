@@ -34,18 +34,18 @@ document.addEventListener('DOMContentLoaded', function () {
     if (!loadMoreBtn) return; // Se o botão não existir, para aqui
 
     const url = loadMoreBtn.dataset.url;
-    let nextPage = loadMoreBtn.dataset.nextPage;
+    let nextCursor = loadMoreBtn.dataset.nextCursor;
     const container = document.getElementById('empresas-container');
 
     loadMoreBtn.addEventListener('click', async function () {
-        if (!nextPage || !url) return;
+        if (!nextCursor || !url) return;
 
         loadMoreBtn.disabled = true;
         loadMoreBtn.textContent = 'Carregando...';
 
         try {
             const fetchUrl = new URL(url, window.location.origin);
-            fetchUrl.searchParams.set('page', nextPage);
+            fetchUrl.searchParams.set('cursor', nextCursor);
             fetchUrl.searchParams.set('ajax', '1');
 
             const response = await fetch(fetchUrl);
@@ -59,12 +59,12 @@ document.addEventListener('DOMContentLoaded', function () {
             }
 
             if (data.has_next) {
-                nextPage = data.next_page_number;
-                loadMoreBtn.dataset.nextPage = nextPage;
+                nextCursor = data.next_cursor;
+                loadMoreBtn.dataset.nextCursor = nextCursor;
                 loadMoreBtn.disabled = false;
                 loadMoreBtn.textContent = 'Carregar mais';
             } else {
-                nextPage = null;
+                nextCursor = null;
                 loadMoreBtn.style.display = 'none'; // Esconde o botão se não houver mais páginas
             }
         } catch (error) {